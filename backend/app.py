@@ -1,16 +1,33 @@
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+import math
 import uvicorn
 import logging
+from lib.structured_log import configure_logging, stop_logging
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
+# Configurar logging: líneas JSON escritas desde un hilo aparte (LOG_LEVEL, LOG_LEVELS, LOG_SAMPLING)
+configure_logging()
 logger = logging.getLogger(__name__)
 from routes.auth_routes import router as auth_router
 from routes.loan_routes import router as loan_router
 from routes.notification_routes import router as notification_router
-from lib.mysql_db import init_database
+from routes.batch_routes import router as batch_router
+from routes.admin_routes import router as admin_router
+from routes.health_routes import router as health_router
+from routes.webhook_routes import router as webhook_router
+from lib.mysql_db import init_database, db_pool, replica_router, DB_REPLICAS
+from lib.circuit_breaker import DatabaseUnavailableError
+from lib.deadlines import DeadlineExceededError
+from lib.bulkheads import BULKHEADS, BACKGROUND, BulkheadFullError, shutdown_bulkheads
+from lib.db_router import ReadYourWritesMiddleware
+from lib.static_assets import asset_store, CachedStaticFiles, ASSET_URL_PREFIX
+from lib.compression import CompressionMiddleware, MIN_COMPRESS_SIZE, CPU_BUDGET_SECONDS
+from lib.metrics import MetricsMiddleware, metrics_payload, track_job, CONTENT_TYPE_LATEST
+from lib.tracing import TracingMiddleware, TRACE_SAMPLE_RATE
+from lib.capture import TrafficCaptureMiddleware, CAPTURE_FILE, CAPTURE_SAMPLE_RATE
+from lib.health import health_monitor
+from lib.jsonl_writer import close_writers
+from lib.sessions import revoked_tokens
 
 app = FastAPI(
     title="Sistema de Préstamos",
@@ -22,12 +39,74 @@ app = FastAPI(
 @app.on_event("startup")
 async def on_startup() -> None:
     logger.info("Inicializando base de datos MySQL (creación de tablas si no existen)...")
-    init_ok = init_database()
+    with track_job("init_database"):
+        init_ok = await BULKHEADS[BACKGROUND].run(init_database)
     if init_ok:
         logger.info("Base de datos lista.")
     else:
         logger.error("Fallo al inicializar la base de datos. Revisa credenciales y permisos.")
 
+    # Las sondas de salud leen el resultado de esta comprobación periódica
+    health_monitor.start()
+    # Los logouts atendidos por otros workers se leen de la tabla revoked_tokens
+    revoked_tokens.start()
+
+    # Cargar el frontend en memoria con sus variantes gzip/brotli
+    with track_job("load_static_assets"):
+        asset_store.load()
+
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    # Cerrar las conexiones inactivas de los pools de este worker
+    await health_monitor.stop()
+    await revoked_tokens.stop()
+    db_pool.close_idle()
+    replica_router.close_idle()
+    shutdown_bulkheads()
+    # Trazas y captura de tráfico pendientes antes que los logs
+    close_writers()
+    stop_logging()
+
+# Base de datos caída o circuito abierto: 503 inmediato en lugar de datos vacíos
+@app.exception_handler(DatabaseUnavailableError)
+async def database_unavailable_handler(request: Request, exc: DatabaseUnavailableError) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Base de datos no disponible, inténtalo de nuevo en unos segundos"},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
+# Clase de trabajo saturada: se descarta la petición sin quitar capacidad a las demás clases
+@app.exception_handler(BulkheadFullError)
+async def bulkhead_full_handler(request: Request, exc: BulkheadFullError) -> JSONResponse:
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+# Presupuesto de la petición agotado: las consultas en curso ya se cancelaron
+@app.exception_handler(DeadlineExceededError)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceededError) -> JSONResponse:
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+# Compresión de respuestas de la API (umbral de tamaño y presupuesto de CPU)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=MIN_COMPRESS_SIZE,
+    cpu_budget=CPU_BUDGET_SECONDS,
+)
+
+# Ventana read-your-writes entre workers (cookie) cuando hay réplicas de lectura
+if DB_REPLICAS:
+    app.add_middleware(ReadYourWritesMiddleware)
+
+# Trazas por petición: cabecera Server-Timing y muestreo a fichero local
+app.add_middleware(TracingMiddleware, sample_rate=TRACE_SAMPLE_RATE)
+
+# Captura de tráfico anonimizado para reproducirlo con `python -m benchmarks replay` (opcional)
+if CAPTURE_FILE:
+    app.add_middleware(TrafficCaptureMiddleware, path=CAPTURE_FILE, sample_rate=CAPTURE_SAMPLE_RATE)
+
+# Métricas de latencia por ruta (el último middleware añadido es el más externo)
+app.add_middleware(MetricsMiddleware)
+
 # Incluir las rutas de autenticación
 app.include_router(auth_router)
 
@@ -37,8 +116,33 @@ app.include_router(loan_router)
 # Incluir las rutas de notificaciones
 app.include_router(notification_router)
 
+# Incluir el endpoint de peticiones en lote
+app.include_router(batch_router)
+
+# Incluir la gestión de webhooks (suscripciones y envíos fallidos)
+app.include_router(webhook_router)
+
+# Incluir las rutas de administración (perfilado bajo demanda, requiere ADMIN_TOKEN)
+app.include_router(admin_router)
+
+# Incluir las sondas de liveness/readiness para el balanceador y el orquestador
+app.include_router(health_router)
+
 # Montar archivos estáticos del frontend
-app.mount("/static", StaticFiles(directory="frontend"), name="static")
+app.mount("/static", CachedStaticFiles(directory="frontend"), name="static")
+
+@app.get(ASSET_URL_PREFIX + "/{digest}/{path:path}")
+async def serve_hashed_asset(digest: str, path: str, request: Request):
+    """Servir recursos del frontend con hash de contenido (caché inmutable)"""
+    return asset_store.hashed_response(digest, path, request)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Métricas en formato Prometheus"""
+    payload = metrics_payload()
+    if payload is None:
+        return Response("prometheus_client no está instalado\n", status_code=503, media_type="text/plain")
+    return Response(payload, media_type=CONTENT_TYPE_LATEST)
 
 @app.get("/")
 async def root():
@@ -58,13 +162,20 @@ async def root():
                 "borrowed_loans": "/loans/borrowed",
                 "loan_stats": "/loans/stats",
                 "overdue_loans": "/loans/overdue",
-                "dashboard": "/loans/dashboard"
+                "dashboard": "/loans/dashboard",
+                "changes": "/loans/changes?since={token}"
             },
             "notifications": {
                 "get_notifications": "/notifications/",
                 "unread_count": "/notifications/unread-count",
                 "mark_read": "/notifications/{id}/read",
-                "mark_all_read": "/notifications/mark-all-read"
+                "mark_all_read": "/notifications/mark-all-read",
+                "changes": "/notifications/changes?since={token}"
+            },
+            "batch": "/batch",
+            "health": {
+                "liveness": "/health/live",
+                "readiness": "/health/ready"
             },
             "frontend": {
                 "login": "/login",
@@ -77,36 +188,37 @@ async def root():
     }
 
 @app.get("/login")
-async def serve_login():
+async def serve_login(request: Request):
     """Servir la página de login"""
     logger.info("Serving login page")
-    return FileResponse("frontend/login/login.html")
+    return asset_store.page_response("login", request)
 
 @app.get("/dashboard")
-async def serve_dashboard():
+async def serve_dashboard(request: Request):
     """Servir la página del dashboard"""
-    return FileResponse("frontend/dashboard/dashboard.html")
+    return asset_store.page_response("dashboard", request)
 
 @app.get("/new-loan")
-async def serve_new_loan():
+async def serve_new_loan(request: Request):
     """Servir la página de nuevo préstamo"""
-    return FileResponse("frontend/new-loan/new-loan.html")
+    return asset_store.page_response("new-loan", request)
 
 @app.get("/profile")
-async def serve_profile():
+async def serve_profile(request: Request):
     """Servir la página de perfil"""
-    return FileResponse("frontend/profile/profile.html")
+    return asset_store.page_response("profile", request)
 
 @app.get("/my-loans")
-async def serve_my_loans():
+async def serve_my_loans(request: Request):
     """Servir la página de mis préstamos"""
-    return FileResponse("frontend/loans/my-loans.html")
+    return asset_store.page_response("my-loans", request)
 
 @app.get("/reports")
-async def serve_reports():
+async def serve_reports(request: Request):
     """Servir la página de reportes"""
-    return FileResponse("frontend/reports/reports.html")
+    return asset_store.page_response("reports", request)
 
+# Desarrollo: un solo proceso. Producción: gunicorn -c gunicorn.conf.py app:app
 if __name__ == "__main__":
     logger.info("Starting Sistema de Préstamos server on port 8001")
     uvicorn.run(app, host="0.0.0.0", port=8001, log_level="info")
@@ -0,0 +1 @@
+# Paquete benchmarks: datos sintéticos, generador de carga e informes de latencia
@@ -0,0 +1,200 @@
+"""Suite de carga reproducible.
+
+Uso (desde backend/):
+    python -m benchmarks seed --sqlite bench.db --scale small --seed 42 --reset
+    python -m benchmarks run --sqlite bench.db --duration 30 --concurrency 16 \\
+        --output bench.json --baseline benchmarks/baseline.json
+
+Reproducir tráfico capturado con CAPTURE_FILE (x4 más rápido que el original):
+    python -m benchmarks replay --sqlite bench.db --speed 4 capture.*.jsonl.gz
+
+Throughput de /auth/login (hash de contraseñas) con 32 clientes:
+    python -m benchmarks login --sqlite bench.db --duration 20 --concurrency 32
+
+Comprobar que las consultas frecuentes siguen usando sus índices (datos ya sembrados):
+    python -m benchmarks plans --sqlite bench.db
+
+Sin --sqlite se usa la base de datos MySQL configurada en lib/mysql_db.py.
+Con --url se ataca un servidor ya arrancado en lugar de la app en proceso.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmarks del sistema de préstamos")
+    parser.add_argument("--sqlite", metavar="PATH", help="Usar un fichero SQLite como sustituto de MySQL")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed = commands.add_parser("seed", help="Genera datos sintéticos")
+    seed.add_argument("--scale", default="small", help="tiny, small, medium o large")
+    seed.add_argument("--seed", type=int, default=42)
+    seed.add_argument("--reset", action="store_true", help="Borra antes los usuarios sintéticos existentes")
+
+    run = commands.add_parser("run", help="Ejecuta la carga y genera el informe")
+    run.add_argument("--duration", type=float, default=30.0, help="Segundos de carga")
+    run.add_argument("--concurrency", type=int, default=16, help="Clientes concurrentes")
+    run.add_argument("--seed", type=int, default=42)
+    run.add_argument("--url", help="URL de un servidor ya arrancado (por defecto la app en proceso)")
+    run.add_argument("--output", default="bench.json", help="Fichero JSON del informe")
+    run.add_argument("--baseline", help="Informe de referencia con el que comparar")
+    run.add_argument("--tolerance", type=float, default=None, help="Regresión tolerada (0.10 = 10%%)")
+
+    login = commands.add_parser("login", help="Mide el throughput de /auth/login con clientes concurrentes")
+    login.add_argument("--duration", type=float, default=20.0, help="Segundos de carga")
+    login.add_argument("--concurrency", type=int, default=32, help="Clientes concurrentes")
+    login.add_argument("--seed", type=int, default=42)
+    login.add_argument("--url", help="URL de un servidor ya arrancado (por defecto la app en proceso)")
+    login.add_argument("--output", default="login.json", help="Fichero JSON del informe")
+    login.add_argument("--baseline", help="Informe de referencia con el que comparar")
+    login.add_argument("--tolerance", type=float, default=None, help="Regresión tolerada (0.10 = 10%%)")
+
+    commands.add_parser("plans", help="Comprueba los planes de EXPLAIN del catálogo de consultas frecuentes")
+
+    replay = commands.add_parser("replay", help="Reproduce tráfico capturado y genera el informe")
+    replay.add_argument("captures", nargs="+", help="Ficheros de captura (uno por worker)")
+    replay.add_argument("--speed", type=float, default=1.0, help="Factor de aceleración (0 = sin pausas)")
+    replay.add_argument("--concurrency", type=int, default=64, help="Máximo de peticiones en vuelo")
+    replay.add_argument("--limit", type=int, default=None, help="Reproducir solo las primeras N peticiones")
+    replay.add_argument("--seed", type=int, default=42)
+    replay.add_argument("--url", help="URL de un servidor ya arrancado (por defecto la app en proceso)")
+    replay.add_argument("--output", default="replay.json", help="Fichero JSON del informe")
+    replay.add_argument("--baseline", help="Informe de referencia con el que comparar")
+    replay.add_argument("--tolerance", type=float, default=None, help="Regresión tolerada (0.10 = 10%%)")
+    return parser.parse_args(argv)
+
+
+def check_baseline(report, args) -> int:
+    """Compara el informe con la línea base indicada; 1 si hay regresiones"""
+    from benchmarks.report import DEFAULT_TOLERANCE, compare_reports, read_report
+
+    if not args.baseline:
+        return 0
+    tolerance = DEFAULT_TOLERANCE if args.tolerance is None else args.tolerance
+    regressions = compare_reports(report, read_report(args.baseline), tolerance)
+    if regressions:
+        print("Regresiones respecto a la línea base:", file=sys.stderr)
+        for regression in regressions:
+            print(f"  - {regression}", file=sys.stderr)
+        return 1
+    print("Sin regresiones respecto a la línea base")
+    return 0
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    # El motor de base de datos se elige al importar lib.mysql_db
+    if args.sqlite:
+        os.environ["DB_BACKEND"] = "sqlite"
+        os.environ["SQLITE_PATH"] = args.sqlite
+
+    from lib.mysql_db import init_database, open_db_connection
+    from benchmarks.datagen import clear_dataset, generate_dataset, load_bench_users
+
+    if not init_database():
+        print("No se pudo inicializar la base de datos", file=sys.stderr)
+        return 2
+
+    connection = open_db_connection()
+    if not connection:
+        print("No se pudo conectar a la base de datos", file=sys.stderr)
+        return 2
+
+    if args.command == "seed":
+        if args.reset:
+            clear_dataset(connection)
+        counts = generate_dataset(connection, scale=args.scale, seed=args.seed)
+        connection.close()
+        print(json.dumps({"scale": args.scale, "seed": args.seed, **counts}))
+        return 0
+
+    users = load_bench_users(connection)
+
+    if args.command == "plans":
+        from benchmarks.query_plans import analyze_tables, check_plans
+
+        if not users:
+            print("No hay usuarios sintéticos: ejecuta primero el comando seed", file=sys.stderr)
+            return 2
+        backend = "sqlite" if args.sqlite else "mysql"
+        analyze_tables(connection, backend)
+        # El usuario sintético más activo: el que más filas obliga a recorrer
+        results = check_plans(connection, users[0]["id"], backend)
+        connection.close()
+        for result in results:
+            status = "OK " if result["ok"] else "MAL"
+            print(f"{status} {result['name']} ({result['source']}): {' | '.join(result['plan'])}")
+            for problem in result["problems"]:
+                print(f"      - {problem}")
+        return 0 if all(result["ok"] for result in results) else 1
+
+    from benchmarks.loadgen import ENDPOINT_MIX, LOGIN_MIX, build_client, run_load
+    from benchmarks.report import build_report, write_report
+
+    app = None
+    if not args.url:
+        from app import app
+
+    meta = {
+        "backend": "sqlite" if args.sqlite else "mysql",
+        "target": args.url or "in-process",
+        "concurrency": args.concurrency,
+        "seed": args.seed,
+        "users": len(users),
+    }
+
+    if args.command == "replay":
+        from benchmarks.replay import Replayer, assign_users, load_user_entities, read_capture, replay
+
+        records = read_capture(args.captures, args.limit)
+        buckets = assign_users(records, users)
+        entities = load_user_entities(connection, sorted({user.id for user in buckets.values()}))
+        connection.close()
+        replayer = Replayer(buckets, entities, seed=args.seed)
+
+        async def execute_replay():
+            async with build_client(app=app, base_url=args.url, concurrency=args.concurrency) as client:
+                return await replay(client, records, replayer, args.speed, args.concurrency)
+
+        outcome = asyncio.run(execute_replay())
+        report = build_report(outcome["result"], {
+            **meta,
+            "captures": args.captures,
+            "records": len(records),
+            "speed": args.speed,
+            "skipped": outcome["skipped"],
+            "status_mismatches": outcome["status_mismatches"],
+            "max_schedule_lag_s": outcome["max_schedule_lag_s"],
+        })
+        write_report(report, args.output)
+        print(json.dumps(report["total"], indent=2))
+        return check_baseline(report, args)
+
+    connection.close()
+
+    mix = ENDPOINT_MIX
+    if args.command == "login":
+        from lib.passwords import PASSWORD_HASH_WORKERS, PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_P, PASSWORD_SCRYPT_R
+
+        mix = LOGIN_MIX
+        meta["kdf"] = {
+            "scrypt_n": PASSWORD_SCRYPT_N, "scrypt_r": PASSWORD_SCRYPT_R, "scrypt_p": PASSWORD_SCRYPT_P,
+            "workers": PASSWORD_HASH_WORKERS,
+        }
+
+    async def execute():
+        async with build_client(app=app, base_url=args.url, concurrency=args.concurrency) as client:
+            return await run_load(client, users, args.duration, args.concurrency, args.seed, mix)
+
+    result = asyncio.run(execute())
+    report = build_report(result, {**meta, "duration_s": args.duration})
+    write_report(report, args.output)
+    print(json.dumps(report["total"], indent=2))
+    return check_baseline(report, args)
+
+if __name__ == "__main__":
+    sys.exit(main())
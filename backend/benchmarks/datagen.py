@@ -0,0 +1,141 @@
+import random
+from datetime import date, timedelta
+from typing import Any, Dict, List, Sequence
+
+from lib.passwords import hash_password
+
+# Tamaños predefinidos del conjunto de datos
+SCALES = {
+    "tiny": {"users": 20, "loans": 200, "notifications": 400},
+    "small": {"users": 200, "loans": 5_000, "notifications": 10_000},
+    "medium": {"users": 2_000, "loans": 100_000, "notifications": 200_000},
+    "large": {"users": 10_000, "loans": 1_000_000, "notifications": 2_000_000},
+}
+
+# Contraseña común de los usuarios sintéticos (para el escenario de login)
+BENCH_PASSWORD = "benchmark-password"
+BENCH_USER_PREFIX = "bench_"
+
+# Exponente de la distribución tipo Zipf: unos pocos usuarios concentran la mayoría de préstamos
+SKEW = 1.1
+
+BATCH_SIZE = 500
+
+OBJECT_NAMES = ("Libro", "Taladro", "Bicicleta", "Cámara", "Tienda de campaña", "Consola", "Proyector", "Guitarra")
+NOTIFICATION_TITLES = ("Nuevo préstamo recibido", "Préstamo creado", "Préstamo vencido", "Préstamo devuelto")
+
+
+def skewed_weights(count: int, skew: float = SKEW) -> List[float]:
+    """Pesos 1/rango^skew para repartir la actividad de forma sesgada"""
+    return [1.0 / ((rank + 1) ** skew) for rank in range(count)]
+
+
+def insert_rows(cursor, table: str, columns: Sequence[str], rows: List[Sequence[Any]], batch_size: int = BATCH_SIZE) -> None:
+    """Inserta filas en lotes con INSERT multi-fila"""
+    row_placeholder = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        params: List[Any] = []
+        for row in batch:
+            params.extend(row)
+        cursor.execute(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join([row_placeholder] * len(batch))}",
+            params,
+        )
+
+
+def clear_dataset(connection) -> None:
+    """Elimina los usuarios sintéticos (préstamos y notificaciones caen en cascada)"""
+    cursor = connection.cursor()
+    cursor.execute("DELETE FROM users WHERE username LIKE %s", (BENCH_USER_PREFIX + "%",))
+    connection.commit()
+    cursor.close()
+
+
+def generate_dataset(connection, scale: str = "small", seed: int = 42, today: date = None) -> Dict[str, int]:
+    """Genera un conjunto de datos reproducible para la escala y semilla indicadas"""
+    sizes = SCALES[scale]
+    rng = random.Random(seed)
+    today = today or date.today()
+    cursor = connection.cursor()
+
+    password_hash = hash_password(BENCH_PASSWORD)
+    user_rows = [
+        (
+            f"Usuario Benchmark {i}",
+            f"{BENCH_USER_PREFIX}{seed}_{i}",
+            f"{BENCH_USER_PREFIX}{seed}_{i}@example.com",
+            password_hash,
+        )
+        for i in range(sizes["users"])
+    ]
+    insert_rows(cursor, "users", ("name", "username", "email", "password_hash"), user_rows)
+    connection.commit()
+
+    cursor.execute(
+        "SELECT id FROM users WHERE username LIKE %s ORDER BY id",
+        (f"{BENCH_USER_PREFIX}{seed}_%",),
+    )
+    user_ids = [row[0] for row in cursor.fetchall()]
+    weights = skewed_weights(len(user_ids))
+
+    loan_rows = []
+    lenders = rng.choices(user_ids, weights=weights, k=sizes["loans"])
+    for lender_id in lenders:
+        borrower_id = rng.choice(user_ids)
+        while borrower_id == lender_id and len(user_ids) > 1:
+            borrower_id = rng.choice(user_ids)
+
+        loan_date = today - timedelta(days=rng.randint(0, 365))
+        due_date = loan_date + timedelta(days=rng.randint(7, 90))
+        if due_date < today and rng.random() < 0.7:
+            status, return_date = "returned", min(due_date, today)
+        elif due_date < today:
+            status, return_date = "overdue", None
+        else:
+            status, return_date = "active", None
+
+        if rng.random() < 0.5:
+            loan_type, amount, object_name = "money", round(rng.uniform(5, 2000), 2), None
+        else:
+            loan_type, amount, object_name = "object", None, rng.choice(OBJECT_NAMES)
+
+        loan_rows.append((
+            lender_id, borrower_id, loan_type, amount, object_name,
+            f"Descripción sintética {rng.randint(1, 10_000)}" if object_name else None,
+            loan_date, due_date, return_date, status,
+            "Préstamo generado para benchmark" if rng.random() < 0.3 else None,
+        ))
+    insert_rows(cursor, "loans", (
+        "lender_id", "borrower_id", "loan_type", "amount", "object_name",
+        "object_description", "loan_date", "due_date", "return_date", "status", "notes",
+    ), loan_rows)
+    connection.commit()
+
+    notification_rows = []
+    recipients = rng.choices(user_ids, weights=weights, k=sizes["notifications"])
+    for user_id in recipients:
+        notification_rows.append((
+            user_id,
+            rng.choice(NOTIFICATION_TITLES),
+            "Notificación generada para benchmark",
+            rng.choice(("info", "warning", "success")),
+            rng.random() < 0.6,
+        ))
+    insert_rows(cursor, "notifications", ("user_id", "title", "message", "type", "is_read"), notification_rows)
+    connection.commit()
+    cursor.close()
+
+    return {"users": len(user_rows), "loans": len(loan_rows), "notifications": len(notification_rows)}
+
+
+def load_bench_users(connection) -> List[Dict[str, Any]]:
+    """Usuarios sintéticos existentes, del más activo al menos activo"""
+    cursor = connection.cursor(dictionary=True)
+    cursor.execute(
+        "SELECT id, username FROM users WHERE username LIKE %s ORDER BY id",
+        (BENCH_USER_PREFIX + "%",),
+    )
+    users = cursor.fetchall()
+    cursor.close()
+    return users
@@ -0,0 +1,154 @@
+import asyncio
+import random
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.datagen import BENCH_PASSWORD, skewed_weights
+from lib.sessions import issue_session_token
+
+# Mezcla de endpoints (nombre, peso relativo)
+ENDPOINT_MIX = (
+    ("login", 5),
+    ("dashboard", 30),
+    ("my_loans", 25),
+    ("notifications", 25),
+    ("create_loan", 10),
+    ("return_loan", 5),
+)
+
+# Solo login: mide el coste del hash de contraseñas con clientes concurrentes
+LOGIN_MIX = (("login", 1),)
+
+
+class LoadResult:
+    """Latencias y errores acumulados por endpoint"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.elapsed = 0.0
+
+    def record(self, name: str, seconds: float, ok: bool) -> None:
+        self.latencies[name].append(seconds)
+        if not ok:
+            self.errors[name] += 1
+
+
+class VirtualUser:
+    """Estado de un usuario simulado (préstamos creados pendientes de devolver)"""
+
+    def __init__(self, user: Dict[str, Any]):
+        self.id = user["id"]
+        self.username = user["username"]
+        self.open_loans: List[int] = []
+        # Token firmado con la clave local: el resto de peticiones no pasan por el login
+        self.headers = {"Authorization": f"Bearer {issue_session_token(user)['token']}"}
+
+
+async def _login(client: httpx.AsyncClient, user: VirtualUser, rng: random.Random) -> httpx.Response:
+    return await client.post("/auth/login", json={"username": user.username, "password": BENCH_PASSWORD})
+
+
+async def _dashboard(client, user, rng) -> httpx.Response:
+    return await client.get("/loans/dashboard", headers=user.headers)
+
+
+async def _my_loans(client, user, rng) -> httpx.Response:
+    return await client.get("/loans/my-loans", headers=user.headers)
+
+
+async def _notifications(client, user, rng) -> httpx.Response:
+    return await client.get("/notifications/", params={"limit": 20}, headers=user.headers)
+
+
+def new_loan_payload(rng: random.Random, lender_id: int, borrower_ids: List[int]) -> Dict[str, Any]:
+    """Cuerpo de POST /loans/ con un prestatario distinto del prestamista"""
+    candidates = [user_id for user_id in borrower_ids if user_id != lender_id] or [lender_id]
+    loan_date = date.today()
+    return {
+        "borrower_id": rng.choice(candidates),
+        "loan_type": "money",
+        "amount": round(rng.uniform(5, 500), 2),
+        "loan_date": loan_date.isoformat(),
+        "due_date": (loan_date + timedelta(days=rng.randint(7, 60))).isoformat(),
+        "notes": "benchmark",
+    }
+
+
+async def _create_loan(client, user, rng, borrower_ids: List[int] = ()) -> httpx.Response:
+    payload = new_loan_payload(rng, user.id, borrower_ids)
+    response = await client.post("/loans/", json=payload, headers=user.headers)
+    if response.status_code == 200:
+        loan_id = response.json().get("loan_id")
+        if loan_id:
+            user.open_loans.append(loan_id)
+    return response
+
+
+async def _return_loan(client, user, rng) -> Optional[httpx.Response]:
+    if not user.open_loans:
+        return None
+    loan_id = user.open_loans.pop()
+    return await client.post(f"/loans/{loan_id}/return", headers=user.headers)
+
+
+async def run_load(
+    client: httpx.AsyncClient,
+    users: List[Dict[str, Any]],
+    duration: float = 30.0,
+    concurrency: int = 16,
+    seed: int = 42,
+    mix=ENDPOINT_MIX,
+) -> LoadResult:
+    """Lanza `concurrency` clientes que ejecutan la mezcla durante `duration` segundos"""
+    if not users:
+        raise ValueError("No hay usuarios sintéticos: ejecuta primero el comando seed")
+
+    virtual_users = [VirtualUser(user) for user in users]
+    user_weights = skewed_weights(len(virtual_users))
+    borrower_ids = [user.id for user in virtual_users]
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    scenarios = {
+        "login": _login,
+        "dashboard": _dashboard,
+        "my_loans": _my_loans,
+        "notifications": _notifications,
+        "create_loan": lambda c, u, r: _create_loan(c, u, r, borrower_ids),
+        "return_loan": _return_loan,
+    }
+
+    result = LoadResult()
+    started = time.perf_counter()
+    deadline = started + duration
+
+    async def worker(worker_id: int) -> None:
+        rng = random.Random(seed * 1000 + worker_id)
+        while time.perf_counter() < deadline:
+            user = rng.choices(virtual_users, weights=user_weights, k=1)[0]
+            name = rng.choices(names, weights=weights, k=1)[0]
+            request_started = time.perf_counter()
+            try:
+                response = await scenarios[name](client, user, rng)
+            except httpx.HTTPError:
+                result.record(name, time.perf_counter() - request_started, ok=False)
+                continue
+            if response is None:
+                continue
+            result.record(name, time.perf_counter() - request_started, ok=response.status_code < 400)
+
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def build_client(app=None, base_url: Optional[str] = None, concurrency: int = 16) -> httpx.AsyncClient:
+    """Cliente contra un servidor real (base_url) o contra la app en proceso (ASGI)"""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    if base_url:
+        return httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30.0)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=30.0)
@@ -0,0 +1,175 @@
+import re
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, NamedTuple, Sequence, Tuple
+
+from controllers.change_controller import CHANGE_FEED_LIMIT, CHANGE_LOG_QUERY, ENTITY_LOAN
+from controllers.loan_controller import (
+    LOAN_OWNER_QUERY, UPCOMING_DAYS, build_loan_list_query, build_overdue_query, build_report_query,
+    build_stats_query, build_upcoming_query,
+)
+from controllers.notification_controller import UNREAD_COUNT_QUERY, build_notifications_query
+from models.loan_models import LoanStatus
+
+# Catálogo de las consultas frecuentes de los controladores y la forma de
+# EXPLAIN que se espera de cada una. El SQL sale de los mismos constructores y
+# constantes que usan los controladores; si se cambia un índice, hay que
+# actualizar aquí la entrada. tests/test_query_plans.py lo comprueba en cada
+# ejecución de las pruebas (SQLite); contra MySQL:
+#     python -m benchmarks plans
+
+# Límite con el que el panel pide las últimas notificaciones (dashboard.html)
+NOTIFICATIONS_PAGE = 5
+
+Statement = Tuple[str, Sequence[Any]]
+
+
+class HotQuery(NamedTuple):
+    name: str
+    source: str  # función del controlador que la ejecuta
+    build: Callable[[int, date], Statement]  # (usuario, hoy) -> (sql, parámetros)
+    indexes: Tuple[str, ...]  # índices aceptables (cualquiera de ellos)
+
+
+def _listing(role: str) -> Callable[[int, date], Statement]:
+    return lambda user_id, today: build_loan_list_query(role, user_id)
+
+
+def _overdue(role: str) -> Callable[[int, date], Statement]:
+    return lambda user_id, today: (build_overdue_query(role), (user_id, LoanStatus.OVERDUE.value, today))
+
+
+def _upcoming(role: str) -> Callable[[int, date], Statement]:
+    return lambda user_id, today: (
+        build_upcoming_query(role), (user_id, LoanStatus.ACTIVE.value, today, today + timedelta(days=UPCOMING_DAYS))
+    )
+
+
+def _per_user(sql: str) -> Callable[[int, date], Statement]:
+    return lambda user_id, today: (sql, (user_id,))
+
+
+HOT_QUERIES = (
+    HotQuery("loans_by_lender", "get_loans_by_lender", _listing("lender"), ("idx_lender_created",)),
+    HotQuery("loans_by_borrower", "get_loans_by_borrower", _listing("borrower"), ("idx_borrower_created",)),
+    HotQuery("overdue_as_lender", "get_overdue_loans", _overdue("lender"), ("idx_lender_status_due",)),
+    HotQuery("overdue_as_borrower", "get_overdue_loans", _overdue("borrower"), ("idx_borrower_status_due",)),
+    HotQuery("upcoming_as_lender", "get_upcoming_loans", _upcoming("lender"), ("idx_lender_status_due",)),
+    HotQuery("upcoming_as_borrower", "get_upcoming_loans", _upcoming("borrower"), ("idx_borrower_status_due",)),
+    HotQuery(
+        "stats_as_lender", "get_loan_stats", _per_user(build_stats_query("lender")),
+        ("idx_lender_created", "idx_lender_status_due"),
+    ),
+    HotQuery(
+        "stats_as_borrower", "get_loan_stats", _per_user(build_stats_query("borrower")),
+        ("idx_borrower_created", "idx_borrower_status_due"),
+    ),
+    HotQuery(
+        "report_as_lender", "get_loan_report_summary", _per_user(build_report_query("lender")),
+        ("idx_lender_created", "idx_lender_status_due"),
+    ),
+    HotQuery(
+        "report_as_borrower", "get_loan_report_summary", _per_user(build_report_query("borrower")),
+        ("idx_borrower_created", "idx_borrower_status_due"),
+    ),
+    HotQuery(
+        "notifications_list", "get_user_notifications",
+        lambda user_id, today: build_notifications_query(user_id, NOTIFICATIONS_PAGE), ("idx_user_created",),
+    ),
+    HotQuery(
+        "notifications_unread", "get_user_notifications",
+        lambda user_id, today: build_notifications_query(user_id, NOTIFICATIONS_PAGE, unread_only=True),
+        ("idx_user_read_created",),
+    ),
+    HotQuery(
+        "notifications_unread_count", "get_unread_notifications_count", _per_user(UNREAD_COUNT_QUERY),
+        ("idx_user_read_created",),
+    ),
+    HotQuery(
+        "loan_changes", "read_change_log",
+        lambda user_id, today: (CHANGE_LOG_QUERY, (ENTITY_LOAN, user_id, 0, CHANGE_FEED_LIMIT + 1)),
+        ("idx_entity_user",),
+    ),
+    HotQuery(
+        "loan_owner", "update_loan", lambda user_id, today: (LOAN_OWNER_QUERY, (1, user_id)), ("PRIMARY",),
+    ),
+)
+
+_SQLITE_INDEX_RE = re.compile(r"USING (?:COVERING )?INDEX (\w+)")
+
+
+def _sqlite_plan(rows: List[Sequence[Any]]) -> Dict[str, Any]:
+    plan = {"indexes": [], "full_scan": False, "filesort": False, "detail": []}
+    for row in rows:
+        detail = row[-1]
+        plan["detail"].append(detail)
+        match = _SQLITE_INDEX_RE.search(detail)
+        if match:
+            plan["indexes"].append(match.group(1))
+        elif "PRIMARY KEY" in detail:
+            plan["indexes"].append("PRIMARY")
+        if detail.startswith("SCAN "):
+            plan["full_scan"] = True
+        if "TEMP B-TREE FOR ORDER BY" in detail:
+            plan["filesort"] = True
+    return plan
+
+
+def _mysql_plan(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    plan = {"indexes": [], "full_scan": False, "filesort": False, "detail": []}
+    for row in rows:
+        extra = row.get("Extra") or ""
+        plan["detail"].append(f"{row.get('table')}: type={row.get('type')} key={row.get('key')} {extra}".strip())
+        if row.get("key"):
+            plan["indexes"].append(row["key"])
+        # "index" también recorre el índice entero
+        if row.get("type") in ("ALL", "index"):
+            plan["full_scan"] = True
+        if "Using filesort" in extra:
+            plan["filesort"] = True
+    return plan
+
+
+def explain(connection, query: HotQuery, user_id: int, today: date, backend: str) -> Dict[str, Any]:
+    """Plan de ejecución normalizado: índices usados, recorrido completo y filesort"""
+    cursor = connection.cursor(dictionary=(backend == "mysql"))
+    prefix = "EXPLAIN QUERY PLAN " if backend == "sqlite" else "EXPLAIN "
+    sql, params = query.build(user_id, today)
+    cursor.execute(prefix + sql, params)
+    rows = cursor.fetchall()
+    cursor.close()
+    return _sqlite_plan(rows) if backend == "sqlite" else _mysql_plan(rows)
+
+
+def analyze_tables(connection, backend: str) -> None:
+    """Actualiza las estadísticas del optimizador tras cargar los datos"""
+    cursor = connection.cursor()
+    if backend == "sqlite":
+        cursor.execute("ANALYZE")
+    else:
+        cursor.execute("ANALYZE TABLE users, loans, notifications, change_log")
+        cursor.fetchall()
+    connection.commit()
+    cursor.close()
+
+
+def check_plans(connection, user_id: int, backend: str, today: date = None) -> List[Dict[str, Any]]:
+    """Ejecuta EXPLAIN sobre todo el catálogo y devuelve el resultado de cada consulta"""
+    today = today or date.today()
+    results = []
+    for query in HOT_QUERIES:
+        plan = explain(connection, query, user_id, today, backend)
+        problems = []
+        if plan["full_scan"]:
+            problems.append("recorrido completo")
+        if plan["filesort"]:
+            problems.append("filesort")
+        if not set(plan["indexes"]) & set(query.indexes):
+            problems.append(f"índice {plan['indexes'] or 'ninguno'} en lugar de {'/'.join(query.indexes)}")
+        results.append({
+            "name": query.name,
+            "source": query.source,
+            "ok": not problems,
+            "problems": problems,
+            "plan": plan["detail"],
+        })
+    return results
@@ -0,0 +1,210 @@
+import asyncio
+import gzip
+import json
+import random
+import re
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+import httpx
+
+from benchmarks.datagen import BENCH_PASSWORD
+from benchmarks.loadgen import LoadResult, VirtualUser, new_loan_payload
+
+# Rutas capturadas que no se reproducen (cuerpo no capturado o datos personales)
+SKIPPED_ROUTES = {
+    ("POST", "/batch"),  # sus subpeticiones ya aparecen capturadas una a una
+    ("POST", "/auth/register"),
+    ("PUT", "/auth/profile"),
+}
+
+_PATH_PARAM_RE = re.compile(r"\{(\w+)(?::\w+)?\}")
+
+# Valor con el que se sustituyen los parámetros de texto libre anonimizados
+SEARCH_PLACEHOLDER = "a"
+
+
+def read_capture(paths: Iterable[str], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Une los ficheros de captura (uno por worker) ordenados por instante de llegada"""
+    records: List[Dict[str, Any]] = []
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    records.append(json.loads(line))
+    records.sort(key=lambda record: record["ts"])
+    return records[:limit] if limit else records
+
+
+def assign_users(records: List[Dict[str, Any]], users: List[Dict[str, Any]]) -> Dict[int, VirtualUser]:
+    """Asigna cada cubo a un usuario sintético respetando el sesgo de actividad
+
+    El cubo con más peticiones se asigna al usuario sintético más activo, y así
+    sucesivamente; si hay más cubos que usuarios se reparten de forma circular.
+    """
+    if not users:
+        raise ValueError("No hay usuarios sintéticos: ejecuta primero el comando seed")
+    virtual_users = [VirtualUser(user) for user in users]
+    counts = Counter(record["u"] for record in records if record.get("u") is not None)
+    return {
+        bucket: virtual_users[rank % len(virtual_users)]
+        for rank, (bucket, _) in enumerate(counts.most_common())
+    }
+
+
+def load_user_entities(connection, user_ids: List[int]) -> Dict[str, Dict[int, List[int]]]:
+    """IDs de préstamos (como prestamista) y notificaciones de cada usuario"""
+    entities: Dict[str, Dict[int, List[int]]] = {"loan_id": defaultdict(list), "notification_id": defaultdict(list)}
+    if not user_ids:
+        return entities
+    placeholders = ", ".join(["%s"] * len(user_ids))
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT lender_id, id FROM loans WHERE lender_id IN ({placeholders})", user_ids)
+    for user_id, loan_id in cursor.fetchall():
+        entities["loan_id"][user_id].append(loan_id)
+    cursor.execute(f"SELECT user_id, id FROM notifications WHERE user_id IN ({placeholders})", user_ids)
+    for user_id, notification_id in cursor.fetchall():
+        entities["notification_id"][user_id].append(notification_id)
+    cursor.close()
+    return entities
+
+
+class Replayer:
+    """Traduce registros capturados a peticiones contra los datos sintéticos"""
+
+    def __init__(self, buckets: Dict[int, VirtualUser], entities: Dict[str, Dict[int, List[int]]], seed: int = 42):
+        self.buckets = buckets
+        self.entities = entities
+        self.rng = random.Random(seed)
+        self.borrower_ids = sorted({user.id for user in buckets.values()})
+
+    def _user(self, record: Dict[str, Any]) -> Optional[VirtualUser]:
+        bucket = record.get("u")
+        return self.buckets.get(bucket) if bucket is not None else None
+
+    def _path_value(self, name: str, method: str, user: Optional[VirtualUser]) -> Optional[int]:
+        if user is None:
+            return None
+        if name == "loan_id":
+            # Borrar o devolver consume préstamos creados durante la reproducción
+            if method in ("DELETE", "POST") and user.open_loans:
+                return user.open_loans.pop()
+            if method == "DELETE":
+                return None
+        candidates = self.entities.get(name, {}).get(user.id)
+        return self.rng.choice(candidates) if candidates else None
+
+    def build(self, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Petición httpx equivalente al registro, o None si no es reproducible"""
+        method, route = record["m"], record["r"]
+        if (method, route) in SKIPPED_ROUTES:
+            return None
+        user = self._user(record)
+
+        values = {}
+        for name in _PATH_PARAM_RE.findall(route):
+            value = self._path_value(name, method, user)
+            if value is None:
+                return None
+            values[name] = value
+        path = _PATH_PARAM_RE.sub(lambda match: str(values[match.group(1)]), route)
+
+        params = {
+            name: SEARCH_PLACEHOLDER if name == "search" else value
+            for name, value in record.get("q", {}).items()
+        }
+        request: Dict[str, Any] = {"method": method, "url": path, "params": params}
+        if user is not None:
+            request["headers"] = user.headers
+
+        if (method, route) == ("POST", "/auth/login"):
+            login_user = user or (self.rng.choice(list(self.buckets.values())) if self.buckets else None)
+            if login_user is None:
+                return None
+            request["json"] = {"username": login_user.username, "password": BENCH_PASSWORD}
+        elif (method, route) == ("POST", "/loans/"):
+            if user is None:
+                return None
+            request["json"] = new_loan_payload(self.rng, user.id, self.borrower_ids)
+        elif (method, route) == ("PUT", "/loans/{loan_id}"):
+            request["json"] = {"notes": "replay"}
+        elif (method, route) == ("POST", "/notifications/"):
+            if user is None:
+                return None
+            request["json"] = {"user_id": user.id, "title": "Replay", "message": "Notificación reproducida"}
+        return request
+
+    def after(self, record: Dict[str, Any], response: httpx.Response) -> None:
+        """Guarda los préstamos creados para reutilizarlos en devoluciones y borrados"""
+        if (record["m"], record["r"]) == ("POST", "/loans/") and response.status_code == 200:
+            user = self._user(record)
+            loan_id = response.json().get("loan_id")
+            if user is not None and loan_id:
+                user.open_loans.append(loan_id)
+
+
+async def replay(
+    client: httpx.AsyncClient,
+    records: List[Dict[str, Any]],
+    replayer: Replayer,
+    speed: float = 1.0,
+    concurrency: int = 64,
+) -> Dict[str, Any]:
+    """Reproduce la captura respetando los intervalos originales divididos por `speed`
+
+    Es de bucle abierto: las peticiones se lanzan a su hora aunque las anteriores
+    no hayan terminado, con un máximo de `concurrency` en vuelo. Con speed <= 0
+    se lanzan lo más rápido posible.
+    """
+    result = LoadResult()
+    skipped: Dict[str, int] = defaultdict(int)
+    status_mismatches: Dict[str, int] = defaultdict(int)
+    max_lag = 0.0
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = []
+
+    async def send(name: str, record: Dict[str, Any], request: Dict[str, Any]) -> None:
+        try:
+            request_started = time.perf_counter()
+            try:
+                response = await client.request(**request)
+            except httpx.HTTPError:
+                result.record(name, time.perf_counter() - request_started, ok=False)
+                return
+            result.record(name, time.perf_counter() - request_started, ok=response.status_code < 400)
+            # Un cambio de clase de estado indica que la reproducción no es fiel
+            if response.status_code // 100 != record["s"] // 100:
+                status_mismatches[name] += 1
+            replayer.after(record, response)
+        finally:
+            semaphore.release()
+
+    started = time.perf_counter()
+    first_ts = records[0]["ts"] if records else 0.0
+    for record in records:
+        name = f"{record['m']} {record['r']}"
+        if speed > 0:
+            delay = (record["ts"] - first_ts) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        request = replayer.build(record)
+        if request is None:
+            skipped[name] += 1
+            continue
+        await semaphore.acquire()
+        if speed > 0:
+            # Retraso respecto al horario original (cliente saturado)
+            max_lag = max(max_lag, time.perf_counter() - started - (record["ts"] - first_ts) / speed)
+        tasks.append(asyncio.create_task(send(name, record, request)))
+
+    await asyncio.gather(*tasks)
+    result.elapsed = time.perf_counter() - started
+    return {
+        "result": result,
+        "skipped": dict(skipped),
+        "status_mismatches": dict(status_mismatches),
+        "max_schedule_lag_s": round(max_lag, 3),
+    }
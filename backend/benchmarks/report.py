@@ -0,0 +1,77 @@
+import json
+import math
+import platform
+from datetime import datetime
+from typing import Any, Dict, List
+
+from benchmarks.loadgen import LoadResult
+
+# Regresión tolerada respecto a la línea base (10%)
+DEFAULT_TOLERANCE = 0.10
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Percentil por rango más cercano sobre valores ya ordenados"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def _summary(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+    }
+
+
+def build_report(result: LoadResult, meta: Dict[str, Any]) -> Dict[str, Any]:
+    """Informe JSON con percentiles y throughput por endpoint y en total"""
+    all_latencies = [value for values in result.latencies.values() for value in values]
+    return {
+        "meta": {
+            **meta,
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "elapsed_s": round(result.elapsed, 3),
+        },
+        "total": _summary(all_latencies, sum(result.errors.values()), result.elapsed),
+        "endpoints": {
+            name: _summary(values, result.errors.get(name, 0), result.elapsed)
+            for name, values in sorted(result.latencies.items())
+        },
+    }
+
+
+def compare_reports(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """Lista de regresiones: p95/p99 más altos o throughput más bajo que la línea base"""
+    regressions = []
+    sections = {"total": (current["total"], baseline.get("total"))}
+    for name, summary in current["endpoints"].items():
+        sections[name] = (summary, baseline.get("endpoints", {}).get(name))
+
+    for name, (now, before) in sections.items():
+        if not before:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if before[key] and now[key] > before[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {before[key]} -> {now[key]}")
+        if before["throughput_rps"] and now["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput_rps {before['throughput_rps']} -> {now['throughput_rps']}")
+    return regressions
+
+
+def write_report(report: Dict[str, Any], path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def read_report(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
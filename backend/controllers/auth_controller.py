@@ -1,10 +1,15 @@
-import hashlib
 from typing import Optional
 from pydantic import BaseModel
 from lib.mysql_db import (
-    get_user_by_username, create_user, init_database, check_database_exists,
-    hash_password, verify_password, update_user_profile as update_user_profile_db, get_user_by_id
+    get_user_by_username, get_user_credentials, create_user, init_database, check_database_exists,
+    update_user_profile as update_user_profile_db, get_user_by_id, update_password_hash
 )
+from lib.passwords import hash_password, verify_password, needs_rehash
+from lib.sessions import issue_session_token
+from lib.health import health_monitor
+from lib.circuit_breaker import DatabaseUnavailableError, retry_reads
+from lib.deadlines import DeadlineExceededError
+from lib.tracing import traced
 
 class UserCreate(BaseModel):
     name: str
@@ -35,14 +40,7 @@ class UserUpdate(BaseModel):
     address: Optional[str] = None
     profile_image: Optional[str] = None
 
-def hash_password(password: str) -> str:
-    """Genera un hash seguro de la contraseña usando SHA-256"""
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def verify_password(password: str, hashed_password: str) -> bool:
-    """Verifica si la contraseña coincide con el hash"""
-    return hash_password(password) == hashed_password
-
+@traced
 def register_user(user_data: UserCreate) -> dict:
     """Registra un nuevo usuario"""
     # Verificar si la base de datos existe
@@ -72,22 +70,23 @@ def register_user(user_data: UserCreate) -> dict:
     else:
         return {"success": False, "message": "Error al crear el usuario"}
 
+@traced
 def login_user(login_data: UserLogin) -> dict:
     """Autentica un usuario"""
-    # Verificar si la base de datos existe
-    if not check_database_exists():
-        return {"success": False, "message": "Base de datos no encontrada"}
-    
-    # Buscar el usuario
-    user = get_user_by_username(login_data.username)
+    # Siempre contra la base de datos: el hash no se cachea; sin base de datos se responde 503
+    user = get_user_credentials(login_data.username)
     if not user:
         return {"success": False, "message": "Usuario no encontrado"}
     
     # Verificar la contraseña
     if verify_password(login_data.password, user['password_hash']):
+        # Los hashes SHA-256 heredados o con un coste antiguo se recalculan con la contraseña ya verificada
+        if needs_rehash(user['password_hash']):
+            update_password_hash(user['id'], user['password_hash'], hash_password(login_data.password))
         return {
             "success": True, 
             "message": "Login exitoso",
+            **issue_session_token(user),
             "user": {
                 "id": user['id'],
                 "name": user['name'],
@@ -103,13 +102,14 @@ def login_user(login_data: UserLogin) -> dict:
         return {"success": False, "message": "Contraseña incorrecta"}
 
 def check_database_status() -> dict:
-    """Verifica el estado de la base de datos"""
-    exists = check_database_exists()
+    """Estado de la base de datos según la última comprobación en segundo plano"""
+    exists = health_monitor.snapshot().database_ok
     return {
         "database_exists": exists,
         "message": "Base de datos encontrada" if exists else "Base de datos no encontrada"
     }
 
+@traced
 def update_user_profile(user_id: int, update_data: UserUpdate) -> dict:
     """Actualiza el perfil de un usuario"""
     try:
@@ -126,9 +126,13 @@ def update_user_profile(user_id: int, update_data: UserUpdate) -> dict:
         else:
             return {"success": False, "message": "Error al actualizar el perfil"}
             
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
     except Exception as e:
         return {"success": False, "message": f"Error al actualizar perfil: {str(e)}"}
 
+@traced
+@retry_reads
 def get_user_profile(user_id: int) -> dict:
     """Obtiene el perfil de un usuario"""
     try:
@@ -150,5 +154,7 @@ def get_user_profile(user_id: int) -> dict:
             }
         }
         
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
     except Exception as e:
         return {"success": False, "message": f"Error al obtener perfil: {str(e)}"}
@@ -0,0 +1,96 @@
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from models.loan_models import BatchSubRequest, BatchSubResponse
+from lib.request_context import request_context
+
+# Cabeceras de la petición externa que se propagan a cada subpetición
+FORWARDED_HEADERS = ("x-user-id", "authorization", "cookie", "accept-language")
+
+# Prefijos que no se pueden invocar desde un lote
+FORBIDDEN_PREFIXES = ("/batch",)
+
+
+async def run_batch(app, base_request, sub_requests: List[BatchSubRequest]) -> List[BatchSubResponse]:
+    """Ejecuta las subpeticiones de forma concurrente compartiendo el contexto de BD"""
+    base_headers = {
+        name: value for name, value in base_request.headers.items()
+        if name.lower() in FORWARDED_HEADERS
+    }
+
+    with request_context():
+        results = await asyncio.gather(
+            *(_dispatch(app, base_request, base_headers, sub_request) for sub_request in sub_requests)
+        )
+    return list(results)
+
+
+async def _dispatch(app, base_request, base_headers: Dict[str, str], sub_request: BatchSubRequest) -> BatchSubResponse:
+    """Ejecuta una subpetición directamente sobre la app ASGI"""
+    url = urlsplit(sub_request.path)
+    if url.path.startswith(FORBIDDEN_PREFIXES):
+        return BatchSubResponse(id=sub_request.id, status=400, body={"detail": "Ruta no permitida en un lote"})
+
+    headers = dict(base_headers)
+    headers.update({name.lower(): value for name, value in sub_request.headers.items()})
+    # La respuesta del lote completo ya se comprime; las subpeticiones no
+    headers.pop("accept-encoding", None)
+
+    body = b""
+    if sub_request.body is not None:
+        body = json.dumps(sub_request.body).encode("utf-8")
+        headers["content-type"] = "application/json"
+    headers["content-length"] = str(len(body))
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": sub_request.method,
+        "scheme": base_request.url.scheme,
+        "path": url.path,
+        "raw_path": url.path.encode("utf-8"),
+        "query_string": url.query.encode("utf-8"),
+        "root_path": "",
+        "headers": [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()],
+        "client": base_request.scope.get("client"),
+        "server": base_request.scope.get("server"),
+    }
+
+    request_sent = False
+
+    async def receive() -> Dict[str, Any]:
+        nonlocal request_sent
+        if request_sent:
+            return {"type": "http.disconnect"}
+        request_sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    status: Optional[int] = None
+    content_type = ""
+    chunks: List[bytes] = []
+
+    async def send(message: Dict[str, Any]) -> None:
+        nonlocal status, content_type
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            for name, value in message.get("headers", []):
+                if name.lower() == b"content-type":
+                    content_type = value.decode("latin-1")
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    try:
+        await app(scope, receive, send)
+    except Exception as e:
+        return BatchSubResponse(id=sub_request.id, status=500, body={"detail": f"Error en subpetición: {str(e)}"})
+
+    raw = b"".join(chunks)
+    if content_type.startswith("application/json") and raw:
+        payload: Any = json.loads(raw)
+    else:
+        payload = raw.decode("utf-8", errors="replace") if raw else None
+
+    return BatchSubResponse(id=sub_request.id, status=status or 500, body=payload)
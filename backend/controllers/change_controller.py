@@ -0,0 +1,139 @@
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from lib.db_router import mark_user_write
+from lib.mysql_db import get_db_connection
+
+# Máximo de entradas del registro de cambios devueltas por llamada
+CHANGE_FEED_LIMIT = 500
+
+# Los ids se asignan al insertar pero se ven al confirmar: el token no pasa de los cambios con
+# más de estos segundos, y los más recientes se reenvían en la siguiente llamada.
+# Debe superar la transacción de escritura más larga (y el retraso de las réplicas).
+CHANGE_FEED_SETTLE_SECONDS = float(os.environ.get("CHANGE_FEED_SETTLE_SECONDS", "10"))
+
+# Días que se conserva el registro; un token más antiguo recibe reset=True
+CHANGE_LOG_RETENTION_DAYS = float(os.environ.get("CHANGE_LOG_RETENTION_DAYS", "30"))
+
+ENTITY_LOAN = "loan"
+ENTITY_NOTIFICATION = "notification"
+
+OP_INSERT = "insert"
+OP_UPDATE = "update"
+OP_DELETE = "delete"
+
+# Cambios de un usuario posteriores a un id, en orden (índice idx_entity_user)
+CHANGE_LOG_QUERY = (
+    "SELECT id, entity_id, operation FROM change_log WHERE entity = %s AND user_id = %s AND id > %s ORDER BY id ASC LIMIT %s"
+)
+
+
+def record_changes(cursor, entity: str, operation: str, pairs: Iterable[Tuple[int, int]]) -> None:
+    """Registra cambios (entity_id, user_id) en change_log usando el cursor de la transacción en curso"""
+    rows = list(dict.fromkeys(pairs))
+    if not rows:
+        return
+    # Los usuarios afectados leerán del primario mientras las réplicas se ponen al día
+    mark_user_write({user_id for _, user_id in rows})
+    placeholders = ", ".join(["(%s, %s, %s, %s)"] * len(rows))
+    params: List[Any] = []
+    for entity_id, user_id in rows:
+        params.extend([entity, entity_id, user_id, operation])
+    cursor.execute(
+        f"INSERT INTO change_log (entity, entity_id, user_id, operation) VALUES {placeholders}",
+        params,
+    )
+
+
+def _seconds_before(db_now: Any, seconds: float) -> str:
+    """Instante `seconds` antes de CURRENT_TIMESTAMP de la base de datos, comparable con created_at"""
+    if isinstance(db_now, str):
+        db_now = datetime.fromisoformat(db_now)
+    return (db_now - timedelta(seconds=seconds)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def read_change_log(cursor, entity: str, user_id: int, since: Optional[int], limit: int = CHANGE_FEED_LIMIT) -> Dict[str, Any]:
+    """Lee los cambios de un usuario posteriores al token y los agrupa por entidad
+
+    Devuelve las entradas como (entity_id, op) con op en insert/update/delete,
+    ordenadas por su último cambio. Si el token falta, no es válido o es
+    anterior a lo conservado se indica reset=True para que el cliente recargue
+    la lista completa. Los cambios de los últimos CHANGE_FEED_SETTLE_SECONDS
+    pueden llegar dos veces: el cliente los aplica por id (son idempotentes).
+    Requiere un cursor de tipo diccionario.
+    """
+    cursor.execute(
+        "SELECT COALESCE(MIN(id), 0) AS first_id, COALESCE(MAX(id), 0) AS last_id, "
+        "CURRENT_TIMESTAMP AS db_now FROM change_log"
+    )
+    bounds = cursor.fetchone()
+    first_id, last_id = int(bounds["first_id"]), int(bounds["last_id"])
+
+    # Último id con todo lo anterior ya confirmado: se recorre la clave primaria hacia atrás
+    # y solo se leen los cambios de la ventana
+    cursor.execute(
+        "SELECT id FROM change_log WHERE created_at < %s ORDER BY id DESC LIMIT 1",
+        (_seconds_before(bounds["db_now"], CHANGE_FEED_SETTLE_SECONDS),)
+    )
+    settled = cursor.fetchone()
+    settled_id = int(settled["id"]) if settled else 0
+
+    # Un token anterior al primer cambio conservado perdió las entradas borradas por la retención
+    if since is None or since < 0 or since > last_id or (first_id and since < first_id - 1):
+        return {"entries": [], "next_token": settled_id, "has_more": False, "reset": True}
+
+    cursor.execute(CHANGE_LOG_QUERY, (entity, user_id, since, limit + 1))
+    rows = cursor.fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+
+    # Colapsar varios cambios de la misma entidad en uno solo
+    first_ops: Dict[int, str] = {}
+    last_ops: Dict[int, str] = {}
+    for row in rows:
+        entity_id, operation = row["entity_id"], row["operation"]
+        first_ops.setdefault(entity_id, operation)
+        last_ops.pop(entity_id, None)
+        last_ops[entity_id] = operation
+
+    entries = []
+    for entity_id, operation in last_ops.items():
+        if operation != OP_DELETE and first_ops[entity_id] == OP_INSERT:
+            operation = OP_INSERT
+        entries.append((entity_id, operation))
+
+    # Sin más páginas se ha leído hasta el final; el token se queda en lo ya confirmado
+    last_seen = rows[-1]["id"] if more else last_id
+    next_token = max(since, min(last_seen, settled_id))
+    # Si la página entera cae en la ventana, se espera a la siguiente consulta en vez de repetirla
+    has_more = more and next_token > since
+    return {"entries": entries, "next_token": next_token, "has_more": has_more, "reset": False}
+
+
+def prune_change_log(batch_size: int = 1000) -> int:
+    """Borra las entradas del registro más antiguas que CHANGE_LOG_RETENTION_DAYS"""
+    deleted = 0
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("SELECT CURRENT_TIMESTAMP AS db_now")
+        cutoff = _seconds_before(cursor.fetchone()["db_now"], CHANGE_LOG_RETENTION_DAYS * 86400)
+        while True:
+            # Por la clave primaria desde el principio: solo se leen las filas que se borran
+            cursor.execute(
+                "SELECT id FROM change_log WHERE created_at < %s ORDER BY id LIMIT %s",
+                (cutoff, batch_size)
+            )
+            ids = [row['id'] for row in cursor.fetchall()]
+            if not ids:
+                break
+            cursor.execute(f"DELETE FROM change_log WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+            connection.commit()
+            deleted += len(ids)
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+    return deleted
+
@@ -1,15 +1,191 @@
-from typing import List, Optional, Dict, Any
+import heapq
+import logging
+from typing import List, Optional, Dict, Any, Set, Tuple
 from datetime import date, datetime, timedelta
 from models.loan_models import (
-    LoanCreate, LoanUpdate, LoanResponse, LoanFilter, LoanStats,
-    NotificationCreate, NotificationResponse, UserResponse,
-    LoanType, LoanStatus, NotificationType
+    LoanCreate, LoanUpdate, LoanResponse, LoanPartialResponse, LoanListItem,
+    LoanFilter, LoanStats, NotificationCreate, NotificationResponse, UserResponse,
+    LoanType, LoanStatus, NotificationType, ChangeEntry, ChangeFeed, WebhookEvent
 )
-from lib.mysql_db import get_db_connection
-from controllers.notification_controller import create_loan_notifications
+from lib.mysql_db import get_db_connection, get_read_connection, get_users_by_ids
+from lib.circuit_breaker import DatabaseUnavailableError, retry_reads
+from lib.deadlines import DeadlineExceededError
+from lib.tracing import traced, span
+from lib.structured_log import log_fields
+from controllers.notification_controller import create_loan_notifications, enqueue_notifications, insert_notifications
+from controllers.webhook_controller import record_webhook_events
+from controllers.change_controller import (
+    record_changes, read_change_log, ENTITY_LOAN,
+    OP_INSERT, OP_UPDATE, OP_DELETE
+)
+
+logger = logging.getLogger("controllers.loans")
+
+# Columnas de la tabla loans que se pueden pedir con ?fields=
+LOAN_COLUMNS = (
+    "id", "lender_id", "borrower_id", "loan_type", "amount", "object_name",
+    "object_description", "object_image", "loan_date", "due_date", "return_date",
+    "status", "notes", "created_at", "updated_at",
+)
+# Comprueba que el préstamo existe y es del prestamista (devuelve el prestatario)
+LOAN_OWNER_QUERY = "SELECT borrower_id FROM loans WHERE id = %s AND lender_id = %s"
+
+# Días por defecto de /loans/upcoming
+UPCOMING_DAYS = 3
+
+# Campos que se completan con el directorio de usuarios en memoria
+LOAN_NAME_FIELDS = ("lender_name", "borrower_name")
+LOAN_FIELDS = LOAN_COLUMNS + LOAN_NAME_FIELDS
+
+def parse_loan_fields(fields: Optional[str]) -> Optional[Set[str]]:
+    """Convierte el parámetro ?fields= en un conjunto de campos (None = todos)"""
+    if not fields:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(LOAN_FIELDS)
+    if unknown:
+        raise ValueError(f"Campos no válidos: {', '.join(sorted(unknown))}")
+    # El id siempre se incluye para poder identificar cada préstamo
+    requested.add("id")
+    return requested
+
+def build_loan_select(fields: Optional[Set[str]], join_lender: bool = False, join_borrower: bool = False) -> str:
+    """Construye el SELECT de préstamos con solo las columnas y joins necesarios
+
+    Los nombres de prestamista/prestatario no se obtienen con joins sino desde
+    el directorio de usuarios; los joins solo se añaden cuando un filtro de
+    búsqueda necesita comparar contra el nombre.
+    """
+    if fields is None:
+        columns = ["l.*"]
+    else:
+        wanted = set(fields)
+        # Los ids de usuario hacen falta para resolver los nombres pedidos
+        if "lender_name" in fields:
+            wanted.add("lender_id")
+        if "borrower_name" in fields:
+            wanted.add("borrower_id")
+        columns = [f"l.{column}" for column in LOAN_COLUMNS if column in wanted]
+
+    query = f"SELECT {', '.join(columns)} FROM loans l"
+    if join_lender:
+        query += " JOIN users lender ON l.lender_id = lender.id"
+    if join_borrower:
+        query += " JOIN users borrower ON l.borrower_id = borrower.id"
+    return query
+
+def build_loan_list_query(
+    role: str, user_id: int, filters: Optional[LoanFilter] = None, fields: Optional[Set[str]] = None
+) -> Tuple[str, List[Any]]:
+    """SELECT y parámetros de los préstamos del usuario como prestamista o prestatario (role) con sus filtros"""
+    # La búsqueda compara también con el nombre de la otra parte
+    other = "borrower" if role == "lender" else "lender"
+    search = bool(filters and filters.search)
+    query = build_loan_select(fields, join_lender=search and other == "lender", join_borrower=search and other == "borrower")
+    query += f" WHERE l.{role}_id = %s"
+    params: List[Any] = [user_id]
+    
+    if filters:
+        if filters.status:
+            query += " AND l.status = %s"
+            params.append(filters.status.value)
+        
+        if filters.loan_type:
+            query += " AND l.loan_type = %s"
+            params.append(filters.loan_type.value)
+        
+        if getattr(filters, f"{other}_id"):
+            query += f" AND l.{other}_id = %s"
+            params.append(getattr(filters, f"{other}_id"))
+        
+        if filters.date_from:
+            query += " AND l.loan_date >= %s"
+            params.append(filters.date_from)
+        
+        if filters.date_to:
+            query += " AND l.loan_date <= %s"
+            params.append(filters.date_to)
+        
+        if filters.search:
+            query += f" AND (l.object_name LIKE %s OR l.notes LIKE %s OR {other}.name LIKE %s)"
+            search_term = f"%{filters.search}%"
+            params.extend([search_term, search_term, search_term])
+    
+    query += " ORDER BY l.created_at DESC"
+    return query, params
+
+def build_overdue_query(role: str, fields: Optional[Set[str]] = None) -> str:
+    """Vencidos de un rol y estado: recorre el índice (rol, status, due_date) ya ordenado, sin filesort"""
+    return build_loan_select(fields) + f" WHERE l.{role}_id = %s AND l.status = %s AND l.due_date < %s ORDER BY l.due_date ASC"
+
+def build_upcoming_query(role: str) -> str:
+    """Activos de un rol que vencen entre dos fechas"""
+    return build_loan_select(None) + f" WHERE l.{role}_id = %s AND l.status = %s AND l.due_date BETWEEN %s AND %s ORDER BY l.due_date ASC"
 
+def build_stats_query(role: str) -> str:
+    """Contadores e importes de un rol: activos, devueltos, vencidos, pendiente y devuelto"""
+    return f"""
+        SELECT 
+            COUNT(CASE WHEN status = 'active' THEN 1 END) as active_count,
+            COUNT(CASE WHEN status = 'returned' THEN 1 END) as returned_count,
+            COUNT(CASE WHEN status = 'overdue' THEN 1 END) as overdue_count,
+            COALESCE(SUM(CASE WHEN status = 'active' AND loan_type = 'money' THEN amount ELSE 0 END), 0) as pending_amount,
+            COALESCE(SUM(CASE WHEN status = 'returned' AND loan_type = 'money' THEN amount ELSE 0 END), 0) as returned_amount
+        FROM loans WHERE {role}_id = %s
+    """
+
+def build_report_query(role: str) -> str:
+    """Totales de un rol por tipo y estado para los reportes"""
+    return f"""
+        SELECT
+            loan_type,
+            status,
+            COUNT(*) AS total_count,
+            COALESCE(SUM(CASE WHEN loan_type = 'money' THEN amount ELSE 0 END), 0) AS total_amount
+        FROM loans
+        WHERE {role}_id = %s
+        GROUP BY loan_type, status
+    """
+
+@traced
+def enrich_loan_names(loans: List[Dict[str, Any]], lender: bool = True, borrower: bool = True) -> List[Dict[str, Any]]:
+    """Añade lender_name/borrower_name a las filas usando el directorio de usuarios"""
+    if not loans or not (lender or borrower):
+        return loans
+
+    user_ids = set()
+    for loan in loans:
+        if lender:
+            user_ids.add(loan["lender_id"])
+        if borrower:
+            user_ids.add(loan["borrower_id"])
+    users = get_users_by_ids(user_ids)
+
+    for loan in loans:
+        if lender:
+            loan["lender_name"] = users.get(loan["lender_id"], {}).get("name")
+        if borrower:
+            loan["borrower_name"] = users.get(loan["borrower_id"], {}).get("name")
+    return loans
+
+def build_loan_items(rows: List[Dict[str, Any]], fields: Optional[Set[str]] = None) -> List[LoanListItem]:
+    """Completa los nombres y serializa las filas completas o reducidas a los campos pedidos"""
+    if fields is None:
+        enrich_loan_names(rows)
+        with span("serialize"):
+            return [LoanResponse(**row) for row in rows]
+
+    enrich_loan_names(rows, lender="lender_name" in fields, borrower="borrower_name" in fields)
+    with span("serialize"):
+        return [
+            LoanPartialResponse(**{key: value for key, value in row.items() if key in fields})
+            for row in rows
+        ]
+
+@traced
 def create_loan(lender_id: int, loan_data: LoanCreate) -> Dict[str, Any]:
     """Crea un nuevo préstamo"""
+    connection = None
     try:
         connection = get_db_connection()
         if not connection:
@@ -21,14 +197,12 @@ def create_loan(lender_id: int, loan_data: LoanCreate) -> Dict[str, Any]:
         cursor.execute("SELECT id FROM users WHERE id = %s", (lender_id,))
         if not cursor.fetchone():
             cursor.close()
-            connection.close()
             return {"success": False, "message": "Prestamista no encontrado"}
         
         # Verificar que el prestatario existe
         cursor.execute("SELECT id FROM users WHERE id = %s", (loan_data.borrower_id,))
         if not cursor.fetchone():
             cursor.close()
-            connection.close()
             return {"success": False, "message": "Prestatario no encontrado"}
         
         # Insertar el préstamo
@@ -43,74 +217,54 @@ def create_loan(lender_id: int, loan_data: LoanCreate) -> Dict[str, Any]:
         ))
         
         loan_id = cursor.lastrowid
-        
-        # Crear notificaciones para prestatario y prestamista
+        record_changes(cursor, ENTITY_LOAN, OP_INSERT, [(loan_id, lender_id), (loan_id, loan_data.borrower_id)])
+        record_webhook_events(cursor, WebhookEvent.LOAN_CREATED, [{
+            "id": loan_id, "lender_id": lender_id, "borrower_id": loan_data.borrower_id,
+            "loan_type": loan_data.loan_type.value, "amount": loan_data.amount, "object_name": loan_data.object_name,
+            "loan_date": loan_data.loan_date, "due_date": loan_data.due_date, "status": LoanStatus.ACTIVE.value,
+        }])
+        
+        # Notificaciones para prestatario y prestamista: se encolan en esta transacción
+        # y las escribe el worker, fuera del tiempo de respuesta
         create_loan_notifications(
             loan_id=loan_id,
             lender_id=lender_id,
             borrower_id=loan_data.borrower_id,
             loan_type=loan_data.loan_type.value,
             amount=loan_data.amount,
-            object_name=loan_data.object_name
+            object_name=loan_data.object_name,
+            cursor=cursor
         )
         
         connection.commit()
         cursor.close()
-        connection.close()
         
         return {"success": True, "message": "Préstamo creado exitosamente", "loan_id": loan_id}
         
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
     except Exception as e:
+        # Deshace lo escrito antes del fallo: la conexión vuelve al pool sin transacción abierta
+        if connection is not None:
+            connection.rollback()
         return {"success": False, "message": f"Error al crear préstamo: {str(e)}"}
+    finally:
+        if connection is not None:
+            connection.close()
 
-def get_loans_by_lender(lender_id: int, filters: Optional[LoanFilter] = None) -> List[LoanResponse]:
+@traced
+@retry_reads
+def get_loans_by_lender(lender_id: int, filters: Optional[LoanFilter] = None, fields: Optional[Set[str]] = None) -> List[LoanListItem]:
     """Obtiene todos los préstamos de un prestamista"""
     try:
-        connection = get_db_connection()
+        connection = get_read_connection(lender_id)
         if not connection:
             return []
         
         cursor = connection.cursor(dictionary=True)
         
-        # Construir la consulta con filtros
-        query = """
-            SELECT l.*, 
-                   lender.name as lender_name,
-                   borrower.name as borrower_name
-            FROM loans l
-            JOIN users lender ON l.lender_id = lender.id
-            JOIN users borrower ON l.borrower_id = borrower.id
-            WHERE l.lender_id = %s
-        """
-        params = [lender_id]
-        
-        if filters:
-            if filters.status:
-                query += " AND l.status = %s"
-                params.append(filters.status.value)
-            
-            if filters.loan_type:
-                query += " AND l.loan_type = %s"
-                params.append(filters.loan_type.value)
-            
-            if filters.borrower_id:
-                query += " AND l.borrower_id = %s"
-                params.append(filters.borrower_id)
-            
-            if filters.date_from:
-                query += " AND l.loan_date >= %s"
-                params.append(filters.date_from)
-            
-            if filters.date_to:
-                query += " AND l.loan_date <= %s"
-                params.append(filters.date_to)
-            
-            if filters.search:
-                query += " AND (l.object_name LIKE %s OR l.notes LIKE %s OR borrower.name LIKE %s)"
-                search_term = f"%{filters.search}%"
-                params.extend([search_term, search_term, search_term])
-        
-        query += " ORDER BY l.created_at DESC"
+        # Construir la consulta con filtros (la búsqueda necesita el nombre del prestatario)
+        query, params = build_loan_list_query("lender", lender_id, filters, fields)
         
         cursor.execute(query, params)
         loans = cursor.fetchall()
@@ -118,60 +272,27 @@ def get_loans_by_lender(lender_id: int, filters: Optional[LoanFilter] = None) ->
         cursor.close()
         connection.close()
         
-        return [LoanResponse(**loan) for loan in loans]
+        return build_loan_items(loans, fields)
         
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
     except Exception as e:
-        print(f"Error al obtener préstamos: {e}")
+        logger.error("Error al obtener préstamos: %s", e, extra=log_fields(user_id=lender_id, role="lender"))
         return []
 
-def get_loans_by_borrower(borrower_id: int, filters: Optional[LoanFilter] = None) -> List[LoanResponse]:
+@traced
+@retry_reads
+def get_loans_by_borrower(borrower_id: int, filters: Optional[LoanFilter] = None, fields: Optional[Set[str]] = None) -> List[LoanListItem]:
     """Obtiene todos los préstamos de un prestatario"""
     try:
-        connection = get_db_connection()
+        connection = get_read_connection(borrower_id)
         if not connection:
             return []
         
         cursor = connection.cursor(dictionary=True)
         
-        # Construir la consulta con filtros
-        query = """
-            SELECT l.*, 
-                   lender.name as lender_name,
-                   borrower.name as borrower_name
-            FROM loans l
-            JOIN users lender ON l.lender_id = lender.id
-            JOIN users borrower ON l.borrower_id = borrower.id
-            WHERE l.borrower_id = %s
-        """
-        params = [borrower_id]
-        
-        if filters:
-            if filters.status:
-                query += " AND l.status = %s"
-                params.append(filters.status.value)
-            
-            if filters.loan_type:
-                query += " AND l.loan_type = %s"
-                params.append(filters.loan_type.value)
-            
-            if filters.lender_id:
-                query += " AND l.lender_id = %s"
-                params.append(filters.lender_id)
-            
-            if filters.date_from:
-                query += " AND l.loan_date >= %s"
-                params.append(filters.date_from)
-            
-            if filters.date_to:
-                query += " AND l.loan_date <= %s"
-                params.append(filters.date_to)
-            
-            if filters.search:
-                query += " AND (l.object_name LIKE %s OR l.notes LIKE %s OR lender.name LIKE %s)"
-                search_term = f"%{filters.search}%"
-                params.extend([search_term, search_term, search_term])
-        
-        query += " ORDER BY l.created_at DESC"
+        # Construir la consulta con filtros (la búsqueda necesita el nombre del prestamista)
+        query, params = build_loan_list_query("borrower", borrower_id, filters, fields)
         
         cursor.execute(query, params)
         loans = cursor.fetchall()
@@ -179,14 +300,18 @@ def get_loans_by_borrower(borrower_id: int, filters: Optional[LoanFilter] = None
         cursor.close()
         connection.close()
         
-        return [LoanResponse(**loan) for loan in loans]
+        return build_loan_items(loans, fields)
         
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
     except Exception as e:
-        print(f"Error al obtener préstamos: {e}")
+        logger.error("Error al obtener préstamos: %s", e, extra=log_fields(user_id=borrower_id, role="borrower"))
         return []
 
+@traced
 def update_loan(loan_id: int, lender_id: int, update_data: LoanUpdate) -> Dict[str, Any]:
     """Actualiza un préstamo existente"""
+    connection = None
     try:
         connection = get_db_connection()
         if not connection:
@@ -195,10 +320,10 @@ def update_loan(loan_id: int, lender_id: int, update_data: LoanUpdate) -> Dict[s
         cursor = connection.cursor()
         
         # Verificar que el préstamo existe y pertenece al prestamista
-        cursor.execute("SELECT id FROM loans WHERE id = %s AND lender_id = %s", (loan_id, lender_id))
-        if not cursor.fetchone():
+        cursor.execute(LOAN_OWNER_QUERY, (loan_id, lender_id))
+        loan = cursor.fetchone()
+        if not loan:
             cursor.close()
-            connection.close()
             return {"success": False, "message": "Préstamo no encontrado o no autorizado"}
         
         # Construir la consulta de actualización
@@ -212,24 +337,33 @@ def update_loan(loan_id: int, lender_id: int, update_data: LoanUpdate) -> Dict[s
         
         if not fields:
             cursor.close()
-            connection.close()
             return {"success": False, "message": "No hay campos para actualizar"}
         
         params.append(loan_id)
         query = f"UPDATE loans SET {', '.join(fields)} WHERE id = %s"
         
         cursor.execute(query, params)
+        record_changes(cursor, ENTITY_LOAN, OP_UPDATE, [(loan_id, lender_id), (loan_id, loan[0])])
         connection.commit()
         cursor.close()
-        connection.close()
         
         return {"success": True, "message": "Préstamo actualizado exitosamente"}
         
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
     except Exception as e:
+        # Deshace lo escrito antes del fallo: la conexión vuelve al pool sin transacción abierta
+        if connection is not None:
+            connection.rollback()
         return {"success": False, "message": f"Error al actualizar préstamo: {str(e)}"}
+    finally:
+        if connection is not None:
+            connection.close()
 
+@traced
 def mark_loan_returned(loan_id: int, lender_id: int) -> Dict[str, Any]:
     """Marca un préstamo como devuelto"""
+    connection = None
     try:
         connection = get_db_connection()
         if not connection:
@@ -238,11 +372,10 @@ def mark_loan_returned(loan_id: int, lender_id: int) -> Dict[str, Any]:
         cursor = connection.cursor()
         
         # Verificar que el préstamo existe y pertenece al prestamista
-        cursor.execute("SELECT borrower_id FROM loans WHERE id = %s AND lender_id = %s", (loan_id, lender_id))
+        cursor.execute(LOAN_OWNER_QUERY, (loan_id, lender_id))
         loan = cursor.fetchone()
         if not loan:
             cursor.close()
-            connection.close()
             return {"success": False, "message": "Préstamo no encontrado o no autorizado"}
         
         borrower_id = loan[0]
@@ -254,29 +387,41 @@ def mark_loan_returned(loan_id: int, lender_id: int) -> Dict[str, Any]:
             WHERE id = %s
         """, (LoanStatus.RETURNED.value, date.today(), loan_id))
         
-        # Crear notificación para el prestatario
-        cursor.execute("""
-            INSERT INTO notifications (user_id, title, message, type, loan_id)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (
-            borrower_id,
-            "Préstamo marcado como devuelto",
-            f"El préstamo #{loan_id} ha sido marcado como devuelto",
-            NotificationType.SUCCESS.value,
-            loan_id
-        ))
+        record_changes(cursor, ENTITY_LOAN, OP_UPDATE, [(loan_id, lender_id), (loan_id, borrower_id)])
+        record_webhook_events(cursor, WebhookEvent.LOAN_RETURNED, [{
+            "id": loan_id, "lender_id": lender_id, "borrower_id": borrower_id,
+            "return_date": date.today(), "status": LoanStatus.RETURNED.value,
+        }])
+        
+        # Notificación para el prestatario: se encola en esta transacción
+        enqueue_notifications([NotificationCreate(
+            user_id=borrower_id,
+            title="Préstamo marcado como devuelto",
+            message=f"El préstamo #{loan_id} ha sido marcado como devuelto",
+            type=NotificationType.SUCCESS,
+            loan_id=loan_id
+        )], cursor=cursor)
         
         connection.commit()
         cursor.close()
-        connection.close()
         
         return {"success": True, "message": "Préstamo marcado como devuelto"}
         
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
     except Exception as e:
+        # Deshace lo escrito antes del fallo: la conexión vuelve al pool sin transacción abierta
+        if connection is not None:
+            connection.rollback()
         return {"success": False, "message": f"Error al marcar préstamo como devuelto: {str(e)}"}
+    finally:
+        if connection is not None:
+            connection.close()
 
+@traced
 def delete_loan(loan_id: int, lender_id: int) -> Dict[str, Any]:
     """Elimina un préstamo si pertenece al prestamista"""
+    connection = None
     try:
         connection = get_db_connection()
         if not connection:
@@ -285,23 +430,33 @@ def delete_loan(loan_id: int, lender_id: int) -> Dict[str, Any]:
         cursor = connection.cursor()
 
         # Comprobar propiedad
-        cursor.execute("SELECT id FROM loans WHERE id = %s AND lender_id = %s", (loan_id, lender_id))
-        if not cursor.fetchone():
+        cursor.execute(LOAN_OWNER_QUERY, (loan_id, lender_id))
+        loan = cursor.fetchone()
+        if not loan:
             cursor.close()
-            connection.close()
             return {"success": False, "message": "Préstamo no encontrado o no autorizado"}
 
         # Eliminar
         cursor.execute("DELETE FROM loans WHERE id = %s", (loan_id,))
+        record_changes(cursor, ENTITY_LOAN, OP_DELETE, [(loan_id, lender_id), (loan_id, loan[0])])
         connection.commit()
         cursor.close()
-        connection.close()
         return {"success": True, "message": "Préstamo eliminado"}
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
     except Exception as e:
+        # Deshace lo escrito antes del fallo: la conexión vuelve al pool sin transacción abierta
+        if connection is not None:
+            connection.rollback()
         return {"success": False, "message": f"Error al eliminar préstamo: {str(e)}"}
+    finally:
+        if connection is not None:
+            connection.close()
 
 
-def get_upcoming_loans(user_id: int, days: int = 3) -> Dict[str, List[Dict[str, Any]]]:
+@traced
+@retry_reads
+def get_upcoming_loans(user_id: int, days: int = UPCOMING_DAYS) -> Dict[str, List[Dict[str, Any]]]:
     """Devuelve préstamos que vencen pronto para prestatario y prestamista"""
     try:
         connection = get_db_connection()
@@ -313,86 +468,44 @@ def get_upcoming_loans(user_id: int, days: int = 3) -> Dict[str, List[Dict[str,
         end_date = today + timedelta(days=days)
 
         # Como prestamista
-        cursor.execute(
-            """
-            SELECT l.*, borrower.name AS borrower_name
-            FROM loans l
-            JOIN users borrower ON l.borrower_id = borrower.id
-            WHERE l.lender_id = %s
-              AND l.status = %s
-              AND l.due_date BETWEEN %s AND %s
-            ORDER BY l.due_date ASC
-            """,
-            (user_id, LoanStatus.ACTIVE.value, today, end_date),
-        )
+        cursor.execute(build_upcoming_query("lender"), (user_id, LoanStatus.ACTIVE.value, today, end_date))
         lender_loans = cursor.fetchall()
 
         # Como prestatario
-        cursor.execute(
-            """
-            SELECT l.*, lender.name AS lender_name
-            FROM loans l
-            JOIN users lender ON l.lender_id = lender.id
-            WHERE l.borrower_id = %s
-              AND l.status = %s
-              AND l.due_date BETWEEN %s AND %s
-            ORDER BY l.due_date ASC
-            """,
-            (user_id, LoanStatus.ACTIVE.value, today, end_date),
-        )
+        cursor.execute(build_upcoming_query("borrower"), (user_id, LoanStatus.ACTIVE.value, today, end_date))
         borrower_loans = cursor.fetchall()
 
         cursor.close()
         connection.close()
 
         return {
-            "as_lender": lender_loans,
-            "as_borrower": borrower_loans,
+            "as_lender": enrich_loan_names(lender_loans, lender=False),
+            "as_borrower": enrich_loan_names(borrower_loans, borrower=False),
         }
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
     except Exception as e:
-        print(f"Error al obtener préstamos próximos a vencer: {e}")
+        logger.error("Error al obtener préstamos próximos a vencer: %s", e, extra=log_fields(user_id=user_id, days=days))
         return {"as_lender": [], "as_borrower": []}
 
 
+@traced
+@retry_reads
 def get_loan_report_summary(user_id: int) -> Dict[str, Any]:
     """Devuelve métricas agregadas para reportes (prestamista y prestatario)"""
     try:
-        connection = get_db_connection()
+        connection = get_read_connection(user_id)
         if not connection:
             return {}
 
         cursor = connection.cursor(dictionary=True)
 
         # Totales como prestamista
-        cursor.execute(
-            """
-            SELECT
-                loan_type,
-                status,
-                COUNT(*) AS total_count,
-                COALESCE(SUM(CASE WHEN loan_type = 'money' THEN amount ELSE 0 END), 0) AS total_amount
-            FROM loans
-            WHERE lender_id = %s
-            GROUP BY loan_type, status
-            """,
-            (user_id,),
-        )
+        cursor.execute(build_report_query("lender"), (user_id,))
         lender_rows = cursor.fetchall()
 
         # Totales como prestatario
-        cursor.execute(
-            """
-            SELECT
-                loan_type,
-                status,
-                COUNT(*) AS total_count,
-                COALESCE(SUM(CASE WHEN loan_type = 'money' THEN amount ELSE 0 END), 0) AS total_amount
-            FROM loans
-            WHERE borrower_id = %s
-            GROUP BY loan_type, status
-            """,
-            (user_id,),
-        )
+        cursor.execute(build_report_query("borrower"), (user_id,))
         borrower_rows = cursor.fetchall()
 
         cursor.close()
@@ -427,14 +540,18 @@ def get_loan_report_summary(user_id: int) -> Dict[str, Any]:
             "as_lender": build_summary(lender_rows),
             "as_borrower": build_summary(borrower_rows),
         }
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
     except Exception as e:
-        print(f"Error al obtener resumen de reportes: {e}")
+        logger.error("Error al obtener resumen de reportes: %s", e, extra=log_fields(user_id=user_id))
         return {}
 
+@traced
+@retry_reads
 def get_loan_stats(user_id: int) -> LoanStats:
     """Obtiene estadísticas de préstamos de un usuario"""
     try:
-        connection = get_db_connection()
+        connection = get_read_connection(user_id)
         if not connection:
             return LoanStats(
                 total_active_loans=0, total_returned_loans=0, total_overdue_loans=0,
@@ -444,29 +561,11 @@ def get_loan_stats(user_id: int) -> LoanStats:
         cursor = connection.cursor()
         
         # Estadísticas como prestamista
-        cursor.execute("""
-            SELECT 
-                COUNT(CASE WHEN status = 'active' THEN 1 END) as active_lent,
-                COUNT(CASE WHEN status = 'returned' THEN 1 END) as returned_lent,
-                COUNT(CASE WHEN status = 'overdue' THEN 1 END) as overdue_lent,
-                COALESCE(SUM(CASE WHEN status = 'active' AND loan_type = 'money' THEN amount ELSE 0 END), 0) as pending_lent,
-                COALESCE(SUM(CASE WHEN status = 'returned' AND loan_type = 'money' THEN amount ELSE 0 END), 0) as returned_amount_lent
-            FROM loans WHERE lender_id = %s
-        """, (user_id,))
-        
+        cursor.execute(build_stats_query("lender"), (user_id,))
         lender_stats = cursor.fetchone()
         
         # Estadísticas como prestatario
-        cursor.execute("""
-            SELECT 
-                COUNT(CASE WHEN status = 'active' THEN 1 END) as active_borrowed,
-                COUNT(CASE WHEN status = 'returned' THEN 1 END) as returned_borrowed,
-                COUNT(CASE WHEN status = 'overdue' THEN 1 END) as overdue_borrowed,
-                COALESCE(SUM(CASE WHEN status = 'active' AND loan_type = 'money' THEN amount ELSE 0 END), 0) as pending_borrowed,
-                COALESCE(SUM(CASE WHEN status = 'returned' AND loan_type = 'money' THEN amount ELSE 0 END), 0) as returned_amount_borrowed
-            FROM loans WHERE borrower_id = %s
-        """, (user_id,))
-        
+        cursor.execute(build_stats_query("borrower"), (user_id,))
         borrower_stats = cursor.fetchone()
         
         cursor.close()
@@ -481,51 +580,132 @@ def get_loan_stats(user_id: int) -> LoanStats:
             pending_amount=(lender_stats[3] or 0) + (borrower_stats[3] or 0)
         )
         
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
     except Exception as e:
-        print(f"Error al obtener estadísticas: {e}")
+        logger.error("Error al obtener estadísticas: %s", e, extra=log_fields(user_id=user_id))
         return LoanStats(
             total_active_loans=0, total_returned_loans=0, total_overdue_loans=0,
             total_amount_lent=0.0, total_amount_returned=0.0, pending_amount=0.0
         )
 
-def get_overdue_loans(user_id: int) -> List[LoanResponse]:
-    """Obtiene préstamos vencidos de un usuario"""
+@traced
+@retry_reads
+def get_overdue_loans(user_id: int, fields: Optional[Set[str]] = None) -> List[LoanListItem]:
+    """Obtiene préstamos vencidos de un usuario
+
+    Solo lectura: el cambio de estado y el aviso al prestatario los hace
+    mark_overdue_loans (trabajo loans.mark_overdue) en una misma transacción.
+    Se listan tanto los ya marcados como los activos que el trabajo aún no ha visto.
+    """
     try:
-        connection = get_db_connection()
+        connection = get_read_connection(user_id)
         if not connection:
             return []
         
         cursor = connection.cursor(dictionary=True)
         
-        cursor.execute("""
-            SELECT l.*, 
-                   lender.name as lender_name,
-                   borrower.name as borrower_name
-            FROM loans l
-            JOIN users lender ON l.lender_id = lender.id
-            JOIN users borrower ON l.borrower_id = borrower.id
-            WHERE (l.lender_id = %s OR l.borrower_id = %s) 
-            AND l.status = 'active' 
-            AND l.due_date < %s
-            ORDER BY l.due_date ASC
-        """, (user_id, user_id, date.today()))
+        # La fecha de vencimiento hace falta para mezclar los resultados en orden
+        projection = None if fields is None else fields | {"due_date"}
         
-        loans = cursor.fetchall()
-        
-        # Actualizar estado a vencido
-        for loan in loans:
-            cursor.execute("UPDATE loans SET status = 'overdue' WHERE id = %s", (loan['id'],))
+        # Una consulta por rol y estado en lugar de (lender_id = %s OR borrower_id = %s):
+        # cada una recorre su índice (rol, status, due_date) ya ordenada, sin filesort
+        results = []
+        for role in ("lender", "borrower"):
+            for status in (LoanStatus.ACTIVE.value, LoanStatus.OVERDUE.value):
+                cursor.execute(build_overdue_query(role, projection), (user_id, status, date.today()))
+                results.append(cursor.fetchall())
         
-        connection.commit()
         cursor.close()
         connection.close()
         
-        return [LoanResponse(**loan) for loan in loans]
+        # Un préstamo a uno mismo aparece en los resultados de ambos roles
+        seen = set()
+        loans = []
+        for loan in heapq.merge(*results, key=lambda row: row['due_date']):
+            if loan['id'] not in seen:
+                seen.add(loan['id'])
+                loans.append(loan)
         
+        return build_loan_items(loans, fields)
+        
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
     except Exception as e:
-        print(f"Error al obtener préstamos vencidos: {e}")
+        logger.error("Error al obtener préstamos vencidos: %s", e, extra=log_fields(user_id=user_id))
         return []
 
+@traced
+def mark_overdue_loans(batch_size: int = 500) -> Dict[str, Any]:
+    """Pasa a vencidos todos los préstamos activos con la fecha cumplida y avisa al prestatario
+
+    Trabajo en segundo plano (loans.mark_overdue). Cada lote se confirma con sus
+    notificaciones en la misma transacción, así que repetirlo no duplica avisos.
+    """
+    try:
+        updated = 0
+        while True:
+            connection = get_db_connection()
+            if not connection:
+                return {"success": False, "message": "Error de conexión a la base de datos", "updated": updated}
+            
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute("""
+                SELECT id, lender_id, borrower_id, amount, object_name
+                FROM loans
+                WHERE status = 'active' AND due_date < %s
+                ORDER BY due_date
+                LIMIT %s
+                FOR UPDATE
+            """, (date.today(), batch_size))
+            loans = cursor.fetchall()
+            if not loans:
+                cursor.close()
+                connection.close()
+                break
+            
+            lenders = get_users_by_ids({loan['lender_id'] for loan in loans})
+            notifications = []
+            for loan in loans:
+                cursor.execute("UPDATE loans SET status = 'overdue' WHERE id = %s AND status = 'active'", (loan['id'],))
+                lender_name = lenders.get(loan['lender_id'], {}).get('name', loan['lender_id'])
+                notifications.append(NotificationCreate(
+                    user_id=loan['borrower_id'],
+                    title="Préstamo vencido",
+                    message=f"Tu préstamo de {lender_name} ha vencido. {'Monto: $' + str(loan['amount']) if loan['amount'] else 'Objeto: ' + str(loan['object_name'])}",
+                    type=NotificationType.WARNING,
+                    loan_id=loan['id']
+                ))
+            
+            # Ya es un trabajo en segundo plano: las notificaciones (y su registro de
+            # cambios) van en la misma transacción que el cambio de estado, en un solo INSERT
+            insert_notifications(cursor, notifications)
+            record_changes(
+                cursor, ENTITY_LOAN, OP_UPDATE,
+                [(loan['id'], loan['lender_id']) for loan in loans] +
+                [(loan['id'], loan['borrower_id']) for loan in loans]
+            )
+            record_webhook_events(
+                cursor, WebhookEvent.LOAN_OVERDUE,
+                [{**loan, "status": LoanStatus.OVERDUE.value} for loan in loans]
+            )
+            connection.commit()
+            cursor.close()
+            connection.close()
+            
+            updated += len(loans)
+            if len(loans) < batch_size:
+                break
+        
+        return {"success": True, "message": f"{updated} préstamos marcados como vencidos", "updated": updated}
+        
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
+    except Exception as e:
+        return {"success": False, "message": f"Error al marcar préstamos vencidos: {str(e)}"}
+
+@traced
+@retry_reads
 def get_all_users(search: Optional[str] = None) -> List[UserResponse]:
     """Obtiene todos los usuarios para selección en préstamos"""
     try:
@@ -553,6 +733,55 @@ def get_all_users(search: Optional[str] = None) -> List[UserResponse]:
         
         return [UserResponse(**user) for user in users]
         
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
     except Exception as e:
-        print(f"Error al obtener usuarios: {e}")
+        logger.error("Error al obtener usuarios: %s", e, extra=log_fields(search=search))
         return []
+
+
+@traced
+@retry_reads
+def get_loan_changes(user_id: int, since: Optional[int] = None) -> ChangeFeed:
+    """Devuelve los préstamos insertados, actualizados o eliminados desde el token"""
+    try:
+        connection = get_db_connection()
+        if not connection:
+            return ChangeFeed(changes=[], next_token=str(since or 0), reset=True)
+
+        cursor = connection.cursor(dictionary=True)
+        log = read_change_log(cursor, ENTITY_LOAN, user_id, since)
+
+        live_ids = [loan_id for loan_id, op in log["entries"] if op != OP_DELETE]
+        rows = []
+        if live_ids:
+            cursor.execute(
+                f"SELECT l.* FROM loans l WHERE l.id IN ({', '.join(['%s'] * len(live_ids))})",
+                live_ids
+            )
+            rows = cursor.fetchall()
+
+        cursor.close()
+        connection.close()
+
+        loans = {loan.id: loan for loan in build_loan_items(rows)}
+        changes = []
+        for loan_id, op in log["entries"]:
+            loan = loans.get(loan_id)
+            if op == OP_DELETE or loan is None:
+                changes.append(ChangeEntry(op=OP_DELETE, id=loan_id))
+            else:
+                changes.append(ChangeEntry(op=op, id=loan_id, data=loan))
+
+        return ChangeFeed(
+            changes=changes,
+            next_token=str(log["next_token"]),
+            has_more=log["has_more"],
+            reset=log["reset"],
+        )
+
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
+    except Exception as e:
+        logger.error("Error al obtener cambios de préstamos: %s", e, extra=log_fields(user_id=user_id, since=since))
+        return ChangeFeed(changes=[], next_token=str(since or 0), reset=True)
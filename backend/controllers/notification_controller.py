@@ -1,8 +1,105 @@
-from typing import List, Optional, Dict, Any
+import logging
+import os
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime
-from models.loan_models import NotificationCreate, NotificationResponse, NotificationType
-from lib.mysql_db import get_db_connection
+from models.loan_models import NotificationCreate, NotificationResponse, NotificationType, ChangeEntry, ChangeFeed
+from lib.mysql_db import get_db_connection, get_read_connection
+from lib.circuit_breaker import DatabaseUnavailableError, retry_reads
+from lib.deadlines import DeadlineExceededError
+from lib.tracing import traced
+from lib.structured_log import log_fields
+from lib.job_queue import enqueue
+from controllers.change_controller import (
+    record_changes, read_change_log, ENTITY_NOTIFICATION, OP_INSERT, OP_UPDATE, OP_DELETE
+)
 
+# Tarea que escribe las notificaciones automáticas y sus intentos: con la espera
+# exponencial de la cola aguanta caídas largas de la base de datos antes de darlas por perdidas
+NOTIFICATION_TASK = "notifications.write"
+NOTIFICATION_MAX_ATTEMPTS = int(os.environ.get("NOTIFICATION_MAX_ATTEMPTS", "20"))
+
+# Trabajos de notificaciones que el worker junta en un mismo INSERT de varias filas
+NOTIFICATION_BATCH_SIZE = int(os.environ.get("NOTIFICATION_BATCH_SIZE", "200"))
+
+# Contador de no leídas (índice idx_user_read_created)
+UNREAD_COUNT_QUERY = "SELECT COUNT(*) FROM notifications WHERE user_id = %s AND is_read = FALSE"
+
+logger = logging.getLogger("controllers.notifications")
+
+def _is_constraint_error(error: Exception) -> bool:
+    # MySQL: columna nula, duplicado o clave foránea; SQLite solo da el mensaje
+    return getattr(error, "errno", None) in (1048, 1062, 1452) or "constraint" in str(error).lower()
+
+def insert_notifications(cursor, notifications: List[NotificationCreate]) -> None:
+    placeholders = ", ".join(["(%s, %s, %s, %s, %s)"] * len(notifications))
+    params: List[Any] = []
+    for notification in notifications:
+        params.extend([
+            notification.user_id, notification.title, notification.message,
+            notification.type.value, notification.loan_id
+        ])
+    cursor.execute(
+        f"INSERT INTO notifications (user_id, title, message, type, loan_id) VALUES {placeholders}",
+        params,
+    )
+    # Los ids de un INSERT de varias filas son consecutivos a partir de lastrowid
+    first_id = cursor.lastrowid
+    record_changes(
+        cursor, ENTITY_NOTIFICATION, OP_INSERT,
+        [(first_id + offset, notification.user_id) for offset, notification in enumerate(notifications)]
+    )
+
+def enqueue_notifications(notifications: List[NotificationCreate], cursor=None) -> None:
+    """Encola la escritura de las notificaciones como un trabajo (tarea notifications.write)
+
+    Con cursor= el trabajo entra en la transacción del llamador: las notificaciones
+    existen si y solo si el cambio del préstamo se confirma.
+    """
+    enqueue(
+        NOTIFICATION_TASK,
+        {"notifications": [{**notification.dict(), "type": notification.type.value} for notification in notifications]},
+        max_attempts=NOTIFICATION_MAX_ATTEMPTS,
+        cursor=cursor,
+    )
+
+def write_notification_batch(notifications: List[NotificationCreate]) -> None:
+    """Inserta un lote de notificaciones con un solo INSERT de varias filas en una transacción
+
+    Si el lote falla por una fila (p. ej. el usuario o el préstamo ya no existe)
+    se repite fila a fila en la misma transacción y solo se descarta esa. Cualquier
+    otro error se propaga para que el trabajo se reintente sin escribir nada.
+    """
+    connection = get_db_connection()
+    if not connection:
+        raise DatabaseUnavailableError("Error de conexión a la base de datos")
+    try:
+        cursor = connection.cursor()
+        try:
+            insert_notifications(cursor, notifications)
+        except Exception as e:
+            if not _is_constraint_error(e):
+                raise
+            connection.rollback()
+            for notification in notifications:
+                try:
+                    insert_notifications(cursor, [notification])
+                except Exception as row_error:
+                    # Solo se deshace la sentencia fallida: las filas anteriores siguen en la transacción
+                    if not _is_constraint_error(row_error):
+                        raise
+                    logger.error(
+                        "Notificación descartada: %s", row_error,
+                        extra=log_fields(user_id=notification.user_id, loan_id=notification.loan_id),
+                    )
+        connection.commit()
+        cursor.close()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+@traced
 def create_notification(notification_data: NotificationCreate) -> Dict[str, Any]:
     """Crea una nueva notificación"""
     try:
@@ -32,40 +129,45 @@ def create_notification(notification_data: NotificationCreate) -> Dict[str, Any]
         ))
         
         notification_id = cursor.lastrowid
+        record_changes(cursor, ENTITY_NOTIFICATION, OP_INSERT, [(notification_id, notification_data.user_id)])
         connection.commit()
         cursor.close()
         connection.close()
         
         return {"success": True, "message": "Notificación creada exitosamente", "notification_id": notification_id}
         
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
     except Exception as e:
         return {"success": False, "message": f"Error al crear notificación: {str(e)}"}
 
+def build_notifications_query(user_id: int, limit: Optional[int] = None, unread_only: bool = False) -> Tuple[str, List[Any]]:
+    """SELECT y parámetros del listado de notificaciones de un usuario, de la más reciente a la más antigua"""
+    query = "SELECT * FROM notifications WHERE user_id = %s"
+    params: List[Any] = [user_id]
+    
+    if unread_only:
+        query += " AND is_read = FALSE"
+    
+    query += " ORDER BY created_at DESC"
+    
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
+    return query, params
+
+@traced
+@retry_reads
 def get_user_notifications(user_id: int, limit: Optional[int] = None, unread_only: bool = False) -> List[NotificationResponse]:
     """Obtiene las notificaciones de un usuario"""
     try:
-        connection = get_db_connection()
+        connection = get_read_connection(user_id)
         if not connection:
             return []
         
         cursor = connection.cursor(dictionary=True)
         
-        query = """
-            SELECT * FROM notifications 
-            WHERE user_id = %s
-        """
-        params = [user_id]
-        
-        if unread_only:
-            query += " AND is_read = FALSE"
-        
-        query += " ORDER BY created_at DESC"
-        
-        if limit:
-            query += " LIMIT %s"
-            params.append(limit)
-        
-        cursor.execute(query, params)
+        cursor.execute(*build_notifications_query(user_id, limit, unread_only))
         notifications = cursor.fetchall()
         
         cursor.close()
@@ -73,10 +175,13 @@ def get_user_notifications(user_id: int, limit: Optional[int] = None, unread_onl
         
         return [NotificationResponse(**notification) for notification in notifications]
         
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
     except Exception as e:
-        print(f"Error al obtener notificaciones: {e}")
+        logger.error("Error al obtener notificaciones: %s", e, extra=log_fields(user_id=user_id, unread_only=unread_only))
         return []
 
+@traced
 def mark_notification_as_read(notification_id: int, user_id: int) -> Dict[str, Any]:
     """Marca una notificación como leída"""
     try:
@@ -104,15 +209,19 @@ def mark_notification_as_read(notification_id: int, user_id: int) -> Dict[str, A
             WHERE id = %s
         """, (notification_id,))
         
+        record_changes(cursor, ENTITY_NOTIFICATION, OP_UPDATE, [(notification_id, user_id)])
         connection.commit()
         cursor.close()
         connection.close()
         
         return {"success": True, "message": "Notificación marcada como leída"}
         
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
     except Exception as e:
         return {"success": False, "message": f"Error al marcar notificación: {str(e)}"}
 
+@traced
 def mark_all_notifications_as_read(user_id: int) -> Dict[str, Any]:
     """Marca todas las notificaciones de un usuario como leídas"""
     try:
@@ -122,6 +231,14 @@ def mark_all_notifications_as_read(user_id: int) -> Dict[str, Any]:
         
         cursor = connection.cursor()
         
+        # Bloquear las no leídas para registrar exactamente las que cambian
+        cursor.execute("""
+            SELECT id FROM notifications 
+            WHERE user_id = %s AND is_read = FALSE
+            FOR UPDATE
+        """, (user_id,))
+        unread_ids = [row[0] for row in cursor.fetchall()]
+        
         cursor.execute("""
             UPDATE notifications 
             SET is_read = TRUE 
@@ -129,6 +246,7 @@ def mark_all_notifications_as_read(user_id: int) -> Dict[str, Any]:
         """, (user_id,))
         
         affected_rows = cursor.rowcount
+        record_changes(cursor, ENTITY_NOTIFICATION, OP_UPDATE, [(notification_id, user_id) for notification_id in unread_ids])
         connection.commit()
         cursor.close()
         connection.close()
@@ -138,9 +256,13 @@ def mark_all_notifications_as_read(user_id: int) -> Dict[str, Any]:
             "message": f"{affected_rows} notificaciones marcadas como leídas"
         }
         
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
     except Exception as e:
         return {"success": False, "message": f"Error al marcar notificaciones: {str(e)}"}
 
+@traced
+@retry_reads
 def get_unread_notifications_count(user_id: int) -> int:
     """Obtiene el número de notificaciones no leídas de un usuario"""
     try:
@@ -150,10 +272,7 @@ def get_unread_notifications_count(user_id: int) -> int:
         
         cursor = connection.cursor()
         
-        cursor.execute("""
-            SELECT COUNT(*) FROM notifications 
-            WHERE user_id = %s AND is_read = FALSE
-        """, (user_id,))
+        cursor.execute(UNREAD_COUNT_QUERY, (user_id,))
         
         count = cursor.fetchone()[0]
         cursor.close()
@@ -161,12 +280,63 @@ def get_unread_notifications_count(user_id: int) -> int:
         
         return count
         
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
     except Exception as e:
-        print(f"Error al obtener conteo de notificaciones: {e}")
+        logger.error("Error al obtener conteo de notificaciones: %s", e, extra=log_fields(user_id=user_id))
         return 0
 
-def create_loan_notifications(loan_id: int, lender_id: int, borrower_id: int, loan_type: str, amount: Optional[float] = None, object_name: Optional[str] = None) -> Dict[str, Any]:
-    """Crea notificaciones automáticas para un préstamo"""
+@traced
+@retry_reads
+def get_notification_changes(user_id: int, since: Optional[int] = None) -> ChangeFeed:
+    """Devuelve las notificaciones nuevas, actualizadas o eliminadas desde el token"""
+    try:
+        connection = get_db_connection()
+        if not connection:
+            return ChangeFeed(changes=[], next_token=str(since or 0), reset=True)
+        
+        cursor = connection.cursor(dictionary=True)
+        log = read_change_log(cursor, ENTITY_NOTIFICATION, user_id, since)
+        
+        live_ids = [notification_id for notification_id, op in log["entries"] if op != OP_DELETE]
+        notifications = {}
+        if live_ids:
+            cursor.execute(
+                f"SELECT * FROM notifications WHERE user_id = %s AND id IN ({', '.join(['%s'] * len(live_ids))})",
+                [user_id] + live_ids
+            )
+            notifications = {row["id"]: NotificationResponse(**row) for row in cursor.fetchall()}
+        
+        cursor.close()
+        connection.close()
+        
+        changes = []
+        for notification_id, op in log["entries"]:
+            notification = notifications.get(notification_id)
+            if op == OP_DELETE or notification is None:
+                changes.append(ChangeEntry(op=OP_DELETE, id=notification_id))
+            else:
+                changes.append(ChangeEntry(op=op, id=notification_id, data=notification))
+        
+        return ChangeFeed(
+            changes=changes,
+            next_token=str(log["next_token"]),
+            has_more=log["has_more"],
+            reset=log["reset"],
+        )
+        
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
+    except Exception as e:
+        logger.error("Error al obtener cambios de notificaciones: %s", e, extra=log_fields(user_id=user_id, since=since))
+        return ChangeFeed(changes=[], next_token=str(since or 0), reset=True)
+
+@traced
+def create_loan_notifications(loan_id: int, lender_id: int, borrower_id: int, loan_type: str, amount: Optional[float] = None, object_name: Optional[str] = None, cursor=None) -> Dict[str, Any]:
+    """Crea notificaciones automáticas para un préstamo
+
+    Con cursor= se encolan en la transacción del préstamo y un error la deshace entera.
+    """
     try:
         # Notificación para el prestatario
         borrower_notification = NotificationCreate(
@@ -186,19 +356,19 @@ def create_loan_notifications(loan_id: int, lender_id: int, borrower_id: int, lo
             loan_id=loan_id
         )
         
-        # Crear ambas notificaciones
-        borrower_result = create_notification(borrower_notification)
-        lender_result = create_notification(lender_notification)
-        
-        if borrower_result["success"] and lender_result["success"]:
-            return {"success": True, "message": "Notificaciones creadas exitosamente"}
-        else:
-            return {"success": False, "message": "Error al crear algunas notificaciones"}
+        # Las escribe el worker de trabajos con un solo INSERT, fuera del tiempo de respuesta
+        enqueue_notifications([borrower_notification, lender_notification], cursor=cursor)
+        return {"success": True, "message": "Notificaciones encoladas"}
             
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
     except Exception as e:
+        if cursor is not None:
+            raise
         return {"success": False, "message": f"Error al crear notificaciones: {str(e)}"}
 
-def create_overdue_notification(loan_id: int, borrower_id: int, lender_name: str, object_name: Optional[str] = None, amount: Optional[float] = None) -> Dict[str, Any]:
+@traced
+def create_overdue_notification(loan_id: int, borrower_id: int, lender_name: str, object_name: Optional[str] = None, amount: Optional[float] = None, cursor=None) -> Dict[str, Any]:
     """Crea una notificación de préstamo vencido"""
     try:
         notification = NotificationCreate(
@@ -209,12 +379,18 @@ def create_overdue_notification(loan_id: int, borrower_id: int, lender_name: str
             loan_id=loan_id
         )
         
-        return create_notification(notification)
+        enqueue_notifications([notification], cursor=cursor)
+        return {"success": True, "message": "Notificación encolada"}
         
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
     except Exception as e:
+        if cursor is not None:
+            raise
         return {"success": False, "message": f"Error al crear notificación de vencimiento: {str(e)}"}
 
-def create_return_notification(loan_id: int, lender_id: int, borrower_name: str, object_name: Optional[str] = None, amount: Optional[float] = None) -> Dict[str, Any]:
+@traced
+def create_return_notification(loan_id: int, lender_id: int, borrower_name: str, object_name: Optional[str] = None, amount: Optional[float] = None, cursor=None) -> Dict[str, Any]:
     """Crea una notificación de préstamo devuelto"""
     try:
         notification = NotificationCreate(
@@ -225,7 +401,12 @@ def create_return_notification(loan_id: int, lender_id: int, borrower_name: str,
             loan_id=loan_id
         )
         
-        return create_notification(notification)
+        enqueue_notifications([notification], cursor=cursor)
+        return {"success": True, "message": "Notificación encolada"}
         
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
     except Exception as e:
+        if cursor is not None:
+            raise
         return {"success": False, "message": f"Error al crear notificación de devolución: {str(e)}"}
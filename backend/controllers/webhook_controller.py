@@ -0,0 +1,402 @@
+import asyncio
+import json
+import logging
+import os
+import secrets
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional
+from models.loan_models import WebhookCreate, WebhookSubscription, WebhookDeadLetter, WebhookEvent
+from lib.mysql_db import get_db_connection
+from lib.circuit_breaker import DatabaseUnavailableError
+from lib.deadlines import DeadlineExceededError
+from lib.tracing import traced
+from lib.structured_log import log_fields
+from lib.webhooks import DeliveryResult, WebhookSender, WEBHOOK_MAX_ATTEMPTS, is_public_url, retry_delay
+
+logger = logging.getLogger("controllers.webhooks")
+
+# Eventos por envío: los de un mismo suscriptor se agrupan en una sola petición
+WEBHOOK_BATCH_SIZE = int(os.environ.get("WEBHOOK_BATCH_SIZE", "50"))
+
+# Envíos reservados por ronda y segundos que quedan ocultos a otros workers mientras tanto
+WEBHOOK_CLAIM_BATCH = int(os.environ.get("WEBHOOK_CLAIM_BATCH", "100"))
+WEBHOOK_LOCK_SECONDS = float(os.environ.get("WEBHOOK_LOCK_SECONDS", "120"))
+
+# Días que se conservan los envíos entregados (los fallidos se guardan hasta reintentarlos o borrar la suscripción)
+WEBHOOK_RETENTION_DAYS = float(os.environ.get("WEBHOOK_RETENTION_DAYS", "7"))
+
+# Suscripciones por usuario como máximo
+WEBHOOK_MAX_SUBSCRIPTIONS = int(os.environ.get("WEBHOOK_MAX_SUBSCRIPTIONS", "10"))
+
+def _loan_event_data(loan: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        key: loan.get(key) for key in (
+            "id", "lender_id", "borrower_id", "loan_type", "amount", "object_name",
+            "loan_date", "due_date", "return_date", "status",
+        ) if key in loan
+    }
+
+def record_webhook_events(cursor, event: WebhookEvent, loans: Iterable[Dict[str, Any]]) -> None:
+    """Registra eventos de préstamos para prestamista y prestatario en la transacción en curso
+
+    Solo es un INSERT en la tabla de salida; el reparto a los suscriptores y el
+    envío los hace la tarea webhooks.dispatch.
+    """
+    rows = []
+    for loan in loans:
+        payload = json.dumps({"type": event.value, "data": _loan_event_data(loan)}, default=str, separators=(",", ":"))
+        for user_id in dict.fromkeys((loan["lender_id"], loan["borrower_id"])):
+            rows.append((user_id, event.value, payload))
+    if not rows:
+        return
+    placeholders = ", ".join(["(%s, %s, %s)"] * len(rows))
+    cursor.execute(
+        f"INSERT INTO webhook_events (user_id, event, payload) VALUES {placeholders}",
+        [value for row in rows for value in row],
+    )
+
+def _subscription(row: Dict[str, Any]) -> WebhookSubscription:
+    return WebhookSubscription(
+        id=row['id'],
+        url=row['url'],
+        events=row['events'].split(",") if row['events'] else [event.value for event in WebhookEvent],
+        active=bool(row['active']),
+        created_at=str(row['created_at'])
+    )
+
+@traced
+def create_subscription(user_id: int, data: WebhookCreate) -> Dict[str, Any]:
+    """Crea una suscripción y devuelve su secreto de firma (solo esta vez)"""
+    try:
+        if not is_public_url(data.url):
+            return {"success": False, "message": "La URL debe apuntar a un host público"}
+
+        connection = get_db_connection()
+        if not connection:
+            return {"success": False, "message": "Error de conexión a la base de datos"}
+
+        cursor = connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM webhook_subscriptions WHERE user_id = %s", (user_id,))
+        if cursor.fetchone()[0] >= WEBHOOK_MAX_SUBSCRIPTIONS:
+            cursor.close()
+            connection.close()
+            return {"success": False, "message": f"Máximo de {WEBHOOK_MAX_SUBSCRIPTIONS} suscripciones por usuario"}
+
+        secret = secrets.token_urlsafe(32)
+        events = ",".join(sorted({event.value for event in data.events})) if data.events else None
+        cursor.execute(
+            "INSERT INTO webhook_subscriptions (user_id, url, secret, events) VALUES (%s, %s, %s, %s)",
+            (user_id, data.url, secret, events)
+        )
+        subscription_id = cursor.lastrowid
+        connection.commit()
+        cursor.close()
+        connection.close()
+
+        return {"success": True, "message": "Suscripción creada", "id": subscription_id, "secret": secret}
+
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
+    except Exception as e:
+        return {"success": False, "message": f"Error al crear la suscripción: {str(e)}"}
+
+@traced
+def get_subscriptions(user_id: int) -> List[WebhookSubscription]:
+    """Lista las suscripciones del usuario (sin su secreto)"""
+    try:
+        connection = get_db_connection()
+        if not connection:
+            return []
+
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(
+            "SELECT id, url, events, active, created_at FROM webhook_subscriptions WHERE user_id = %s ORDER BY id",
+            (user_id,)
+        )
+        rows = cursor.fetchall()
+        cursor.close()
+        connection.close()
+
+        return [_subscription(row) for row in rows]
+
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
+    except Exception as e:
+        logger.error("Error al obtener suscripciones: %s", e, extra=log_fields(user_id=user_id))
+        return []
+
+@traced
+def delete_subscription(subscription_id: int, user_id: int) -> Dict[str, Any]:
+    """Elimina una suscripción del usuario junto con sus envíos"""
+    try:
+        connection = get_db_connection()
+        if not connection:
+            return {"success": False, "message": "Error de conexión a la base de datos"}
+
+        cursor = connection.cursor()
+        cursor.execute("DELETE FROM webhook_subscriptions WHERE id = %s AND user_id = %s", (subscription_id, user_id))
+        deleted = cursor.rowcount
+        connection.commit()
+        cursor.close()
+        connection.close()
+
+        if not deleted:
+            return {"success": False, "message": "Suscripción no encontrada"}
+        return {"success": True, "message": "Suscripción eliminada"}
+
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
+    except Exception as e:
+        return {"success": False, "message": f"Error al eliminar la suscripción: {str(e)}"}
+
+@traced
+def get_dead_letters(user_id: int, limit: int = 50) -> List[WebhookDeadLetter]:
+    """Envíos que agotaron sus intentos, los más recientes primero"""
+    try:
+        connection = get_db_connection()
+        if not connection:
+            return []
+
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT d.id, d.subscription_id, s.url, d.payload, d.attempts, d.last_status, d.last_error, d.created_at
+            FROM webhook_deliveries d
+            JOIN webhook_subscriptions s ON s.id = d.subscription_id
+            WHERE s.user_id = %s AND d.status = 'dead'
+            ORDER BY d.id DESC
+            LIMIT %s
+        """, (user_id, limit))
+        rows = cursor.fetchall()
+        cursor.close()
+        connection.close()
+
+        return [
+            WebhookDeadLetter(
+                id=row['id'],
+                subscription_id=row['subscription_id'],
+                url=row['url'],
+                events=len(json.loads(row['payload'])),
+                attempts=row['attempts'],
+                last_status=row['last_status'],
+                last_error=row['last_error'],
+                created_at=str(row['created_at'])
+            )
+            for row in rows
+        ]
+
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
+    except Exception as e:
+        logger.error("Error al obtener envíos fallidos: %s", e, extra=log_fields(user_id=user_id))
+        return []
+
+@traced
+def retry_dead_letter(delivery_id: int, user_id: int) -> Dict[str, Any]:
+    """Devuelve un envío fallido a la cola con los intentos a cero"""
+    try:
+        connection = get_db_connection()
+        if not connection:
+            return {"success": False, "message": "Error de conexión a la base de datos"}
+
+        cursor = connection.cursor()
+        cursor.execute("""
+            UPDATE webhook_deliveries
+            SET status = 'pending', attempts = 0, next_attempt_at = %s, last_error = NULL
+            WHERE id = %s AND status = 'dead'
+            AND subscription_id IN (SELECT id FROM webhook_subscriptions WHERE user_id = %s)
+        """, (time.time(), delivery_id, user_id))
+        updated = cursor.rowcount
+        connection.commit()
+        cursor.close()
+        connection.close()
+
+        if not updated:
+            return {"success": False, "message": "Envío fallido no encontrado"}
+        return {"success": True, "message": "Envío reprogramado"}
+
+    except (DatabaseUnavailableError, DeadlineExceededError):
+        raise
+    except Exception as e:
+        return {"success": False, "message": f"Error al reprogramar el envío: {str(e)}"}
+
+def fan_out_webhook_events(limit: int = 1000) -> int:
+    """Reparte los eventos pendientes en envíos por suscriptor (lotes de WEBHOOK_BATCH_SIZE)
+
+    Los eventos de usuarios sin suscripciones se descartan. Devuelve cuántos
+    eventos se procesaron.
+    """
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(
+            "SELECT id, user_id, event, payload, created_at FROM webhook_events ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED",
+            (limit,)
+        )
+        events = cursor.fetchall()
+        if not events:
+            connection.commit()
+            cursor.close()
+            return 0
+
+        # Se borran antes de crear los envíos: si otro dispatcher ya se llevó alguno
+        # (SQLite no tiene SKIP LOCKED) se deshace todo y no se reparte dos veces
+        ids = [event['id'] for event in events]
+        cursor.execute(f"DELETE FROM webhook_events WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+        if cursor.rowcount != len(ids):
+            connection.rollback()
+            cursor.close()
+            return 0
+
+        user_ids = list({event['user_id'] for event in events})
+        cursor.execute(
+            f"SELECT id, user_id, events FROM webhook_subscriptions WHERE active = TRUE AND user_id IN ({', '.join(['%s'] * len(user_ids))})",
+            user_ids
+        )
+        subscriptions = cursor.fetchall()
+
+        now = time.time()
+        deliveries = []
+        for subscription in subscriptions:
+            wanted = set(subscription['events'].split(",")) if subscription['events'] else None
+            matching = [
+                {"id": event['id'], "created_at": str(event['created_at']), **json.loads(event['payload'])}
+                for event in events
+                if event['user_id'] == subscription['user_id'] and (wanted is None or event['event'] in wanted)
+            ]
+            for start in range(0, len(matching), WEBHOOK_BATCH_SIZE):
+                batch = matching[start:start + WEBHOOK_BATCH_SIZE]
+                deliveries.append((subscription['id'], json.dumps(batch, separators=(",", ":")), now))
+
+        if deliveries:
+            cursor.execute(
+                "INSERT INTO webhook_deliveries (subscription_id, payload, next_attempt_at) VALUES "
+                + ", ".join(["(%s, %s, %s)"] * len(deliveries)),
+                [value for delivery in deliveries for value in delivery]
+            )
+        connection.commit()
+        cursor.close()
+        return len(events)
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+def claim_deliveries(limit: int = WEBHOOK_CLAIM_BATCH) -> List[Dict[str, Any]]:
+    """Reserva envíos pendientes ya vencidos (mismo esquema que la cola de trabajos)"""
+    now = time.time()
+    lock = uuid.uuid4().hex
+    free = "status = 'pending' AND next_attempt_at <= %s AND (locked_until IS NULL OR locked_until < %s)"
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(
+            f"SELECT id FROM webhook_deliveries WHERE {free} ORDER BY next_attempt_at LIMIT %s FOR UPDATE SKIP LOCKED",
+            (now, now, limit)
+        )
+        ids = [row['id'] for row in cursor.fetchall()]
+        deliveries: List[Dict[str, Any]] = []
+        if ids:
+            id_marks = ", ".join(["%s"] * len(ids))
+            cursor.execute(
+                f"""
+                UPDATE webhook_deliveries SET locked_by = %s, locked_until = %s, attempts = attempts + 1
+                WHERE id IN ({id_marks}) AND {free}
+                """,
+                (lock, now + WEBHOOK_LOCK_SECONDS, *ids, now, now)
+            )
+            cursor.execute(f"""
+                SELECT d.id, d.payload, d.attempts, d.locked_by, s.url, s.secret
+                FROM webhook_deliveries d
+                JOIN webhook_subscriptions s ON s.id = d.subscription_id
+                WHERE d.id IN ({id_marks}) AND d.locked_by = %s
+            """, (*ids, lock))
+            deliveries = cursor.fetchall()
+        connection.commit()
+        cursor.close()
+        return deliveries
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+def record_delivery_results(deliveries: List[Dict[str, Any]], results: List[DeliveryResult]) -> None:
+    """Marca cada envío como entregado, lo reprograma con espera o lo pasa a 'dead'"""
+    attempts = {delivery['id']: delivery['attempts'] for delivery in deliveries}
+    # Solo se actualizan los envíos que siguen reservados por esta ronda
+    locks = {delivery['id']: delivery['locked_by'] for delivery in deliveries}
+    now = time.time()
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor()
+        for result in results:
+            if result.ok:
+                cursor.execute("""
+                    UPDATE webhook_deliveries
+                    SET status = 'delivered', delivered_at = %s, last_status = %s, last_error = NULL,
+                        locked_by = NULL, locked_until = NULL
+                    WHERE id = %s AND locked_by = %s
+                """, (now, result.status, result.delivery_id, locks[result.delivery_id]))
+            elif attempts[result.delivery_id] >= WEBHOOK_MAX_ATTEMPTS:
+                cursor.execute("""
+                    UPDATE webhook_deliveries
+                    SET status = 'dead', last_status = %s, last_error = %s, locked_by = NULL, locked_until = NULL
+                    WHERE id = %s AND locked_by = %s
+                """, (result.status, result.error, result.delivery_id, locks[result.delivery_id]))
+            else:
+                cursor.execute("""
+                    UPDATE webhook_deliveries
+                    SET next_attempt_at = %s, last_status = %s, last_error = %s, locked_by = NULL, locked_until = NULL
+                    WHERE id = %s AND locked_by = %s
+                """, (
+                    now + retry_delay(attempts[result.delivery_id]), result.status, result.error,
+                    result.delivery_id, locks[result.delivery_id]
+                ))
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+
+def prune_webhook_deliveries(batch_size: int = 1000) -> int:
+    """Borra los envíos entregados más antiguos que WEBHOOK_RETENTION_DAYS"""
+    cutoff = time.time() - WEBHOOK_RETENTION_DAYS * 86400
+    deleted = 0
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor()
+        while True:
+            cursor.execute(
+                "SELECT id FROM webhook_deliveries WHERE status = 'delivered' AND delivered_at < %s LIMIT %s",
+                (cutoff, batch_size)
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                break
+            cursor.execute(f"DELETE FROM webhook_deliveries WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+            connection.commit()
+            deleted += len(ids)
+        cursor.close()
+    finally:
+        connection.close()
+    return deleted
+
+def dispatch_webhooks(budget: float, sender: Optional[WebhookSender] = None) -> Dict[str, int]:
+    """Reparte los eventos pendientes y envía los lotes vencidos durante `budget` segundos como mucho"""
+    sender = sender or WebhookSender()
+    until = time.monotonic() + budget
+    counts = {"events": 0, "delivered": 0, "failed": 0}
+    while time.monotonic() < until:
+        fanned_out = fan_out_webhook_events()
+        counts["events"] += fanned_out
+        deliveries = claim_deliveries()
+        if deliveries:
+            results = asyncio.run(sender.send_all(deliveries))
+            record_delivery_results(deliveries, results)
+            delivered = sum(1 for result in results if result.ok)
+            counts["delivered"] += delivered
+            counts["failed"] += len(results) - delivered
+        elif not fanned_out:
+            break
+    return counts
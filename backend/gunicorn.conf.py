@@ -0,0 +1,34 @@
+# Modo de producción (desde backend/):
+#     gunicorn -c gunicorn.conf.py app:app
+# Recarga ordenada del código: kill -HUP <pid del master>
+import os
+import shutil
+
+from lib.server import (
+    WEB_HOST, WEB_PORT, WEB_WORKERS, KEEPALIVE_SECONDS, GRACEFUL_TIMEOUT,
+    MAX_REQUESTS, MAX_REQUESTS_JITTER,
+)
+
+bind = f"{WEB_HOST}:{WEB_PORT}"
+workers = WEB_WORKERS
+worker_class = "lib.server.LoanUvicornWorker"
+keepalive = KEEPALIVE_SECONDS
+graceful_timeout = GRACEFUL_TIMEOUT
+timeout = GRACEFUL_TIMEOUT + 30
+max_requests = MAX_REQUESTS
+max_requests_jitter = MAX_REQUESTS_JITTER
+accesslog = "-"
+
+
+def on_starting(server):
+    # Las métricas de Prometheus de varios procesos se agregan en este directorio
+    multiproc_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
+        os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1 @@
+# Paquete jobs: cola de trabajos en segundo plano, sus tareas y el worker (python -m jobs)
@@ -0,0 +1,108 @@
+"""Cola de trabajos en segundo plano.
+
+Uso (desde backend/):
+    python -m jobs work --processes 2 --concurrency 4 --batch 10
+    python -m jobs enqueue loans.mark_overdue --payload '{"batch_size": 200}' --delay 60
+    python -m jobs stats
+
+Con --sqlite se usa un fichero SQLite (despliegues de un solo nodo) en lugar de
+la base de datos MySQL configurada en lib/mysql_db.py.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m jobs", description="Cola de trabajos del sistema de préstamos")
+    parser.add_argument("--sqlite", metavar="PATH", help="Usar un fichero SQLite como sustituto de MySQL")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    work = commands.add_parser("work", help="Arranca los workers")
+    work.add_argument("--queues", default="default", help="Colas separadas por comas")
+    # Por defecto los mismos valores con los que la web descuenta sus conexiones (JOB_PROCESSES, JOB_CONCURRENCY)
+    work.add_argument("--processes", type=int, default=int(os.environ.get("JOB_PROCESSES", "1")), help="Procesos worker")
+    work.add_argument(
+        "--concurrency", type=int, default=int(os.environ.get("JOB_CONCURRENCY", "4")), help="Trabajos simultáneos por proceso"
+    )
+    work.add_argument("--batch", type=int, default=10, help="Trabajos reservados por consulta")
+
+    enqueue = commands.add_parser("enqueue", help="Encola un trabajo")
+    enqueue.add_argument("task", help="Nombre de la tarea")
+    enqueue.add_argument("--payload", default="{}", help="Payload en JSON")
+    enqueue.add_argument("--queue", default="default")
+    enqueue.add_argument("--delay", type=float, default=0.0, help="Segundos hasta que se pueda ejecutar")
+
+    commands.add_parser("stats", help="Trabajos por cola y estado")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    # El motor de base de datos se elige al importar lib.mysql_db
+    if args.sqlite:
+        os.environ["DB_BACKEND"] = "sqlite"
+        os.environ["SQLITE_PATH"] = args.sqlite
+
+    if args.command == "work":
+        from lib.db_pool import job_pool_size
+
+        # El pool de cada proceso se dimensiona por sus hilos, no por el reparto de los workers web
+        os.environ["DB_POOL_SIZE"] = str(job_pool_size(args.concurrency))
+
+    from lib.mysql_db import JOB_CONNECTIONS, DB_POOL_SIZE, init_database
+
+    if args.command == "work" and args.processes * DB_POOL_SIZE > JOB_CONNECTIONS:
+        print(
+            f"Aviso: {args.processes} procesos x {DB_POOL_SIZE} conexiones superan las {JOB_CONNECTIONS} que los "
+            "workers web dejan para trabajos; usa los mismos JOB_PROCESSES y JOB_CONCURRENCY en la web",
+            file=sys.stderr,
+        )
+
+    if not init_database():
+        print("No se pudo inicializar la base de datos", file=sys.stderr)
+        return 2
+
+    if args.command == "enqueue":
+        from lib.job_queue import enqueue
+
+        job_id = enqueue(args.task, json.loads(args.payload), queue=args.queue, delay=args.delay)
+        print(json.dumps({"job_id": job_id}))
+        return 0
+
+    if args.command == "stats":
+        from lib.job_queue import queue_stats
+
+        print(json.dumps(queue_stats(), indent=2, default=str))
+        return 0
+
+    from jobs.worker import run_worker
+
+    queues = [queue.strip() for queue in args.queues.split(",") if queue.strip()]
+    if args.processes <= 1:
+        run_worker(queues, args.concurrency, args.batch)
+        return 0
+
+    # spawn: cada proceso abre su propio pool en lugar de heredar las conexiones del padre
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_worker, args=(queues, args.concurrency, args.batch), name=f"jobs-worker-{number}")
+        for number in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # Los hijos reciben también Ctrl+C y terminan sus trabajos en curso
+        for process in processes:
+            process.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
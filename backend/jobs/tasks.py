@@ -0,0 +1,74 @@
+import logging
+import os
+
+from pydantic import ValidationError
+
+from controllers.change_controller import prune_change_log
+from controllers.loan_controller import mark_overdue_loans
+from controllers.notification_controller import NOTIFICATION_BATCH_SIZE, NOTIFICATION_TASK, write_notification_batch
+from controllers.webhook_controller import dispatch_webhooks, prune_webhook_deliveries
+from jobs.worker import batch_task, recurring, task
+from lib.job_queue import prune_finished
+from lib.sessions import prune_revoked_tokens
+from lib.structured_log import log_fields
+from models.loan_models import NotificationCreate
+
+# Cada cuántos segundos se buscan préstamos vencidos
+JOB_OVERDUE_INTERVAL = float(os.environ.get("JOB_OVERDUE_INTERVAL", "600"))
+
+# Cada cuántos segundos se borran los trabajos terminados antiguos
+JOB_PRUNE_INTERVAL = float(os.environ.get("JOB_PRUNE_INTERVAL", "3600"))
+
+# Cada cuántos segundos se envían los webhooks pendientes; cada ejecución trabaja como mucho ese tiempo
+WEBHOOK_DISPATCH_INTERVAL = float(os.environ.get("WEBHOOK_DISPATCH_INTERVAL", "5"))
+
+logger = logging.getLogger("jobs.tasks")
+
+
+@task("loans.mark_overdue")
+def mark_overdue(payload):
+    """Pasa a vencidos los préstamos con la fecha cumplida y avisa a los prestatarios"""
+    result = mark_overdue_loans(payload.get("batch_size", 500))
+    if not result["success"]:
+        raise RuntimeError(result["message"])
+    logger.info(result["message"], extra=log_fields(updated=result["updated"]))
+
+
+@batch_task(NOTIFICATION_TASK, NOTIFICATION_BATCH_SIZE)
+def write_notifications(payloads):
+    """Escribe con un solo INSERT las notificaciones que dejaron encoladas varias transacciones de préstamos"""
+    notifications = []
+    for payload in payloads:
+        try:
+            notifications.extend(NotificationCreate(**notification) for notification in payload["notifications"])
+        except (KeyError, TypeError, ValidationError) as e:
+            # Nunca se podrá escribir: no se reintenta el lote entero por él
+            logger.error("Trabajo de notificaciones mal formado: %s", e)
+    if notifications:
+        write_notification_batch(notifications)
+
+
+@task("jobs.prune")
+def prune(payload):
+    """Borra los trabajos terminados, los webhooks entregados, el registro de cambios y los tokens revocados que superaron la retención"""
+    deleted = prune_finished()
+    logger.info("Trabajos antiguos borrados", extra=log_fields(deleted=deleted))
+    deleted = prune_webhook_deliveries()
+    logger.info("Envíos de webhooks antiguos borrados", extra=log_fields(deleted=deleted))
+    deleted = prune_change_log()
+    logger.info("Registro de cambios antiguo borrado", extra=log_fields(deleted=deleted))
+    deleted = prune_revoked_tokens()
+    logger.info("Tokens revocados ya caducados borrados", extra=log_fields(deleted=deleted))
+
+
+@task("webhooks.dispatch")
+def dispatch(payload):
+    """Reparte los eventos de préstamos a los suscriptores y envía los lotes pendientes"""
+    counts = dispatch_webhooks(payload.get("budget", WEBHOOK_DISPATCH_INTERVAL))
+    if any(counts.values()):
+        logger.info("Webhooks enviados", extra=log_fields(**counts))
+
+
+recurring("loans.mark_overdue", JOB_OVERDUE_INTERVAL)
+recurring("jobs.prune", JOB_PRUNE_INTERVAL)
+recurring("webhooks.dispatch", WEBHOOK_DISPATCH_INTERVAL)
@@ -0,0 +1,230 @@
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from lib.job_queue import DEFAULT_QUEUE, Job, claim, complete, complete_many, enqueue, fail
+from lib.structured_log import log_fields
+
+# Espera entre consultas a la cola cuando no hay trabajos pendientes
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "1"))
+
+logger = logging.getLogger("jobs.worker")
+
+# Funciones de cada tarea: reciben el payload del trabajo
+TASKS: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+
+
+class BatchTask(NamedTuple):
+    handler: Callable[[List[Dict[str, Any]]], Any]
+    size: int
+
+
+# Tareas por lotes: reciben los payloads de todos los trabajos reservados de esa tarea
+BATCH_TASKS: Dict[str, BatchTask] = {}
+
+
+class Recurring(NamedTuple):
+    task: str
+    interval: float
+    payload: Optional[Dict[str, Any]]
+    queue: str
+
+
+RECURRING: List[Recurring] = []
+
+
+def task(name: str):
+    """Registra una función como tarea; debe ser idempotente (la entrega es al menos una vez)"""
+    def register(func: Callable[[Dict[str, Any]], Any]):
+        TASKS[name] = func
+        return func
+    return register
+
+
+def batch_task(name: str, size: int):
+    """Registra una tarea que se ejecuta por lotes de hasta `size` trabajos
+
+    El lote entero se confirma o se reintenta junto, así que la función debe ser
+    idempotente para todos sus payloads.
+    """
+    def register(func: Callable[[List[Dict[str, Any]]], Any]):
+        BATCH_TASKS[name] = BatchTask(func, size)
+        return func
+    return register
+
+
+def recurring(task_name: str, interval: float, payload: Optional[Dict[str, Any]] = None, queue: str = DEFAULT_QUEUE) -> None:
+    """Programa la tarea cada `interval` segundos (una sola vez por intervalo entre todos los workers)"""
+    RECURRING.append(Recurring(task_name, interval, payload, queue))
+
+
+class Worker:
+    """Reserva trabajos por lotes y los ejecuta en un pool de hilos
+
+    Cada hilo libre admite un trabajo más: se reservan como mucho tantos como
+    hilos libres y se vuelve a consultar enseguida si el lote llegó lleno. Los
+    trabajos de una tarea por lotes ocupan un solo hilo entre todos.
+    """
+
+    def __init__(self, queues: Sequence[str], concurrency: int = 4, batch_size: int = 10, poll_interval: float = JOB_POLL_INTERVAL):
+        self.queues = list(queues)
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="job")
+        self._free = concurrency
+        self._free_lock = threading.Lock()
+        self._stopping = threading.Event()
+        # Último intervalo programado de cada tarea recurrente en este proceso
+        self._scheduled: Dict[str, int] = {}
+
+    def stop(self, *_) -> None:
+        self._stopping.set()
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        logger.info("Worker iniciado", extra=log_fields(worker=self.worker_id, queues=self.queues, concurrency=self.concurrency))
+
+        failures = 0
+        while not self._stopping.is_set():
+            try:
+                self.schedule_recurring()
+                claimed = self.poll()
+                failures = 0
+            except Exception as e:
+                # Base de datos caída: se espera cada vez más, sin pasar de 30 segundos
+                failures += 1
+                logger.warning("No se pudo consultar la cola: %s", e, extra=log_fields(worker=self.worker_id))
+                self._stopping.wait(min(30.0, self.poll_interval * 2 ** failures))
+                continue
+            if claimed < self.batch_size:
+                self._stopping.wait(self.poll_interval)
+
+        # Parada ordenada: se terminan los trabajos en curso, el resto vuelve a la cola al vencer
+        self.executor.shutdown(wait=True)
+        logger.info("Worker detenido", extra=log_fields(worker=self.worker_id))
+
+    def poll(self) -> int:
+        with self._free_lock:
+            limit = min(self.batch_size, self._free)
+        if limit == 0:
+            return 0
+        jobs = claim(self.queues, self.worker_id, limit)
+        single: List[Job] = []
+        batches: Dict[str, List[Job]] = {}
+        for job in jobs:
+            if job.task in BATCH_TASKS:
+                batches.setdefault(job.task, []).append(job)
+            else:
+                single.append(job)
+        claimed = len(jobs)
+        for name, batch in batches.items():
+            # Se completa el lote con los demás trabajos vencidos de la tarea
+            missing = BATCH_TASKS[name].size - len(batch)
+            if missing > 0:
+                extra = claim(self.queues, self.worker_id, missing, tasks=[name])
+                batch.extend(extra)
+                claimed += len(extra)
+        with self._free_lock:
+            self._free -= len(single) + len(batches)
+        for job in single:
+            self.executor.submit(self.execute, job)
+        for batch in batches.values():
+            self.executor.submit(self.execute_batch, batch)
+        return claimed
+
+    def execute(self, job: Job) -> None:
+        if job.task in BATCH_TASKS:
+            self.execute_batch([job])
+            return
+        started = time.perf_counter()
+        try:
+            handler = TASKS.get(job.task)
+            if handler is None:
+                fail(job, f"Tarea desconocida: {job.task}")
+            elif job.attempts > job.max_attempts:
+                # Reservado otra vez tras vencer sin confirmar (worker caído a mitad)
+                fail(job, "Intentos agotados")
+            else:
+                try:
+                    handler(job.payload)
+                except Exception as e:
+                    logger.exception("Trabajo %s fallido", job.id, extra=log_fields(job_id=job.id, task=job.task, attempt=job.attempts))
+                    fail(job, f"{type(e).__name__}: {e}")
+                else:
+                    complete(job)
+                    logger.info(
+                        "Trabajo %s terminado", job.id,
+                        extra=log_fields(
+                            job_id=job.id, task=job.task, attempt=job.attempts,
+                            duration_ms=round((time.perf_counter() - started) * 1000, 3),
+                        ),
+                    )
+        except Exception as e:
+            # No se pudo registrar el resultado: el trabajo vuelve a la cola al vencer su reserva
+            logger.error("No se pudo registrar el resultado del trabajo %s: %s", job.id, e)
+        finally:
+            with self._free_lock:
+                self._free += 1
+
+    def execute_batch(self, jobs: List[Job]) -> None:
+        started = time.perf_counter()
+        name = jobs[0].task
+        try:
+            runnable = []
+            for job in jobs:
+                if job.attempts > job.max_attempts:
+                    fail(job, "Intentos agotados")
+                else:
+                    runnable.append(job)
+            if runnable:
+                try:
+                    BATCH_TASKS[name].handler([job.payload for job in runnable])
+                except Exception as e:
+                    logger.exception("Lote de %s fallido", name, extra=log_fields(task=name, jobs=len(runnable)))
+                    for job in runnable:
+                        fail(job, f"{type(e).__name__}: {e}")
+                else:
+                    complete_many(runnable)
+                    logger.info(
+                        "Lote de %s terminado", name,
+                        extra=log_fields(
+                            task=name, jobs=len(runnable),
+                            duration_ms=round((time.perf_counter() - started) * 1000, 3),
+                        ),
+                    )
+        except Exception as e:
+            # Igual que con un trabajo suelto: los que no se registraron vuelven a la cola al vencer
+            logger.error("No se pudo registrar el resultado del lote de %s: %s", name, e)
+        finally:
+            with self._free_lock:
+                self._free += 1
+
+    def schedule_recurring(self) -> None:
+        now = time.time()
+        for item in RECURRING:
+            slot = int(now // item.interval)
+            if self._scheduled.get(item.task) == slot:
+                continue
+            # La clave por intervalo evita que varios workers encolen la misma ejecución
+            enqueue(
+                item.task, item.payload, queue=item.queue, run_at=slot * item.interval,
+                dedupe_key=f"recurring:{item.task}:{slot}",
+            )
+            self._scheduled[item.task] = slot
+
+
+def run_worker(queues: Sequence[str], concurrency: int, batch_size: int) -> None:
+    """Punto de entrada de cada proceso worker"""
+    from lib.structured_log import configure_logging
+    import jobs.tasks  # noqa: F401  (registra las tareas)
+
+    configure_logging()
+    Worker(queues, concurrency, batch_size).run()
@@ -0,0 +1,173 @@
+import asyncio
+import contextvars
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from lib.deadlines import DeadlineRoute
+from lib.metrics import BULKHEAD_QUEUE_WAIT, BULKHEAD_REJECTIONS
+from lib.request_context import release_thread_lease
+
+INTERACTIVE = "interactive"
+LISTING = "listing"
+REPORTING = "reporting"
+BACKGROUND = "background"
+
+# Por clase: hilos, peticiones en cola admitidas y fracción del pool de conexiones.
+# Las clases pesadas suman menos del pool entero para dejar siempre hueco a las interactivas.
+# Se cambian con BULKHEAD_<CLASE>="hilos,cola,fracción", p. ej. BULKHEAD_REPORTING="2,4,0.1"
+BULKHEAD_DEFAULTS = {
+    INTERACTIVE: (16, 200, 1.0),
+    LISTING: (8, 50, 0.4),
+    REPORTING: (4, 8, 0.2),
+    BACKGROUND: (2, 16, 0.1),
+}
+
+# Clase de cada ruta ("MÉTODO plantilla"); las no listadas son interactivas
+ROUTE_WORKLOADS = {
+    "GET /loans/my-loans": LISTING,
+    "GET /loans/borrowed": LISTING,
+    "GET /loans/overdue": LISTING,
+    "GET /loans/changes": LISTING,
+    "GET /loans/users": LISTING,
+    "GET /loans/dashboard": LISTING,
+    "GET /loans/upcoming": LISTING,
+    "GET /notifications/": LISTING,
+    "GET /notifications/changes": LISTING,
+    "GET /loans/report": REPORTING,
+    "GET /loans/stats": REPORTING,
+}
+
+# /batch no ocupa plaza: cada subpetición pasa por la admisión de su propia clase
+UNCLASSIFIED_ROUTES = {"POST /batch"}
+
+_current_bulkhead: ContextVar[Optional["Bulkhead"]] = ContextVar("bulkhead", default=None)
+
+
+class BulkheadFullError(Exception):
+    """La clase de trabajo no admite más peticiones; se responde 503"""
+
+    def __init__(self, workload: str):
+        super().__init__(f"Demasiadas peticiones de tipo '{workload}', inténtalo más tarde")
+        self.workload = workload
+
+
+class Bulkhead:
+    """Compartimento de una clase de trabajo: hilos propios y admisión limitada
+
+    Se admiten como mucho workers + queue_size peticiones a la vez; el resto se
+    rechaza en lugar de esperar y quitar capacidad a las demás clases.
+    """
+
+    def __init__(self, name: str, workers: int, queue_size: int, db_share: float):
+        self.name = name
+        self.workers = workers
+        self.queue_size = queue_size
+        self.db_share = db_share
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"bulkhead-{name}")
+        # Solo se modifica desde el event loop del worker
+        self.admitted = 0
+        self.rejected = 0
+
+    def admit(self) -> None:
+        if self.admitted >= self.workers + self.queue_size:
+            self.rejected += 1
+            BULKHEAD_REJECTIONS.labels(self.name).inc()
+            raise BulkheadFullError(self.name)
+        self.admitted += 1
+
+    def leave(self) -> None:
+        self.admitted -= 1
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Ejecuta una función bloqueante en los hilos de la clase con el contexto actual
+
+        Dentro de /batch el contexto incluye la conexión de lectura del lote: se
+        presta a un hilo cada vez y se recupera al terminar la llamada aunque el
+        controlador no la haya cerrado, para que no quede retenida por este hilo.
+        """
+        context = contextvars.copy_context()
+        queued_at = time.perf_counter()
+
+        def call():
+            BULKHEAD_QUEUE_WAIT.labels(self.name).observe(time.perf_counter() - queued_at)
+            try:
+                return context.run(func, *args, **kwargs)
+            finally:
+                context.run(release_thread_lease)
+
+        return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+def _bulkhead_from_env(name: str) -> Bulkhead:
+    workers, queue_size, db_share = BULKHEAD_DEFAULTS[name]
+    override = os.environ.get(f"BULKHEAD_{name.upper()}")
+    if override:
+        raw_workers, raw_queue, raw_share = override.split(",")
+        workers, queue_size, db_share = int(raw_workers), int(raw_queue), float(raw_share)
+    return Bulkhead(name, workers, queue_size, db_share)
+
+
+BULKHEADS: Dict[str, Bulkhead] = {name: _bulkhead_from_env(name) for name in BULKHEAD_DEFAULTS}
+
+
+def workload_for(method: str, path: str) -> Optional[str]:
+    key = f"{method} {path}"
+    if key in UNCLASSIFIED_ROUTES:
+        return None
+    return ROUTE_WORKLOADS.get(key, INTERACTIVE)
+
+
+def current_bulkhead() -> Optional[Bulkhead]:
+    return _current_bulkhead.get()
+
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """Ejecuta un controlador (bloqueante) en el compartimento de la petición en curso"""
+    bulkhead = _current_bulkhead.get() or BULKHEADS[INTERACTIVE]
+    return await bulkhead.run(func, *args, **kwargs)
+
+
+def shutdown_bulkheads() -> None:
+    for bulkhead in BULKHEADS.values():
+        bulkhead.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class WorkloadRoute(DeadlineRoute):
+    """Ruta que admite cada petición en el compartimento de su clase de trabajo"""
+
+    def get_route_handler(self) -> Callable:
+        original_handler = super().get_route_handler()
+        # Una ruta puede atender varios métodos; la clase se decide por el de la petición
+        bulkheads = {}
+        for method in self.methods or ():
+            workload = workload_for(method, self.path)
+            bulkheads[method] = BULKHEADS[workload] if workload else None
+
+        async def workload_handler(request: Request) -> Response:
+            bulkhead = bulkheads.get(request.method)
+            if bulkhead is None:
+                return await original_handler(request)
+            bulkhead.admit()
+            token = _current_bulkhead.set(bulkhead)
+            try:
+                return await original_handler(request)
+            finally:
+                _current_bulkhead.reset(token)
+                bulkhead.leave()
+
+        return workload_handler
@@ -0,0 +1,121 @@
+import hashlib
+import hmac
+import os
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from lib.jsonl_writer import JsonLinesWriter
+from lib.sessions import bearer_token, decode_session_token
+
+# Captura de tráfico desactivada salvo que se indique un fichero de salida
+CAPTURE_FILE = os.environ.get("CAPTURE_FILE", "")
+CAPTURE_SAMPLE_RATE = float(os.environ.get("CAPTURE_SAMPLE_RATE", "1.0"))
+
+# Los IDs de usuario se sustituyen por un cubo estable: HMAC(sal, id) mod N
+CAPTURE_SALT = os.environ.get("CAPTURE_SALT", "")
+CAPTURE_USER_BUCKETS = int(os.environ.get("CAPTURE_USER_BUCKETS", "1000"))
+
+# Parámetros de consulta que se guardan tal cual (no identifican a nadie)
+SAFE_QUERY_PARAMS = ("status", "loan_type", "limit", "unread_only", "days", "fields")
+# Parámetros con texto libre: solo se guarda que estaban presentes
+REDACTED_QUERY_PARAMS = ("search",)
+REDACTED_VALUE = "*"
+
+# Rutas que no forman parte del tráfico de la API
+EXCLUDED_PREFIXES = ("/admin", "/metrics", "/health", "/static", "/assets")
+
+
+def capture_path(base: str, pid: Optional[int] = None) -> str:
+    """Fichero de captura de un worker (uno por proceso para no mezclar escrituras)"""
+    return f"{base}.{pid or os.getpid()}.jsonl.gz"
+
+
+def user_bucket(user_id: Optional[str], salt: str = CAPTURE_SALT, buckets: int = CAPTURE_USER_BUCKETS) -> Optional[int]:
+    """Cubo anónimo de un usuario: el mismo usuario cae siempre en el mismo cubo"""
+    if not user_id:
+        return None
+    digest = hmac.new(salt.encode("utf-8"), str(user_id).encode("utf-8"), hashlib.sha256).digest()
+    return int.from_bytes(digest[:8], "big") % buckets
+
+
+def anonymize_query(query: List[Tuple[str, str]]) -> Dict[str, str]:
+    """Conserva solo los parámetros seguros y oculta los de texto libre"""
+    params: Dict[str, str] = {}
+    for name, value in query:
+        if name in SAFE_QUERY_PARAMS:
+            params[name] = value
+        elif name in REDACTED_QUERY_PARAMS:
+            params[name] = REDACTED_VALUE
+    return params
+
+
+def _request_user_id(scope, query: List[Tuple[str, str]]) -> Optional[str]:
+    # Mismo criterio que get_current_user_id: token de sesión, cabecera X-User-Id y después ?user_id=
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            token = bearer_token(value.decode("latin-1"))
+            session = decode_session_token(token) if token else None
+            if session is not None:
+                return str(session.user_id)
+        elif name == b"x-user-id":
+            return value.decode("latin-1")
+    for name, value in query:
+        if name == "user_id":
+            return value
+    return None
+
+
+class TrafficCaptureMiddleware:
+    """Middleware ASGI que registra peticiones anonimizadas para reproducirlas después
+
+    Cada línea: ts (epoch), m (método), r (plantilla de ruta), q (parámetros
+    seguros), u (cubo de usuario), s (estado) y d (duración en ms).
+    """
+
+    def __init__(self, app, path: str = CAPTURE_FILE, sample_rate: float = CAPTURE_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.writer = JsonLinesWriter(capture_path(path), compress=True)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["path"].startswith(EXCLUDED_PREFIXES)
+            or random.random() >= self.sample_rate
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        ts = time.time()
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            # Las peticiones que no encajan con ninguna ruta no se pueden reproducir
+            if route is not None:
+                query = parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True)
+                record = {
+                    "ts": round(ts, 3),
+                    "m": scope["method"],
+                    "r": route.path,
+                    "s": status_code,
+                    "d": round((time.perf_counter() - started) * 1000, 3),
+                }
+                params = anonymize_query(query)
+                if params:
+                    record["q"] = params
+                bucket = user_bucket(_request_user_id(scope, query))
+                if bucket is not None:
+                    record["u"] = bucket
+                self.writer.submit(record)
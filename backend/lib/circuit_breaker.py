@@ -0,0 +1,133 @@
+import functools
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict
+
+from lib.deadlines import remaining_time
+from lib.metrics import DB_CIRCUIT_REJECTIONS, DB_CIRCUIT_TRANSITIONS
+from lib.structured_log import log_fields
+
+logger = logging.getLogger("db.circuit")
+
+# Fallos de conexión seguidos que abren el circuito y segundos hasta probar de nuevo
+DB_BREAKER_FAILURES = int(os.environ.get("DB_BREAKER_FAILURES", "5"))
+DB_BREAKER_RESET_SECONDS = float(os.environ.get("DB_BREAKER_RESET_SECONDS", "10"))
+
+# Reintentos de lecturas idempotentes ante una conexión perdida (espera exponencial con jitter)
+DB_READ_RETRIES = int(os.environ.get("DB_READ_RETRIES", "2"))
+DB_RETRY_BASE_DELAY = float(os.environ.get("DB_RETRY_BASE_DELAY", "0.05"))
+
+# Códigos de error de MySQL que indican que el servidor no está disponible
+# (no puede conectar, servidor desaparecido, conexión perdida, demasiadas conexiones, apagándose)
+CONNECTION_ERRNOS = {1040, 1053, 2002, 2003, 2005, 2006, 2013, 2055}
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class DatabaseUnavailableError(Exception):
+    """La base de datos no está disponible; la petición debe responder 503"""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(DatabaseUnavailableError):
+    """Rechazo inmediato: el circuito está abierto"""
+
+
+def is_connection_error(error: Exception) -> bool:
+    return getattr(error, "errno", None) in CONNECTION_ERRNOS
+
+
+class CircuitBreaker:
+    """Disyuntor de conexiones: tras varios fallos seguidos rechaza sin esperar
+
+    Cerrado: todo pasa. Abierto: se rechaza al instante durante reset_timeout.
+    Semiabierto: pasa una única petición de prueba; si conecta se cierra, si
+    falla se vuelve a abrir.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = DB_BREAKER_FAILURES,
+                 reset_timeout: float = DB_BREAKER_RESET_SECONDS,
+                 on_open: Callable[[], None] = None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_open = on_open
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _transition(self, state: str) -> None:
+        self.state = state
+        DB_CIRCUIT_TRANSITIONS.labels(self.name, state).inc()
+        logger.warning("Circuito de base de datos '%s': %s", self.name, state,
+                       extra=log_fields(breaker=self.name, state=state, failures=self.failures))
+
+    def before_call(self) -> None:
+        """Lanza CircuitOpenError si la llamada no debe intentarse"""
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self.opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    DB_CIRCUIT_REJECTIONS.labels(self.name).inc()
+                    raise CircuitOpenError(f"Base de datos '{self.name}' no disponible", retry_after=remaining)
+                self._transition(HALF_OPEN)
+                self._probe_in_flight = False
+            if self.state == HALF_OPEN:
+                if self._probe_in_flight:
+                    DB_CIRCUIT_REJECTIONS.labels(self.name).inc()
+                    raise CircuitOpenError(f"Base de datos '{self.name}' en comprobación", retry_after=1.0)
+                self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            if self.state != CLOSED:
+                self._probe_in_flight = False
+                self._transition(CLOSED)
+
+    def record_failure(self) -> None:
+        opened = False
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self._probe_in_flight = False
+                self._transition(OPEN)
+                opened = True
+        if opened and self.on_open is not None:
+            self.on_open()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures}
+
+
+def retry_reads(func: Callable) -> Callable:
+    """Reintenta una lectura idempotente si se perdió la conexión (no con el circuito abierto ni sin plazo)"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(DB_READ_RETRIES + 1):
+            try:
+                return func(*args, **kwargs)
+            except CircuitOpenError:
+                raise
+            except DatabaseUnavailableError:
+                # Jitter completo: evita que todos los workers reintenten a la vez
+                delay = random.uniform(0, DB_RETRY_BASE_DELAY * (2 ** attempt))
+                budget = remaining_time()
+                if attempt == DB_READ_RETRIES or (budget is not None and budget <= delay):
+                    raise
+                time.sleep(delay)
+
+    return wrapper
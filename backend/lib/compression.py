@@ -0,0 +1,168 @@
+import gzip
+import time
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from lib.static_assets import brotli, choose_encoding
+
+# Respuestas más pequeñas que esto no se comprimen
+MIN_COMPRESS_SIZE = 1024
+
+# Segundos de CPU de compresión permitidos por ventana (por worker)
+CPU_BUDGET_SECONDS = 0.25
+CPU_BUDGET_WINDOW = 1.0
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-msgpack", "text/")
+
+# Niveles normales y niveles rápidos cuando el presupuesto se está agotando
+GZIP_LEVEL = 6
+GZIP_FAST_LEVEL = 1
+BROTLI_QUALITY = 4
+BROTLI_FAST_QUALITY = 1
+
+
+class CompressionBudget:
+    """Limita el tiempo de CPU dedicado a comprimir dentro de una ventana"""
+
+    def __init__(self, budget_seconds: float = CPU_BUDGET_SECONDS, window_seconds: float = CPU_BUDGET_WINDOW):
+        self.budget = budget_seconds
+        self.window = window_seconds
+        self.window_start = time.monotonic()
+        self.spent = 0.0
+
+    def _roll(self) -> None:
+        now = time.monotonic()
+        if now - self.window_start >= self.window:
+            self.window_start = now
+            self.spent = 0.0
+
+    def allow(self) -> bool:
+        self._roll()
+        return self.spent < self.budget
+
+    def under_pressure(self) -> bool:
+        """Más de la mitad del presupuesto consumido: usar niveles rápidos"""
+        return self.spent >= self.budget / 2
+
+    def charge(self, seconds: float) -> None:
+        self.spent += seconds
+
+
+class CompressionStats:
+    """Contadores simples de la compresión de respuestas"""
+
+    def __init__(self):
+        self.compressed = 0
+        self.skipped_small = 0
+        self.skipped_budget = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def as_dict(self) -> dict:
+        return dict(self.__dict__)
+
+
+def compress_body(body: bytes, encoding: str, fast: bool = False) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_FAST_QUALITY if fast else BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_FAST_LEVEL if fast else GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    """Middleware ASGI que comprime respuestas con gzip/brotli según Accept-Encoding"""
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = MIN_COMPRESS_SIZE,
+        cpu_budget: float = CPU_BUDGET_SECONDS,
+        budget_window: float = CPU_BUDGET_WINDOW,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.budget = CompressionBudget(cpu_budget, budget_window)
+        self.stats = CompressionStats()
+        self.available = ("br", "gzip") if brotli is not None else ("gzip",)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = Headers(scope=scope).get("accept-encoding")
+        encoding = choose_encoding(accept_encoding, self.available)
+        if encoding == "identity":
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder)
+
+
+class _CompressionResponder:
+    """Intercepta los mensajes de respuesta y comprime el cuerpo si procede"""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start_message: Optional[dict] = None
+        self.passthrough = False
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        # Respuestas en streaming: no se almacenan en memoria, se envían tal cual
+        self.passthrough = True
+        if message.get("more_body", False):
+            await self.send(self.start_message)
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        body = self._maybe_compress(body)
+        await self.send(self.start_message)
+        await self.send({"type": "http.response.body", "body": body})
+
+    def _maybe_compress(self, body: bytes) -> bytes:
+        middleware = self.middleware
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        content_type = headers.get("content-type", "")
+
+        if (
+            "content-encoding" in headers
+            or self.start_message["status"] in (204, 304)
+            or not content_type.startswith(COMPRESSIBLE_TYPES)
+        ):
+            return body
+
+        if len(body) < middleware.minimum_size:
+            middleware.stats.skipped_small += 1
+            return body
+
+        if not middleware.budget.allow():
+            middleware.stats.skipped_budget += 1
+            return body
+
+        started = time.perf_counter()
+        compressed = compress_body(body, self.encoding, fast=middleware.budget.under_pressure())
+        middleware.budget.charge(time.perf_counter() - started)
+
+        if len(compressed) >= len(body):
+            return body
+
+        middleware.stats.compressed += 1
+        middleware.stats.bytes_in += len(body)
+        middleware.stats.bytes_out += len(compressed)
+
+        headers["Content-Encoding"] = self.encoding
+        headers["Content-Length"] = str(len(compressed))
+        headers.add_vary_header("Accept-Encoding")
+        return compressed
@@ -0,0 +1,66 @@
+from contextvars import ContextVar
+from typing import Any, Callable
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from lib.bulkheads import WorkloadRoute
+from lib.tracing import span
+
+try:
+    import msgpack
+except ImportError:  # msgpack es opcional: sin él siempre se responde JSON
+    msgpack = None
+
+MSGPACK_MEDIA_TYPES = ("application/x-msgpack", "application/msgpack")
+
+# Formato pedido por el cliente en la petición en curso
+_response_format: ContextVar[str] = ContextVar("response_format", default="json")
+
+
+def wants_msgpack(accept: str) -> bool:
+    """Indica si el cliente prefiere MessagePack según la cabecera Accept"""
+    if msgpack is None or not accept:
+        return False
+    for part in accept.split(","):
+        media_type, _, params = part.strip().partition(";")
+        if media_type.strip().lower() not in MSGPACK_MEDIA_TYPES:
+            continue
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                return float(params[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+
+class NegotiatedResponse(JSONResponse):
+    """Respuesta JSON por defecto; MessagePack si el cliente lo pidió"""
+
+    def render(self, content: Any) -> bytes:
+        with span("render"):
+            if _response_format.get() == "msgpack":
+                self.media_type = MSGPACK_MEDIA_TYPES[0]
+                return msgpack.packb(content, use_bin_type=True)
+            return super().render(content)
+
+
+class NegotiatedRoute(WorkloadRoute):
+    """Ruta que fija el formato de respuesta a partir de la cabecera Accept (y la clase y el plazo de la petición)"""
+
+    def get_route_handler(self) -> Callable:
+        original_handler = super().get_route_handler()
+
+        async def negotiated_handler(request: Request) -> Response:
+            fmt = "msgpack" if wants_msgpack(request.headers.get("accept", "")) else "json"
+            token = _response_format.set(fmt)
+            try:
+                response = await original_handler(request)
+            finally:
+                _response_format.reset(token)
+            if msgpack is not None:
+                response.headers.append("Vary", "Accept")
+            return response
+
+        return negotiated_handler
@@ -0,0 +1,195 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from lib.circuit_breaker import CircuitBreaker
+from lib.metrics import DB_CONNECTIONS_CLOSED, DB_POOL_TIMEOUTS, DB_POOL_WAIT
+
+# Una conexión que lleva más tiempo inactiva se comprueba antes de reutilizarla
+IDLE_CHECK_SECONDS = 30.0
+
+
+class PoolTimeoutError(RuntimeError):
+    """No quedó ninguna conexión libre en el tiempo de espera"""
+
+
+def pool_size_for_workers(max_connections: int, reserved: int, workers: int) -> int:
+    """Conexiones por worker para no superar max_connections del servidor entre todos"""
+    return max(1, (max_connections - reserved) // max(1, workers))
+
+
+def job_pool_size(concurrency: int) -> int:
+    """Conexiones de un proceso de trabajos: una por hilo más la del bucle que consulta la cola"""
+    return max(1, concurrency) + 1
+
+
+class PooledConnection:
+    """Conexión prestada por el pool: close() la devuelve en lugar de cerrarla"""
+
+    pooled = True
+
+    def __init__(self, pool: "ConnectionPool", connection, quota: Optional[threading.BoundedSemaphore] = None):
+        self._pool = pool
+        self._connection = connection
+        self._quota = quota
+        # Los errores de conexión en las consultas se notifican al disyuntor de su pool
+        self.breaker = pool.breaker
+        # Servidor de la conexión (None: el primario); para cancelar sus consultas desde otra
+        self.address = pool.address
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._connection, name)
+
+    def close(self) -> None:
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            self._pool.release(connection)
+            if self._quota is not None:
+                self._quota.release()
+
+    def __del__(self):
+        # Red de seguridad para rutas de error que no llegan a llamar a close()
+        if self.__dict__.get("_connection") is not None:
+            self.close()
+
+
+class ConnectionPool:
+    """Pool de conexiones por proceso con tamaño máximo y espera limitada
+
+    Con un disyuntor, los fallos al conectar lo alimentan y con el circuito
+    abierto acquire() lanza CircuitOpenError sin intentar conectar.
+    """
+
+    def __init__(self, factory: Callable[[], Any], size: int, timeout: float,
+                 breaker: Optional[CircuitBreaker] = None, address: Optional[str] = None):
+        self.factory = factory
+        self.breaker = breaker
+        self.address = address
+        self.size = size
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(size)
+        # RLock: __del__ de PooledConnection puede ejecutarse con el lock tomado
+        self._lock = threading.RLock()
+        self._idle: Deque[Tuple[Any, float]] = deque()
+        self.in_use = 0
+        self.waiting = 0
+        self.timeouts = 0
+        self.connect_failures = 0
+        self.last_error: Optional[str] = None
+
+    def acquire(self, timeout: Optional[float] = None,
+                quota: Optional[threading.BoundedSemaphore] = None) -> Optional[PooledConnection]:
+        """Presta una conexión; None si no se pudo abrir, PoolTimeoutError si no hay libres
+
+        quota limita las conexiones que puede tener a la vez una clase de trabajo
+        y se descuenta del mismo tiempo de espera.
+        """
+        started = time.perf_counter()
+        timeout = self.timeout if timeout is None else timeout
+        # Esperar la cuota de la clase no cuenta como espera del pool (readiness)
+        acquired = quota is None or quota.acquire(timeout=timeout)
+        if acquired:
+            with self._lock:
+                self.waiting += 1
+            acquired = self._slots.acquire(timeout=max(0.0, timeout - (time.perf_counter() - started)))
+            with self._lock:
+                self.waiting -= 1
+            if not acquired and quota is not None:
+                quota.release()
+        DB_POOL_WAIT.observe(time.perf_counter() - started)
+        if not acquired:
+            with self._lock:
+                self.timeouts += 1
+            DB_POOL_TIMEOUTS.inc()
+            raise PoolTimeoutError(f"Sin conexiones libres en el pool ({self.size})")
+
+        if self.breaker is not None:
+            try:
+                self.breaker.before_call()
+            except Exception:
+                self._slots.release()
+                if quota is not None:
+                    quota.release()
+                raise
+
+        connection = self._take_idle()
+        if connection is None:
+            error = "No se pudo abrir la conexión"
+            try:
+                connection = self.factory()
+            except Exception as e:
+                connection = None
+                error = str(e)
+            if not connection:
+                with self._lock:
+                    self.connect_failures += 1
+                    self.last_error = error
+                self._slots.release()
+                if quota is not None:
+                    quota.release()
+                if self.breaker is not None:
+                    self.breaker.record_failure()
+                return None
+
+        with self._lock:
+            self.connect_failures = 0
+            self.last_error = None
+            self.in_use += 1
+        if self.breaker is not None:
+            self.breaker.record_success()
+        return PooledConnection(self, connection, quota)
+
+    def _take_idle(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                connection, returned_at = self._idle.pop()
+            if time.monotonic() - returned_at < IDLE_CHECK_SECONDS or connection.is_connected():
+                return connection
+            self._discard(connection)
+
+    def release(self, connection) -> None:
+        """Devuelve una conexión al pool descartando el trabajo sin confirmar"""
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+            healthy = connection.is_connected()
+        except Exception:
+            healthy = False
+
+        with self._lock:
+            self.in_use -= 1
+            if healthy:
+                self._idle.append((connection, time.monotonic()))
+        if not healthy:
+            self._discard(connection)
+        self._slots.release()
+
+    def _discard(self, connection) -> None:
+        try:
+            connection.close()
+        except Exception:
+            pass
+        DB_CONNECTIONS_CLOSED.inc()
+
+    def close_idle(self) -> None:
+        """Cierra las conexiones inactivas (al parar el worker)"""
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for connection, _ in idle:
+            self._discard(connection)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": self.size,
+                "in_use": self.in_use,
+                "idle": len(self._idle),
+                "waiting": self.waiting,
+                "timeouts": self.timeouts,
+                "connect_failures": self.connect_failures,
+                "last_error": self.last_error,
+                "circuit": self.breaker.stats() if self.breaker is not None else None,
+            }
@@ -0,0 +1,190 @@
+import itertools
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from http.cookies import CookieError, SimpleCookie
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from starlette.datastructures import MutableHeaders
+
+from lib.circuit_breaker import DatabaseUnavailableError
+from lib.db_pool import ConnectionPool, PoolTimeoutError
+
+logger = logging.getLogger("db.replica")
+
+# Tras escribir, las lecturas de ese usuario van al primario durante esta ventana
+READ_YOUR_WRITES_SECONDS = float(os.environ.get("READ_YOUR_WRITES_SECONDS", "5"))
+
+# Retraso máximo de una réplica para servir lecturas y cada cuánto se vuelve a medir
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", "2"))
+REPLICA_LAG_CHECK_SECONDS = float(os.environ.get("REPLICA_LAG_CHECK_SECONDS", "1"))
+
+# Cookie con la que el cliente lleva la ventana a otros workers
+READ_YOUR_WRITES_COOKIE = "db_rw_until"
+
+# Escritores recientes recordados por worker (los caducados se purgan al superarlo)
+MAX_TRACKED_WRITERS = 10_000
+
+
+class _RoutingState:
+    """Estado de enrutado de la petición en curso (mutable para verlo desde los controladores)"""
+
+    __slots__ = ("pinned_until", "wrote")
+
+    def __init__(self, pinned_until: float = 0.0):
+        self.pinned_until = pinned_until
+        self.wrote = False
+
+
+_routing_state: ContextVar[Optional[_RoutingState]] = ContextVar("db_routing_state", default=None)
+
+_recent_writers: Dict[int, float] = {}
+_writers_lock = threading.Lock()
+
+
+def mark_user_write(user_ids: Iterable[int]) -> None:
+    """Registra que estos usuarios acaban de cambiar datos: sus lecturas irán al primario"""
+    until = time.time() + READ_YOUR_WRITES_SECONDS
+    with _writers_lock:
+        for user_id in user_ids:
+            _recent_writers[user_id] = until
+        if len(_recent_writers) > MAX_TRACKED_WRITERS:
+            now = time.time()
+            for user_id in [uid for uid, expiry in _recent_writers.items() if expiry <= now]:
+                del _recent_writers[user_id]
+    state = _routing_state.get()
+    if state is not None:
+        state.wrote = True
+
+
+def must_read_primary(user_id: Optional[int]) -> bool:
+    """Indica si la lectura debe ir al primario para ver las escrituras recientes"""
+    now = time.time()
+    state = _routing_state.get()
+    if state is not None and state.pinned_until > now:
+        return True
+    return user_id is not None and _recent_writers.get(user_id, 0.0) > now
+
+
+def last_write_marker(user_id: Optional[int]) -> float:
+    """Fin de la ventana de la última escritura del usuario en este worker (0 si no hay)"""
+    return _recent_writers.get(user_id, 0.0) if user_id is not None else 0.0
+
+
+class Replica:
+    """Réplica de lectura con su pool y el último retraso medido"""
+
+    def __init__(self, address: str, pool: ConnectionPool, measure_lag: Callable[[Any], Optional[float]]):
+        self.address = address
+        self.pool = pool
+        self.measure_lag = measure_lag
+        self.lag: Optional[float] = None
+        self.checked_at = 0.0
+
+    def lag_with(self, connection) -> Optional[float]:
+        """Retraso en segundos (None si no replica), medido como mucho una vez por intervalo"""
+        now = time.monotonic()
+        if now - self.checked_at >= REPLICA_LAG_CHECK_SECONDS:
+            try:
+                self.lag = self.measure_lag(connection)
+            except Exception as e:
+                logger.warning("No se pudo medir el retraso de la réplica %s: %s", self.address, e)
+                self.lag = None
+            self.checked_at = now
+        return self.lag
+
+    def stats(self) -> Dict[str, Any]:
+        return {"address": self.address, "lag_seconds": self.lag, "pool": self.pool.stats()}
+
+
+class ReplicaRouter:
+    """Reparte las lecturas entre las réplicas sanas por turnos"""
+
+    def __init__(self, replicas: List[Replica]):
+        self.replicas = replicas
+        self._turn = itertools.count()
+
+    def acquire(self) -> Tuple[Optional[Any], str]:
+        """Conexión a una réplica válida, o (None, motivo) si hay que leer del primario"""
+        if not self.replicas:
+            return None, "no_replicas"
+        start = next(self._turn)
+        reason = "replica_error"
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            try:
+                connection = replica.pool.acquire(timeout=0)
+            except (PoolTimeoutError, DatabaseUnavailableError):
+                connection = None
+            if not connection:
+                continue
+            lag = replica.lag_with(connection)
+            if lag is None or lag > REPLICA_MAX_LAG_SECONDS:
+                connection.close()
+                reason = "replica_lag"
+                continue
+            return connection, "ok"
+        return None, reason
+
+    def close_idle(self) -> None:
+        for replica in self.replicas:
+            replica.pool.close_idle()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [replica.stats() for replica in self.replicas]
+
+
+def _cookie_deadline(scope) -> float:
+    for name, value in scope.get("headers", []):
+        if name == b"cookie":
+            try:
+                cookie = SimpleCookie(value.decode("latin-1"))
+            except CookieError:
+                return 0.0
+            morsel = cookie.get(READ_YOUR_WRITES_COOKIE)
+            if morsel is None:
+                return 0.0
+            try:
+                return float(morsel.value)
+            except ValueError:
+                return 0.0
+    return 0.0
+
+
+class ReadYourWritesMiddleware:
+    """Middleware ASGI que mantiene la ventana de lectura del primario entre workers
+
+    Si la petición escribe, la respuesta lleva una cookie con el fin de la
+    ventana; mientras dure, las lecturas de ese cliente van al primario
+    aunque las atienda otro worker.
+    """
+
+    def __init__(self, app, window: float = READ_YOUR_WRITES_SECONDS):
+        self.app = app
+        self.window = window
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        state = _RoutingState(pinned_until=_cookie_deadline(scope))
+        token = _routing_state.set(state)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and state.wrote:
+                until = time.time() + self.window
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Set-Cookie",
+                    f"{READ_YOUR_WRITES_COOKIE}={until:.3f}; Max-Age={int(self.window) + 1}; "
+                    "Path=/; HttpOnly; SameSite=Lax",
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _routing_state.reset(token)
@@ -0,0 +1,149 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+from fastapi.routing import APIRoute
+
+# Presupuesto por defecto de una petición en segundos
+DEFAULT_REQUEST_BUDGET = float(os.environ.get("DEFAULT_REQUEST_BUDGET", "5"))
+
+# Presupuestos por plantilla de ruta; REQUEST_BUDGETS="/loans/report=10,/loans/my-loans=2" los cambia
+ROUTE_BUDGETS: Dict[str, float] = {
+    "/loans/my-loans": 3.0,
+    "/loans/borrowed": 3.0,
+    "/loans/report": 10.0,
+    "/loans/dashboard": 5.0,
+    "/batch": 15.0,
+}
+for _item in os.environ.get("REQUEST_BUDGETS", "").split(","):
+    _path, _, _seconds = _item.partition("=")
+    if _path.strip() and _seconds.strip():
+        ROUTE_BUDGETS[_path.strip()] = float(_seconds)
+
+# Margen tras el plazo antes de cancelar la consulta desde el cliente: el límite
+# del servidor (MAX_EXECUTION_TIME) debe saltar antes en los SELECT
+DEADLINE_CANCEL_GRACE = float(os.environ.get("DEADLINE_CANCEL_GRACE", "0.5"))
+
+logger = logging.getLogger("db.deadline")
+
+# Instante (time.monotonic) en que vence la petición en curso
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceededError(Exception):
+    """La petición agotó su presupuesto de tiempo; se responde 504"""
+
+
+def route_budget(path: str) -> float:
+    return ROUTE_BUDGETS.get(path, DEFAULT_REQUEST_BUDGET)
+
+
+def remaining_time() -> Optional[float]:
+    """Segundos que le quedan a la petición en curso (None si no tiene plazo)"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+@contextmanager
+def deadline(seconds: float):
+    """Fija un plazo para el bloque; nunca amplía el de un plazo exterior (p. ej. /batch)"""
+    until = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(until if outer is None else min(outer, until))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+class DeadlineRoute(APIRoute):
+    """Ruta que da a cada petición el presupuesto configurado para su plantilla"""
+
+    def get_route_handler(self) -> Callable:
+        original_handler = super().get_route_handler()
+        budget = route_budget(self.path)
+
+        async def deadline_handler(request: Request) -> Response:
+            with deadline(budget):
+                return await original_handler(request)
+
+        return deadline_handler
+
+
+class _Watch:
+    """Consulta vigilada: se cancela al vencer salvo que termine antes"""
+
+    __slots__ = ("cancel_query", "cancelled", "fired", "_lock")
+
+    def __init__(self, cancel_query: Callable[[], None]):
+        self.cancel_query = cancel_query
+        self.cancelled = False
+        self.fired = False
+        self._lock = threading.Lock()
+
+    def fire(self) -> None:
+        with self._lock:
+            if self.cancelled:
+                return
+            self.fired = True
+            try:
+                self.cancel_query()
+            except Exception as e:
+                logger.error("No se pudo cancelar la consulta: %s", e)
+
+    def cancel(self) -> None:
+        # Espera a una cancelación en curso: la conexión no vuelve al pool hasta que acabe
+        with self._lock:
+            self.cancelled = True
+
+
+class QueryWatchdog:
+    """Hilo único que cancela las consultas que siguen en marcha al vencer su plazo"""
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, _Watch]] = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, seconds: float, cancel_query: Callable[[], None]) -> _Watch:
+        watch = _Watch(cancel_query)
+        entry = (time.monotonic() + seconds, next(self._order), watch)
+        with self._condition:
+            heapq.heappush(self._heap, entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="query-watchdog", daemon=True)
+                self._thread.start()
+            # Solo hace falta despertar al hilo si este plazo es ahora el más próximo
+            if self._heap[0] is entry:
+                self._condition.notify()
+        return watch
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while True:
+                    while self._heap and self._heap[0][2].cancelled:
+                        heapq.heappop(self._heap)
+                    if not self._heap:
+                        self._condition.wait()
+                        continue
+                    wait = self._heap[0][0] - time.monotonic()
+                    if wait <= 0:
+                        watch = heapq.heappop(self._heap)[2]
+                        break
+                    self._condition.wait(wait)
+            watch.fire()
+
+
+query_watchdog = QueryWatchdog()
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+from lib.bulkheads import BACKGROUND, BULKHEADS
+from lib.mysql_db import check_pool_health, db_pool
+
+# Cada cuántos segundos se comprueba la base de datos en segundo plano
+HEALTH_CHECK_INTERVAL = float(os.environ.get("HEALTH_CHECK_INTERVAL", "5"))
+
+# Espera máxima de la consulta de comprobación
+HEALTH_CHECK_TIMEOUT = float(os.environ.get("HEALTH_CHECK_TIMEOUT", "2"))
+
+# Un resultado más antiguo que esto no vale: el monitor se ha atascado
+HEALTH_STALE_AFTER = float(os.environ.get("HEALTH_STALE_AFTER", str(HEALTH_CHECK_INTERVAL * 3)))
+
+logger = logging.getLogger("health")
+
+
+class HealthSnapshot:
+    """Resultado de una comprobación; se sustituye entero, nunca se modifica"""
+
+    __slots__ = ("database_ok", "pool", "checked_at", "checked_monotonic", "duration_ms")
+
+    def __init__(self, database_ok: bool, pool: Optional[Dict[str, Any]], checked_monotonic: float, duration_ms: float):
+        self.database_ok = database_ok
+        self.pool = pool
+        self.checked_at = time.time()
+        self.checked_monotonic = checked_monotonic
+        self.duration_ms = duration_ms
+
+    def age(self) -> float:
+        return time.monotonic() - self.checked_monotonic
+
+
+# Antes de la primera comprobación el worker no está listo
+_STARTING = HealthSnapshot(False, None, float("-inf"), 0.0)
+
+
+class HealthMonitor:
+    """Comprueba la base de datos y el pool cada HEALTH_CHECK_INTERVAL segundos
+
+    Las sondas leen el último resultado sin tocar la base de datos, así que su
+    coste no depende de cuántos balanceadores u orquestadores pregunten.
+    """
+
+    def __init__(self, interval: float = HEALTH_CHECK_INTERVAL):
+        self.interval = interval
+        self._snapshot = _STARTING
+        self._task: Optional[asyncio.Task] = None
+
+    def snapshot(self) -> HealthSnapshot:
+        return self._snapshot
+
+    def is_fresh(self) -> bool:
+        return self._snapshot.age() <= HEALTH_STALE_AFTER
+
+    async def check(self) -> HealthSnapshot:
+        started = time.monotonic()
+        try:
+            pool = await asyncio.wait_for(
+                BULKHEADS[BACKGROUND].run(check_pool_health, HEALTH_CHECK_TIMEOUT), HEALTH_CHECK_TIMEOUT * 2
+            )
+            database_ok = pool["healthy"]
+        except Exception as e:
+            logger.warning("Comprobación de salud fallida: %s", e)
+            pool, database_ok = None, False
+        previous = self._snapshot
+        self._snapshot = HealthSnapshot(database_ok, pool, started, (time.monotonic() - started) * 1000)
+        if previous.database_ok != database_ok and previous is not _STARTING:
+            logger.warning("Base de datos %s", "disponible" if database_ok else "no disponible")
+        return self._snapshot
+
+    async def _run(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def readiness(self) -> Dict[str, Any]:
+        """Estado para /health/ready a partir del último resultado y del pool actual"""
+        snapshot = self._snapshot
+        fresh = self.is_fresh()
+        # Con peticiones esperando conexión el worker está saturado aunque la BD responda
+        waiting = db_pool.waiting
+        return {
+            "ready": snapshot.database_ok and fresh and waiting == 0,
+            "database": snapshot.database_ok,
+            "fresh": fresh,
+            "waiting": waiting,
+            "checked_at": snapshot.checked_at if snapshot is not _STARTING else None,
+            "check_ms": round(snapshot.duration_ms, 3),
+            "pool": snapshot.pool,
+        }
+
+
+health_monitor = HealthMonitor()
@@ -0,0 +1,262 @@
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Sequence
+
+from mysql.connector import Error
+
+from lib.mysql_db import get_db_connection
+from lib.structured_log import log_fields
+
+# Cola por defecto de los trabajos que no indican otra
+DEFAULT_QUEUE = "default"
+
+# Intentos antes de dar un trabajo por perdido (estado 'dead')
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "5"))
+
+# Segundos que un trabajo reservado queda oculto a los demás workers; si el
+# worker muere sin confirmarlo, vuelve a la cola al vencer (entrega al menos una vez)
+JOB_VISIBILITY_TIMEOUT = float(os.environ.get("JOB_VISIBILITY_TIMEOUT", "300"))
+
+# Reintentos con espera exponencial y jitter: base * 2^(intento-1), con tope
+JOB_RETRY_BASE = float(os.environ.get("JOB_RETRY_BASE", "5"))
+JOB_RETRY_MAX = float(os.environ.get("JOB_RETRY_MAX", "600"))
+
+# Segundos que se conservan los trabajos terminados (y su clave de deduplicación)
+JOB_RETENTION_SECONDS = float(os.environ.get("JOB_RETENTION_SECONDS", str(24 * 3600)))
+
+logger = logging.getLogger("jobs")
+
+
+class Job:
+    """Trabajo reservado por un worker"""
+
+    __slots__ = ("id", "queue", "task", "payload", "attempts", "max_attempts", "lock")
+
+    def __init__(self, row: Dict[str, Any]):
+        self.id = row["id"]
+        self.queue = row["queue"]
+        self.task = row["task"]
+        self.payload = json.loads(row["payload"]) if row["payload"] else {}
+        self.attempts = row["attempts"]
+        self.max_attempts = row["max_attempts"]
+        self.lock = row["locked_by"]
+
+
+def _is_duplicate(error: Exception) -> bool:
+    # MySQL: ER_DUP_ENTRY; SQLite solo da el mensaje
+    return getattr(error, "errno", None) == 1062 or "UNIQUE" in str(error)
+
+
+def retry_delay(attempts: int) -> float:
+    """Espera antes del siguiente intento (full jitter)"""
+    return random.uniform(0, min(JOB_RETRY_MAX, JOB_RETRY_BASE * 2 ** max(0, attempts - 1)))
+
+
+def enqueue(
+    task: str,
+    payload: Optional[Dict[str, Any]] = None,
+    queue: str = DEFAULT_QUEUE,
+    delay: float = 0.0,
+    run_at: Optional[float] = None,
+    max_attempts: int = JOB_MAX_ATTEMPTS,
+    dedupe_key: Optional[str] = None,
+    cursor=None,
+) -> Optional[int]:
+    """Encola un trabajo y devuelve su id (None si ya existía uno con la misma dedupe_key)
+
+    Con cursor= se inserta dentro de la transacción del llamador: el trabajo solo
+    existe si esa transacción se confirma.
+    """
+    params = (
+        queue, task, json.dumps(payload, default=str) if payload else None,
+        max_attempts, run_at if run_at is not None else time.time() + delay, dedupe_key,
+    )
+    query = """
+        INSERT INTO jobs (queue, task, payload, max_attempts, run_at, dedupe_key)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """
+    if cursor is not None:
+        cursor.execute(query, params)
+        return cursor.lastrowid
+
+    connection = get_db_connection()
+    try:
+        own_cursor = connection.cursor()
+        own_cursor.execute(query, params)
+        job_id = own_cursor.lastrowid
+        connection.commit()
+        own_cursor.close()
+        return job_id
+    except Error as e:
+        connection.rollback()
+        if dedupe_key is not None and _is_duplicate(e):
+            return None
+        raise
+    finally:
+        connection.close()
+
+
+def claim(
+    queues: Sequence[str],
+    worker_id: str,
+    limit: int,
+    visibility: float = JOB_VISIBILITY_TIMEOUT,
+    tasks: Optional[Sequence[str]] = None,
+) -> List[Job]:
+    """Reserva hasta `limit` trabajos vencidos de las colas indicadas (y de las tareas, si se dan)
+
+    Los candidatos se leen con SKIP LOCKED (MySQL) y se reservan con un UPDATE
+    que vuelve a comprobar que siguen libres; solo se devuelven las filas que
+    llevan la marca de esta reserva, así que dos workers nunca se llevan el mismo.
+    """
+    now = time.time()
+    lock = f"{worker_id}:{uuid.uuid4().hex[:12]}"
+    queue_marks = ", ".join(["%s"] * len(queues))
+    free = "status = 'pending' AND run_at <= %s AND (locked_until IS NULL OR locked_until < %s)"
+    task_filter = f"AND task IN ({', '.join(['%s'] * len(tasks))})" if tasks else ""
+
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(
+            f"""
+            SELECT id FROM jobs
+            WHERE queue IN ({queue_marks}) {task_filter} AND {free}
+            ORDER BY run_at
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+            """,
+            (*queues, *(tasks or ()), now, now, limit),
+        )
+        ids = [row["id"] for row in cursor.fetchall()]
+        jobs: List[Job] = []
+        if ids:
+            id_marks = ", ".join(["%s"] * len(ids))
+            cursor.execute(
+                f"""
+                UPDATE jobs SET locked_by = %s, locked_until = %s, attempts = attempts + 1
+                WHERE id IN ({id_marks}) AND {free}
+                """,
+                (lock, now + visibility, *ids, now, now),
+            )
+            cursor.execute(f"SELECT * FROM jobs WHERE id IN ({id_marks}) AND locked_by = %s ORDER BY run_at", (*ids, lock))
+            jobs = [Job(row) for row in cursor.fetchall()]
+        connection.commit()
+        cursor.close()
+        return jobs
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+def _finish(job: Job, assignments: str, params: Sequence[Any]) -> bool:
+    # Solo si el trabajo sigue reservado por este worker (no ha vencido y lo ha cogido otro)
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            f"UPDATE jobs SET {assignments}, locked_by = NULL, locked_until = NULL WHERE id = %s AND locked_by = %s",
+            (*params, job.id, job.lock),
+        )
+        updated = cursor.rowcount == 1
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+    if not updated:
+        logger.warning("Reserva perdida del trabajo %s", job.id, extra=log_fields(job_id=job.id, task=job.task))
+    return updated
+
+
+def complete(job: Job) -> bool:
+    """Confirma un trabajo terminado"""
+    return _finish(job, "status = 'done', finished_at = %s", (time.time(),))
+
+
+def complete_many(jobs: Sequence[Job]) -> int:
+    """Confirma los trabajos de un lote en una sola transacción; devuelve cuántos seguían reservados"""
+    now = time.time()
+    completed = 0
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor()
+        for job in jobs:
+            cursor.execute(
+                """
+                UPDATE jobs SET status = 'done', finished_at = %s, locked_by = NULL, locked_until = NULL
+                WHERE id = %s AND locked_by = %s
+                """,
+                (now, job.id, job.lock),
+            )
+            if cursor.rowcount == 1:
+                completed += 1
+            else:
+                logger.warning("Reserva perdida del trabajo %s", job.id, extra=log_fields(job_id=job.id, task=job.task))
+        connection.commit()
+        cursor.close()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    return completed
+
+
+def fail(job: Job, error: str) -> bool:
+    """Devuelve el trabajo a la cola con espera o lo marca como 'dead' si agotó los intentos"""
+    now = time.time()
+    if job.attempts >= job.max_attempts:
+        logger.error(
+            "Trabajo %s agotó sus intentos", job.id,
+            extra=log_fields(job_id=job.id, task=job.task, attempts=job.attempts, error=error),
+        )
+        return _finish(job, "status = 'dead', finished_at = %s, last_error = %s", (now, error))
+    return _finish(job, "run_at = %s, last_error = %s", (now + retry_delay(job.attempts), error))
+
+
+def prune_finished(retention: float = JOB_RETENTION_SECONDS, batch_size: int = 1000) -> int:
+    """Borra los trabajos terminados hace más de `retention` segundos (por lotes)"""
+    cutoff = time.time() - retention
+    deleted = 0
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor()
+        while True:
+            cursor.execute(
+                "SELECT id FROM jobs WHERE status IN ('done', 'dead') AND finished_at < %s LIMIT %s",
+                (cutoff, batch_size),
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                break
+            cursor.execute(f"DELETE FROM jobs WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+            connection.commit()
+            deleted += len(ids)
+        cursor.close()
+    finally:
+        connection.close()
+    return deleted
+
+
+def queue_stats() -> List[Dict[str, Any]]:
+    """Trabajos por cola y estado, con el más antiguo pendiente"""
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(
+            """
+            SELECT queue, status, COUNT(*) AS jobs, MIN(run_at) AS oldest_run_at
+            FROM jobs GROUP BY queue, status ORDER BY queue, status
+            """
+        )
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+    finally:
+        connection.close()
@@ -0,0 +1,95 @@
+import atexit
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+from typing import Any, Dict, List, Optional
+
+# Registros pendientes como máximo por fichero; si el hilo escritor no da abasto se descartan en lugar de bloquear
+JSONL_QUEUE_SIZE = int(os.environ.get("JSONL_QUEUE_SIZE", "10000"))
+
+# Segundos que se espera al hilo escritor al cerrar para vaciar lo pendiente
+JSONL_CLOSE_TIMEOUT = float(os.environ.get("JSONL_CLOSE_TIMEOUT", "5"))
+
+logger = logging.getLogger("jsonl")
+
+# Marca de fin: el hilo escritor termina al sacarla de la cola
+_STOP = object()
+
+_writers: List["JsonLinesWriter"] = []
+
+
+class JsonLinesWriter:
+    """Escribe registros JSON por línea desde un hilo aparte para no bloquear peticiones"""
+
+    def __init__(self, path: str, compress: bool = False, max_pending: int = JSONL_QUEUE_SIZE):
+        self.path = path
+        self.compress = compress
+        self.dropped = 0
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_pending)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        _writers.append(self)
+
+    def submit(self, record: Dict[str, Any]) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=f"jsonl-writer:{self.path}", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout: float = JSONL_CLOSE_TIMEOUT) -> None:
+        """Escribe lo pendiente y detiene el hilo escritor (un submit posterior lo vuelve a arrancar)"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                logger.error("No se pudo vaciar %s: cola llena", self.path)
+                return
+        thread.join(timeout)
+        if self.dropped:
+            logger.warning("%s registros descartados en %s por cola llena", self.dropped, self.path)
+
+    def _open(self):
+        if self.compress:
+            return gzip.open(self.path, "at", encoding="utf-8")
+        return open(self.path, "a", encoding="utf-8")
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            records = [self._queue.get()]
+            # Agrupar lo que haya pendiente en una sola escritura (hasta la marca de fin)
+            while len(records) < 1000 and records[-1] is not _STOP:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if records[-1] is _STOP:
+                records.pop()
+                stopping = True
+            if not records:
+                continue
+            try:
+                with self._open() as f:
+                    f.write("".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records))
+            except OSError as e:
+                logger.error("Error al escribir en %s: %s", self.path, e)
+
+
+def close_writers() -> None:
+    """Vacía y detiene todos los escritores (al parar el worker)"""
+    for writer in list(_writers):
+        writer.close()
+
+
+atexit.register(close_writers)
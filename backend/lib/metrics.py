@@ -0,0 +1,209 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, ContextManager, Optional, Tuple
+
+from lib.tracing import record_span
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, REGISTRY,
+        generate_latest, multiprocess,
+    )
+except ImportError:  # prometheus_client es opcional: sin él las métricas no hacen nada
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+    Counter = Histogram = None
+
+# Con varios workers, prometheus_client agrega los valores de todos los procesos
+# a través de este directorio (debe existir y vaciarse al arrancar el servidor)
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _NoopMetric:
+    """Sustituto sin coste cuando prometheus_client no está instalado"""
+
+    def labels(self, *args, **kwargs) -> "_NoopMetric":
+        return self
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def observe(self, value: float) -> None:
+        pass
+
+
+def _histogram(name: str, documentation: str, labels: Tuple[str, ...] = ()):
+    if Histogram is None:
+        return _NoopMetric()
+    return Histogram(name, documentation, labels, buckets=LATENCY_BUCKETS)
+
+
+def _counter(name: str, documentation: str, labels: Tuple[str, ...] = ()):
+    if Counter is None:
+        return _NoopMetric()
+    return Counter(name, documentation, labels)
+
+
+HTTP_REQUEST_DURATION = _histogram(
+    "http_request_duration_seconds", "Latencia de las peticiones HTTP", ("method", "route", "status")
+)
+DB_QUERY_DURATION = _histogram(
+    "db_query_duration_seconds", "Latencia de las consultas a la base de datos", ("function",)
+)
+DB_CONNECT_DURATION = _histogram(
+    "db_connect_duration_seconds", "Tiempo de espera para abrir una conexión a la base de datos"
+)
+DB_CONNECTIONS_OPENED = _counter("db_connections_opened_total", "Conexiones a la base de datos abiertas")
+DB_CONNECTIONS_CLOSED = _counter("db_connections_closed_total", "Conexiones a la base de datos cerradas")
+DB_POOL_WAIT = _histogram("db_pool_wait_seconds", "Espera hasta obtener una conexión del pool")
+DB_POOL_TIMEOUTS = _counter("db_pool_timeouts_total", "Peticiones sin conexión libre en el pool")
+DB_READ_ROUTES = _counter(
+    "db_read_routes_total", "Lecturas enrutadas a réplica o primario y el motivo", ("target", "reason")
+)
+DB_CONNECTION_ERRORS = _counter("db_connection_errors_total", "Errores al conectar con la base de datos")
+DB_CIRCUIT_TRANSITIONS = _counter(
+    "db_circuit_transitions_total", "Cambios de estado del circuito de la base de datos", ("breaker", "state")
+)
+DB_CIRCUIT_REJECTIONS = _counter(
+    "db_circuit_rejections_total", "Peticiones rechazadas con el circuito abierto", ("breaker",)
+)
+BULKHEAD_QUEUE_WAIT = _histogram(
+    "bulkhead_queue_wait_seconds", "Espera en cola hasta obtener un hilo de la clase de trabajo", ("workload",)
+)
+BULKHEAD_REJECTIONS = _counter(
+    "bulkhead_rejections_total", "Peticiones rechazadas por tener su clase de trabajo llena", ("workload",)
+)
+SINGLE_FLIGHT_REQUESTS = _counter(
+    "single_flight_requests_total", "Lecturas ejecutadas (leader) o unidas a una idéntica en curso (coalesced)",
+    ("route", "result")
+)
+CACHE_REQUESTS = _counter("cache_requests_total", "Consultas a cachés en memoria", ("cache", "result"))
+JOB_DURATION = _histogram("background_job_duration_seconds", "Duración de tareas en segundo plano", ("job", "status"))
+
+
+def observe_request(method: str, route: str, status: int, seconds: float) -> None:
+    HTTP_REQUEST_DURATION.labels(method, route, str(status)).observe(seconds)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+@contextmanager
+def track_job(name: str):
+    """Mide la duración de una tarea en segundo plano"""
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        JOB_DURATION.labels(name, status).observe(time.perf_counter() - started)
+
+
+class InstrumentedCursor:
+    """Cursor que mide la duración de cada consulta
+
+    guard(operation) envuelve cada consulta: devuelve un contexto que entrega la
+    sentencia a ejecutar (puede reescribirla) y puede sustituir sus errores.
+    """
+
+    def __init__(self, cursor, function: str, guard: Optional[Callable[[str], ContextManager[str]]] = None):
+        self._cursor = cursor
+        self._function = function
+        self._guard = guard
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, operation, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            if self._guard is None:
+                return self._cursor.execute(operation, *args, **kwargs)
+            with self._guard(operation) as guarded:
+                return self._cursor.execute(guarded, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            DB_QUERY_DURATION.labels(self._function).observe(elapsed)
+            record_span("db", started, elapsed, self._function)
+
+    def executemany(self, operation, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            if self._guard is None:
+                return self._cursor.executemany(operation, *args, **kwargs)
+            with self._guard(operation) as guarded:
+                return self._cursor.executemany(guarded, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            DB_QUERY_DURATION.labels(self._function).observe(elapsed)
+            record_span("db", started, elapsed, self._function)
+
+
+class InstrumentedConnection:
+    """Conexión cuyos cursores miden las consultas con la función que la pidió"""
+
+    def __init__(self, connection, function: str, guard: Optional[Callable[[str], ContextManager[str]]] = None):
+        self._connection = connection
+        self._function = function
+        self._guard = guard
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._connection, name)
+
+    def cursor(self, *args, **kwargs) -> InstrumentedCursor:
+        return InstrumentedCursor(self._connection.cursor(*args, **kwargs), self._function, self._guard)
+
+    def close(self) -> None:
+        self._connection.close()
+        # Las conexiones compartidas se cierran al terminar su contexto y las del pool al descartarse
+        if not getattr(self._connection, "shared", False) and not getattr(self._connection, "pooled", False):
+            DB_CONNECTIONS_CLOSED.inc()
+
+
+def metrics_payload() -> Optional[bytes]:
+    """Exposición en formato Prometheus (None si prometheus_client no está instalado)"""
+    if Counter is None:
+        return None
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+class MetricsMiddleware:
+    """Middleware ASGI que mide la latencia de cada petición por ruta y estado"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Usar la plantilla de la ruta (/loans/{loan_id}) para acotar la cardinalidad
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            observe_request(scope["method"], route_path, status_code, time.perf_counter() - started)
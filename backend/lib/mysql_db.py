@@ -3,7 +3,32 @@ from mysql.connector import Error
 import os
 from typing import Optional, List, Dict, Any
 from datetime import datetime
-import hashlib
+import functools
+import logging
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from lib.user_cache import user_directory
+from lib.request_context import current_request_context
+from lib.metrics import (
+    InstrumentedConnection, DB_CONNECT_DURATION, DB_CONNECTIONS_OPENED, DB_CONNECTION_ERRORS, DB_READ_ROUTES
+)
+from lib.tracing import record_span
+from lib.structured_log import log_fields
+from lib.sqlite_compat import SQLiteConnection, init_sqlite_schema
+from lib.circuit_breaker import CircuitBreaker, DatabaseUnavailableError, is_connection_error
+from lib.deadlines import DeadlineExceededError, DEADLINE_CANCEL_GRACE, query_watchdog, remaining_time
+from lib.bulkheads import BULKHEADS, current_bulkhead
+from lib.db_pool import ConnectionPool, PoolTimeoutError, job_pool_size, pool_size_for_workers
+from lib.db_router import Replica, ReplicaRouter, must_read_primary
+from lib.server import WEB_WORKERS
+
+# Segundos máximos para abrir una conexión y milisegundos máximos por SELECT
+# (max_execution_time de la sesión; 0 = sin límite)
+DB_CONNECT_TIMEOUT = int(os.environ.get("DB_CONNECT_TIMEOUT", "3"))
+DB_QUERY_TIMEOUT_MS = int(os.environ.get("DB_QUERY_TIMEOUT_MS", "10000"))
 
 # Configuración de la base de datos MySQL
 DB_CONFIG = {
@@ -13,43 +38,309 @@ DB_CONFIG = {
     'password': 'vivacristorey',
     'database': 'loan_system',
     'charset': 'utf8mb4',
-    'collation': 'utf8mb4_unicode_ci'
+    'collation': 'utf8mb4_unicode_ci',
+    'connection_timeout': DB_CONNECT_TIMEOUT
 }
 
+# Índices compuestos de las consultas frecuentes (catálogo en benchmarks/query_plans.py)
+COMPOSITE_INDEXES = (
+    ("loans", "idx_lender_created", "lender_id, created_at"),
+    ("loans", "idx_borrower_created", "borrower_id, created_at"),
+    ("loans", "idx_lender_status_due", "lender_id, status, due_date"),
+    ("loans", "idx_borrower_status_due", "borrower_id, status, due_date"),
+    ("notifications", "idx_user_created", "user_id, created_at"),
+    ("notifications", "idx_user_read_created", "user_id, is_read, created_at"),
+)
+# Índices de una columna que ya son prefijo de un índice compuesto
+REDUNDANT_INDEXES = (
+    ("loans", "idx_lender"),
+    ("loans", "idx_borrower"),
+    ("notifications", "idx_user"),
+)
+
+# Motor de base de datos: "mysql" (producción) o "sqlite" (sustituto local sin servicios externos)
+DB_BACKEND = os.environ.get("DB_BACKEND", "mysql")
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "loan_system.db")
+
+# Pool de conexiones por worker: entre todos los workers web y los procesos de
+# trabajos no se supera el max_connections de MySQL, dejando margen para administración
+DB_MAX_CONNECTIONS = int(os.environ.get("DB_MAX_CONNECTIONS", "151"))
+DB_RESERVED_CONNECTIONS = int(os.environ.get("DB_RESERVED_CONNECTIONS", "10"))
+# Procesos de `python -m jobs work` (--processes) y sus hilos (--concurrency): sus conexiones se descuentan antes del reparto
+JOB_PROCESSES = int(os.environ.get("JOB_PROCESSES", "1"))
+JOB_CONCURRENCY = int(os.environ.get("JOB_CONCURRENCY", "4"))
+JOB_CONNECTIONS = JOB_PROCESSES * job_pool_size(JOB_CONCURRENCY)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "0")) or pool_size_for_workers(
+    DB_MAX_CONNECTIONS, DB_RESERVED_CONNECTIONS + JOB_CONNECTIONS, WEB_WORKERS
+)
+# Segundos de espera por una conexión libre antes de dar la petición por fallida
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "5"))
+
+# Réplicas de lectura: "host[:puerto]" separadas por comas (con DB_BACKEND=sqlite, rutas de fichero).
+# Usan el usuario, la contraseña y la base de datos de DB_CONFIG
+DB_REPLICAS = [address.strip() for address in os.environ.get("DB_REPLICAS", "").split(",") if address.strip()]
+# Con 0 no se mide el retraso (pruebas con instancias locales independientes, sin replicación)
+REPLICA_LAG_CHECK = os.environ.get("REPLICA_LAG_CHECK", "1") != "0"
+
+connect_log = logging.getLogger("db.connect")
+pool_log = logging.getLogger("db.pool")
+schema_log = logging.getLogger("db.schema")
+users_log = logging.getLogger("db.users")
+
+# Errores de MySQL de una consulta cortada por tiempo: MAX_EXECUTION_TIME superado o KILL QUERY
+TIMEOUT_ERRNOS = {1317, 3024}
+SELECT_PREFIX = re.compile(r"^\s*SELECT\b", re.IGNORECASE)
+
 def get_db_connection():
     """Obtiene una conexión a la base de datos MySQL"""
+    # Las consultas se miden con el nombre de la función que pidió la conexión
+    return get_db_connection_for(sys._getframe(1).f_code.co_name)
+
+def get_db_connection_for(function: str):
+    """Conexión al primario instrumentada con el nombre de la función indicada"""
+    # Siempre propia del pool: cada llamador tiene su transacción, también dentro de /batch
+    connection = acquire_db_connection()
+    if not connection:
+        raise DatabaseUnavailableError("No se pudo conectar con la base de datos")
+    return InstrumentedConnection(connection, function, functools.partial(guard_query, connection, db_breaker))
+
+def get_read_connection(user_id: Optional[int] = None):
+    """Conexión para consultas de solo lectura: una réplica si es seguro, si no el primario
+
+    Se lee del primario dentro de un contexto compartido (/batch), durante la
+    ventana de read-your-writes del usuario o si ninguna réplica está al día.
+    Dentro de /batch se reutiliza la conexión de lectura del lote si está libre.
+    """
+    function = sys._getframe(1).f_code.co_name
+
+    context = current_request_context()
+    if context is not None:
+        reason = "shared_context"
+        shared = context.get_connection(acquire_db_connection)
+        if shared is not None:
+            DB_READ_ROUTES.labels("primary", reason).inc()
+            return InstrumentedConnection(shared, function, functools.partial(guard_query, shared, db_breaker))
+    elif must_read_primary(user_id):
+        reason = "read_your_writes"
+    else:
+        connection, reason = replica_router.acquire()
+        if connection:
+            DB_READ_ROUTES.labels("replica", reason).inc()
+            return InstrumentedConnection(
+                connection, function, functools.partial(guard_query, connection, connection.breaker)
+            )
+
+    DB_READ_ROUTES.labels("primary", reason).inc()
+    return get_db_connection_for(function)
+
+def acquire_db_connection():
+    """Toma prestada una conexión del pool del worker (close() la devuelve)"""
+    # La espera por una conexión libre también descuenta del plazo de la petición
+    timeout = DB_POOL_TIMEOUT
+    budget = remaining_time()
+    if budget is not None:
+        if budget <= 0:
+            raise DeadlineExceededError("Tiempo de la petición agotado esperando conexión")
+        timeout = min(timeout, budget)
+    bulkhead = current_bulkhead()
+    quota = db_quotas[bulkhead.name] if bulkhead is not None else None
     try:
-        print(f"Intentando conectar a MySQL: {DB_CONFIG['host']}:{DB_CONFIG['port']}")
-        print(f"Base de datos: {DB_CONFIG['database']}")
-        print(f"Usuario: {DB_CONFIG['user']}")
-        
-        connection = mysql.connector.connect(**DB_CONFIG)
+        return db_pool.acquire(timeout=timeout, quota=quota)
+    except PoolTimeoutError as e:
+        pool_log.warning("%s", e, extra=log_fields(workload=bulkhead.name if bulkhead else None))
+        if timeout < DB_POOL_TIMEOUT:
+            raise DeadlineExceededError("Tiempo de la petición agotado esperando conexión") from e
+        raise DatabaseUnavailableError(str(e)) from e
+
+def handle_query_error(breaker: CircuitBreaker, error: Exception) -> None:
+    """Una conexión perdida durante una consulta cuenta como fallo del servidor y responde 503"""
+    if is_connection_error(error):
+        breaker.record_failure()
+        raise DatabaseUnavailableError(f"Conexión con la base de datos perdida: {error}") from error
+
+def with_execution_limit(operation: str, seconds: float) -> str:
+    """Añade a un SELECT el límite de ejecución en el servidor (hint de MySQL)"""
+    millis = max(1, int(seconds * 1000))
+    return SELECT_PREFIX.sub(lambda m: f"{m.group(0)} /*+ MAX_EXECUTION_TIME({millis}) */", operation, count=1)
+
+def cancel_query(connection) -> None:
+    """Corta desde otro hilo la consulta en curso de una conexión
+
+    KILL QUERY se envía al mismo servidor que la conexión vigilada: el id de
+    hilo de una réplica en el primario sería otra consulta (o ninguna).
+    """
+    if DB_BACKEND == "sqlite":
+        connection.interrupt()
+        return
+    killer = open_db_connection(getattr(connection, "address", None))
+    if not killer:
+        return
+    try:
+        cursor = killer.cursor()
+        cursor.execute("KILL QUERY %s", (connection.connection_id,))
+        cursor.close()
+    finally:
+        killer.close()
+
+@contextmanager
+def guard_query(connection, breaker: CircuitBreaker, operation: str):
+    """Aplica el plazo de la petición a una consulta y traduce sus errores
+
+    El plazo llega al servidor como MAX_EXECUTION_TIME (SELECT en MySQL) y al
+    cliente como un vigilante que cancela la consulta poco después de vencer.
+    """
+    budget = remaining_time()
+    watch = None
+    if budget is not None:
+        if budget <= 0:
+            raise DeadlineExceededError("Tiempo de la petición agotado antes de la consulta")
+        grace = 0.0
+        if DB_BACKEND == "mysql":
+            operation = with_execution_limit(operation, budget)
+            grace = DEADLINE_CANCEL_GRACE
+        watch = query_watchdog.watch(budget + grace, functools.partial(cancel_query, connection))
+    try:
+        yield operation
+    except Exception as e:
+        if (watch is not None and watch.fired) or getattr(e, "errno", None) in TIMEOUT_ERRNOS:
+            raise DeadlineExceededError("Consulta cancelada: tiempo de la petición agotado") from e
+        handle_query_error(breaker, e)
+        raise
+    finally:
+        if watch is not None:
+            watch.cancel()
+
+def check_pool_health(timeout: float = 1.0) -> Dict[str, Any]:
+    """Estado del pool y resultado de un SELECT 1 con una conexión prestada"""
+    healthy = False
+    try:
+        connection = db_pool.acquire(timeout=timeout)
+        if connection:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+            connection.close()
+            healthy = True
+    except Exception as e:
+        pool_log.warning("Comprobación del pool fallida: %s", e)
+    return {"healthy": healthy, "backend": DB_BACKEND, **db_pool.stats(), "replicas": replica_router.stats()}
+
+def replica_config(address: str) -> Dict[str, Any]:
+    """DB_CONFIG con el host y puerto de una réplica"""
+    host, _, port = address.partition(":")
+    return {**DB_CONFIG, 'host': host, 'port': int(port or 3306)}
+
+def open_db_connection(replica: Optional[str] = None):
+    """Abre una conexión nueva a la base de datos MySQL (al primario o a una réplica)"""
+    if DB_BACKEND == "sqlite":
+        return open_sqlite_connection(replica or SQLITE_PATH)
+
+    config = replica_config(replica) if replica else DB_CONFIG
+    try:
+        connect_log.debug(
+            "Intentando conectar a MySQL",
+            extra=log_fields(host=config['host'], port=config['port'], database=config['database'], user=config['user']),
+        )
+        started = time.perf_counter()
+        connection = mysql.connector.connect(**config)
+        if DB_QUERY_TIMEOUT_MS:
+            cursor = connection.cursor()
+            cursor.execute("SET SESSION max_execution_time = %s", (DB_QUERY_TIMEOUT_MS,))
+            cursor.close()
+        elapsed = time.perf_counter() - started
+        DB_CONNECT_DURATION.observe(elapsed)
+        record_span("db-connect", started, elapsed)
         if connection.is_connected():
-            print("Conexion a MySQL exitosa")
+            connect_log.info("Conexion a MySQL exitosa", extra=log_fields(host=config['host'], seconds=elapsed))
+            DB_CONNECTIONS_OPENED.inc()
             return connection
     except Error as e:
-        print(f"❌ Error al conectar a MySQL: {e}")
+        DB_CONNECTION_ERRORS.inc()
+        connect_log.error("Error al conectar a MySQL: %s", e, extra=log_fields(host=config['host'], port=config['port']))
+        return None
+
+def open_sqlite_connection(path: str = SQLITE_PATH):
+    """Abre una conexión al sustituto SQLite con la interfaz de mysql.connector"""
+    try:
+        started = time.perf_counter()
+        connection = SQLiteConnection(path, error_class=Error)
+        elapsed = time.perf_counter() - started
+        DB_CONNECT_DURATION.observe(elapsed)
+        record_span("db-connect", started, elapsed)
+        DB_CONNECTIONS_OPENED.inc()
+        return connection
+    except Exception as e:
+        DB_CONNECTION_ERRORS.inc()
+        connect_log.error("Error al abrir SQLite: %s", e, extra=log_fields(path=path))
+        return None
+
+def measure_replica_lag(connection) -> Optional[float]:
+    """Segundos de retraso de la réplica (None si la replicación no está activa)"""
+    if DB_BACKEND == "sqlite" or not REPLICA_LAG_CHECK:
+        return 0.0
+    cursor = connection.cursor(dictionary=True)
+    cursor.execute("SHOW REPLICA STATUS")
+    status = cursor.fetchone()
+    cursor.close()
+    if not status:
         return None
+    lag = status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+    return None if lag is None else float(lag)
+
+def replica_pool(address: str) -> ConnectionPool:
+    """Pool de una réplica con su propio disyuntor (una réplica caída se salta sin esperar)"""
+    breaker = CircuitBreaker(address)
+    pool = ConnectionPool(
+        functools.partial(open_db_connection, address), DB_POOL_SIZE, DB_POOL_TIMEOUT, breaker, address
+    )
+    breaker.on_open = pool.close_idle
+    return pool
+
+# Las conexiones se abren bajo demanda en cada worker (después del fork).
+# Al abrirse el circuito se descartan las inactivas: la prueba de cierre debe conectar de nuevo
+db_breaker = CircuitBreaker("primary")
+db_pool = ConnectionPool(open_db_connection, DB_POOL_SIZE, DB_POOL_TIMEOUT, db_breaker)
+db_breaker.on_open = db_pool.close_idle
+# Conexiones del primario que puede tener a la vez cada clase de trabajo (lib/bulkheads.py)
+db_quotas = {
+    name: threading.BoundedSemaphore(max(1, round(DB_POOL_SIZE * bulkhead.db_share)))
+    for name, bulkhead in BULKHEADS.items()
+}
+replica_router = ReplicaRouter([
+    Replica(address, replica_pool(address), measure_replica_lag)
+    for address in DB_REPLICAS
+])
 
 def init_database():
     """Inicializa la base de datos y crea las tablas necesarias"""
+    if DB_BACKEND == "sqlite":
+        connection = open_sqlite_connection()
+        if not connection:
+            return False
+        init_sqlite_schema(connection)
+        connection.close()
+        schema_log.info("Base de datos SQLite inicializada correctamente", extra=log_fields(path=SQLITE_PATH))
+        return True
+
     try:
         # Primero crear la base de datos si no existe
         connection = mysql.connector.connect(
             host=DB_CONFIG['host'],
             port=DB_CONFIG['port'],
             user=DB_CONFIG['user'],
-            password=DB_CONFIG['password']
+            password=DB_CONFIG['password'],
+            connection_timeout=DB_CONNECT_TIMEOUT
         )
         
         cursor = connection.cursor()
-        print(f"Creando base de datos '{DB_CONFIG['database']}' si no existe...")
+        schema_log.info("Creando base de datos '%s' si no existe", DB_CONFIG['database'])
         cursor.execute(f"CREATE DATABASE IF NOT EXISTS {DB_CONFIG['database']} CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci")
         connection.commit()
         cursor.close()
         connection.close()
         
-        print(f"Base de datos '{DB_CONFIG['database']}' creada/verificada exitosamente")
+        schema_log.info("Base de datos '%s' creada/verificada", DB_CONFIG['database'])
         
         # Ahora conectar a la base de datos específica
         connection = get_db_connection()
@@ -94,8 +385,10 @@ def init_database():
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
                 FOREIGN KEY (lender_id) REFERENCES users(id) ON DELETE CASCADE,
                 FOREIGN KEY (borrower_id) REFERENCES users(id) ON DELETE CASCADE,
-                INDEX idx_lender (lender_id),
-                INDEX idx_borrower (borrower_id),
+                INDEX idx_lender_created (lender_id, created_at),
+                INDEX idx_borrower_created (borrower_id, created_at),
+                INDEX idx_lender_status_due (lender_id, status, due_date),
+                INDEX idx_borrower_status_due (borrower_id, status, due_date),
                 INDEX idx_status (status),
                 INDEX idx_due_date (due_date)
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
@@ -114,23 +407,143 @@ def init_database():
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
                 FOREIGN KEY (loan_id) REFERENCES loans(id) ON DELETE SET NULL,
-                INDEX idx_user (user_id),
+                INDEX idx_user_created (user_id, created_at),
+                INDEX idx_user_read_created (user_id, is_read, created_at),
                 INDEX idx_read (is_read),
                 INDEX idx_created (created_at)
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
         ''')
         
+        # Crear registro de cambios (outbox) para sincronización incremental
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS change_log (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                entity ENUM('loan', 'notification') NOT NULL,
+                entity_id INT NOT NULL,
+                user_id INT NOT NULL,
+                operation ENUM('insert', 'update', 'delete') NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_entity_user (entity, user_id, id)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        ''')
+        
+        # Cola de trabajos en segundo plano (python -m jobs work)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                queue VARCHAR(50) NOT NULL,
+                task VARCHAR(100) NOT NULL,
+                payload TEXT NULL,
+                status ENUM('pending', 'done', 'dead') NOT NULL DEFAULT 'pending',
+                attempts INT NOT NULL DEFAULT 0,
+                max_attempts INT NOT NULL,
+                run_at DOUBLE NOT NULL,
+                locked_by VARCHAR(64) NULL,
+                locked_until DOUBLE NULL,
+                finished_at DOUBLE NULL,
+                last_error TEXT NULL,
+                dedupe_key VARCHAR(191) NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE KEY uniq_dedupe_key (dedupe_key),
+                INDEX idx_queue_status_run (queue, status, run_at),
+                INDEX idx_status_finished (status, finished_at)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        ''')
+        
+        # Tokens de sesión revocados (logout) hasta que caducan; los leen todos los workers
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS revoked_tokens (
+                token_id VARCHAR(16) PRIMARY KEY,
+                expires_at BIGINT NOT NULL,
+                revoked_at DOUBLE NOT NULL,
+                INDEX idx_revoked_at (revoked_at),
+                INDEX idx_expires_at (expires_at)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        ''')
+        
+        # Webhooks: suscripciones, eventos pendientes de repartir (outbox) y envíos
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS webhook_subscriptions (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                user_id INT NOT NULL,
+                url VARCHAR(500) NOT NULL,
+                secret VARCHAR(100) NOT NULL,
+                events VARCHAR(255) NULL,
+                active BOOLEAN NOT NULL DEFAULT TRUE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+                INDEX idx_user_active (user_id, active)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS webhook_events (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                user_id INT NOT NULL,
+                event VARCHAR(50) NOT NULL,
+                payload TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS webhook_deliveries (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                subscription_id INT NOT NULL,
+                payload MEDIUMTEXT NOT NULL,
+                status ENUM('pending', 'delivered', 'dead') NOT NULL DEFAULT 'pending',
+                attempts INT NOT NULL DEFAULT 0,
+                next_attempt_at DOUBLE NOT NULL,
+                locked_by VARCHAR(64) NULL,
+                locked_until DOUBLE NULL,
+                last_status INT NULL,
+                last_error TEXT NULL,
+                delivered_at DOUBLE NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (subscription_id) REFERENCES webhook_subscriptions(id) ON DELETE CASCADE,
+                INDEX idx_status_next (status, next_attempt_at),
+                INDEX idx_subscription_status (subscription_id, status)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        ''')
+        
+        # Tablas creadas con versiones anteriores del esquema
+        migrate_indexes(cursor)
+        
         connection.commit()
         cursor.close()
         connection.close()
         
-        print("Base de datos MySQL inicializada correctamente")
+        schema_log.info("Base de datos MySQL inicializada correctamente", extra=log_fields(database=DB_CONFIG['database']))
         return True
         
-    except Error as e:
-        print(f"Error al inicializar la base de datos: {e}")
+    except (Error, DatabaseUnavailableError) as e:
+        schema_log.error("Error al inicializar la base de datos: %s", e, extra=log_fields(database=DB_CONFIG['database']))
         return False
 
+def migrate_indexes(cursor) -> None:
+    """Crea los índices compuestos que falten y elimina los que estos ya cubren"""
+    cursor.execute(
+        "SELECT DISTINCT TABLE_NAME, INDEX_NAME FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = %s",
+        (DB_CONFIG['database'],)
+    )
+    existing = {(table, index) for table, index in cursor.fetchall()}
+    
+    # Con varios workers arrancando a la vez otro puede haberse adelantado: se ignora el error
+    for table, index, columns in COMPOSITE_INDEXES:
+        if (table, index) not in existing:
+            schema_log.info("Creando índice %s en %s", index, table)
+            try:
+                cursor.execute(f"CREATE INDEX {index} ON {table} ({columns})")
+            except Error as e:
+                schema_log.warning("No se pudo crear el índice %s: %s", index, e, extra=log_fields(table=table, index=index))
+    
+    # Se borran después de crear los compuestos: las claves foráneas necesitan un índice
+    for table, index in REDUNDANT_INDEXES:
+        if (table, index) in existing:
+            schema_log.info("Eliminando índice redundante %s de %s", index, table)
+            try:
+                cursor.execute(f"DROP INDEX {index} ON {table}")
+            except Error as e:
+                schema_log.warning("No se pudo eliminar el índice %s: %s", index, e, extra=log_fields(table=table, index=index))
+
 def check_database_exists() -> bool:
     """Verifica si la base de datos existe"""
     try:
@@ -142,44 +555,108 @@ def check_database_exists() -> bool:
     except Error:
         return False
 
+# Columnas del perfil: lo único que se cachea (el hash de la contraseña se lee siempre de la base de datos)
+USER_PROFILE_COLUMNS = "id, name, username, email, phone, address, profile_image, created_at, updated_at"
+
 def get_user_by_username(username: str) -> Optional[Dict[str, Any]]:
-    """Obtiene un usuario por su nombre de usuario"""
+    """Obtiene el perfil de un usuario por su nombre de usuario (sin el hash de la contraseña)"""
+    cached = user_directory.get_by_username(username)
+    if cached is not None:
+        return cached
+
     try:
         connection = get_db_connection()
         if not connection:
             return None
             
         cursor = connection.cursor(dictionary=True)
-        cursor.execute('SELECT * FROM users WHERE username = %s', (username,))
+        cursor.execute(f'SELECT {USER_PROFILE_COLUMNS} FROM users WHERE username = %s', (username,))
         user = cursor.fetchone()
         
         cursor.close()
         connection.close()
         
+        if user:
+            user_directory.put(user)
         return user
     except Error as e:
-        print(f"Error al obtener usuario: {e}")
+        users_log.error("Error al obtener usuario: %s", e, extra=log_fields(username=username))
+        return None
+
+def get_user_credentials(username: str) -> Optional[Dict[str, Any]]:
+    """Obtiene el usuario con el hash de la contraseña, siempre de la base de datos (login)"""
+    try:
+        connection = get_db_connection()
+        if not connection:
+            return None
+            
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(f'SELECT {USER_PROFILE_COLUMNS}, password_hash FROM users WHERE username = %s', (username,))
+        user = cursor.fetchone()
+        
+        cursor.close()
+        connection.close()
+        
+        if user:
+            # Se aprovecha la consulta para refrescar el perfil cacheado, sin el hash
+            user_directory.put({key: value for key, value in user.items() if key != 'password_hash'})
+        return user
+    except Error as e:
+        users_log.error("Error al obtener credenciales: %s", e, extra=log_fields(username=username))
         return None
 
 def get_user_by_id(user_id: int) -> Optional[Dict[str, Any]]:
-    """Obtiene un usuario por su ID"""
+    """Obtiene el perfil de un usuario por su ID (sin el hash de la contraseña)"""
+    cached = user_directory.get(user_id)
+    if cached is not None:
+        return cached
+
     try:
         connection = get_db_connection()
         if not connection:
             return None
             
         cursor = connection.cursor(dictionary=True)
-        cursor.execute('SELECT * FROM users WHERE id = %s', (user_id,))
+        cursor.execute(f'SELECT {USER_PROFILE_COLUMNS} FROM users WHERE id = %s', (user_id,))
         user = cursor.fetchone()
         
         cursor.close()
         connection.close()
         
+        if user:
+            user_directory.put(user)
         return user
     except Error as e:
-        print(f"Error al obtener usuario por ID: {e}")
+        users_log.error("Error al obtener usuario por ID: %s", e, extra=log_fields(user_id=user_id))
         return None
 
+def get_users_by_ids(user_ids) -> Dict[int, Dict[str, Any]]:
+    """Obtiene varios usuarios por ID usando la caché y una sola consulta para los que falten"""
+    users, missing = user_directory.get_many(user_ids)
+    if not missing:
+        return users
+
+    try:
+        connection = get_db_connection()
+        if not connection:
+            return users
+            
+        cursor = connection.cursor(dictionary=True)
+        placeholders = ', '.join(['%s'] * len(missing))
+        cursor.execute(f'SELECT {USER_PROFILE_COLUMNS} FROM users WHERE id IN ({placeholders})', tuple(missing))
+        rows = cursor.fetchall()
+        
+        cursor.close()
+        connection.close()
+        
+        for user in rows:
+            user_directory.put(user)
+            users[user['id']] = user
+        return users
+    except Error as e:
+        users_log.error("Error al obtener usuarios por ID: %s", e, extra=log_fields(count=len(missing)))
+        return users
+
 def create_user(name: str, username: str, email: str, password_hash: str, phone: str = None, address: str = None) -> bool:
     """Crea un nuevo usuario en la base de datos"""
     try:
@@ -195,11 +672,12 @@ def create_user(name: str, username: str, email: str, password_hash: str, phone:
         )
         
         connection.commit()
+        user_directory.invalidate(user_id=cursor.lastrowid, username=username)
         cursor.close()
         connection.close()
         return True
     except Error as e:
-        print(f"Error al crear usuario: {e}")
+        users_log.error("Error al crear usuario: %s", e, extra=log_fields(username=username))
         return False
 
 def update_user_profile(user_id: int, **kwargs) -> bool:
@@ -231,15 +709,28 @@ def update_user_profile(user_id: int, **kwargs) -> bool:
         cursor.close()
         connection.close()
         
+        user_directory.invalidate(user_id=user_id)
         return True
     except Error as e:
-        print(f"Error al actualizar perfil: {e}")
+        users_log.error("Error al actualizar perfil: %s", e, extra=log_fields(user_id=user_id, fields=sorted(kwargs)))
         return False
 
-def hash_password(password: str) -> str:
-    """Hashea una contraseña usando SHA-256"""
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def verify_password(password: str, hashed: str) -> bool:
-    """Verifica si una contraseña coincide con el hash"""
-    return hash_password(password) == hashed
+def update_password_hash(user_id: int, old_hash: str, new_hash: str) -> bool:
+    """Sustituye el hash de la contraseña si no ha cambiado desde que se leyó"""
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        cursor.execute(
+            'UPDATE users SET password_hash = %s WHERE id = %s AND password_hash = %s',
+            (new_hash, user_id, old_hash)
+        )
+        updated = cursor.rowcount == 1
+        connection.commit()
+        cursor.close()
+        connection.close()
+        
+        user_directory.invalidate(user_id=user_id)
+        return updated
+    except Error as e:
+        users_log.error("Error al actualizar el hash de la contraseña: %s", e, extra=log_fields(user_id=user_id))
+        return False
@@ -0,0 +1,80 @@
+import base64
+import hashlib
+import hmac
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+
+# Coste de scrypt (N, r, p): subir N hace más caro cada intento de fuerza bruta.
+# Los hashes guardan sus parámetros, así que cambiarlos no invalida los existentes:
+# se recalculan con los nuevos en el siguiente login
+PASSWORD_SCRYPT_N = int(os.environ.get("PASSWORD_SCRYPT_N", str(2 ** 14)))
+PASSWORD_SCRYPT_R = int(os.environ.get("PASSWORD_SCRYPT_R", "8"))
+PASSWORD_SCRYPT_P = int(os.environ.get("PASSWORD_SCRYPT_P", "1"))
+
+# Hilos dedicados al hash: scrypt libera el GIL, así que calculan en paralelo sin
+# ocupar el event loop, y el límite evita que una ráfaga de logins acapare la CPU
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+
+SCRYPT_PREFIX = "scrypt"
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+# Hashes SHA-256 en hexadecimal de las versiones anteriores
+LEGACY_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+
+_hash_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii").rstrip("=")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # maxmem por encima de 128 * N * r para que OpenSSL acepte los costes altos
+    return hashlib.scrypt(
+        password.encode(), salt=salt, n=n, r=r, p=p, dklen=KEY_BYTES, maxmem=256 * n * r + 1024 * 1024
+    )
+
+
+def _parse(hashed: str) -> Tuple[int, int, int, bytes, bytes]:
+    _, n, r, p, salt, key = hashed.split("$")
+    return int(n), int(r), int(p), _unb64(salt), _unb64(key)
+
+
+def hash_password(password: str) -> str:
+    """Hash scrypt con sal aleatoria: scrypt$N$r$p$sal$clave (calculado en el pool de hash)"""
+    salt = os.urandom(SALT_BYTES)
+    n, r, p = PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P
+    key = _hash_pool.submit(_scrypt, password, salt, n, r, p).result()
+    return f"{SCRYPT_PREFIX}${n}${r}${p}${_b64(salt)}${_b64(key)}"
+
+
+def verify_password(password: str, hashed: str) -> bool:
+    """Comprueba la contraseña con un hash scrypt o con un SHA-256 heredado"""
+    if LEGACY_SHA256.match(hashed):
+        return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), hashed)
+    if not hashed.startswith(SCRYPT_PREFIX + "$"):
+        return False
+    try:
+        n, r, p, salt, key = _parse(hashed)
+    except ValueError:
+        return False
+    candidate = _hash_pool.submit(_scrypt, password, salt, n, r, p).result()
+    return hmac.compare_digest(candidate, key)
+
+
+def needs_rehash(hashed: str) -> bool:
+    """Indica si el hash es heredado o usa parámetros distintos de los actuales"""
+    if not hashed.startswith(SCRYPT_PREFIX + "$"):
+        return True
+    try:
+        n, r, p, _, _ = _parse(hashed)
+    except ValueError:
+        return True
+    return (n, r, p) != (PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P)
@@ -0,0 +1,121 @@
+import collections
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+# Límites para que un perfil olvidado no afecte al worker
+MAX_PROFILE_SECONDS = 60
+MIN_INTERVAL_SECONDS = 0.001
+TRACEMALLOC_FRAMES = 16
+
+# Solo un perfil a la vez por worker
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusyError(RuntimeError):
+    """Ya hay un perfil en curso en este worker"""
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _stack_key(frame) -> str:
+    """Pila en formato "raíz;...;hoja" como espera flamegraph.pl"""
+    labels: List[str] = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+
+def sample_cpu(seconds: float, interval: float = 0.005) -> Dict[str, int]:
+    """Muestrea periódicamente las pilas de todos los hilos del worker
+
+    Devuelve un contador pila -> número de muestras. Se ejecuta en el hilo
+    que lo llama (no en el del event loop) para poder observarlo.
+    """
+    seconds = min(max(seconds, 0.0), MAX_PROFILE_SECONDS)
+    interval = max(interval, MIN_INTERVAL_SECONDS)
+
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusyError("Ya hay un perfil en curso")
+    try:
+        own_thread = threading.get_ident()
+        stacks: Dict[str, int] = collections.Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_thread:
+                    stacks[_stack_key(frame)] += 1
+            time.sleep(interval)
+        return stacks
+    finally:
+        _profile_lock.release()
+
+
+def track_allocations(seconds: float, top: int = 25) -> List[tracemalloc.StatisticDiff]:
+    """Compara dos snapshots de tracemalloc separados por el intervalo indicado"""
+    seconds = min(max(seconds, 0.0), MAX_PROFILE_SECONDS)
+
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusyError("Ya hay un perfil en curso")
+    started_here = not tracemalloc.is_tracing()
+    try:
+        if started_here:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        before = tracemalloc.take_snapshot()
+        time.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+    finally:
+        # tracemalloc tiene un coste alto: solo activo mientras dura la medición
+        if started_here:
+            tracemalloc.stop()
+        _profile_lock.release()
+
+    filters = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ]
+    before = before.filter_traces(filters)
+    after = after.filter_traces(filters)
+    stats = after.compare_to(before, "traceback")
+    stats.sort(key=lambda stat: stat.size_diff, reverse=True)
+    return stats[:top]
+
+
+def folded_cpu(stacks: Dict[str, int]) -> str:
+    """Formato "pila cuenta" (flamegraph.pl, speedscope, inferno)"""
+    return "\n".join(f"{stack} {count}" for stack, count in sorted(stacks.items())) + "\n"
+
+
+def folded_allocations(stats: List[tracemalloc.StatisticDiff]) -> str:
+    """Asignaciones en formato plegado con el crecimiento en bytes como peso"""
+    lines = []
+    for stat in stats:
+        if stat.size_diff <= 0:
+            continue
+        # Traceback va del marco más antiguo al más reciente, igual que las pilas plegadas
+        frames = [f"{os.path.basename(frame.filename)}:{frame.lineno}" for frame in stat.traceback]
+        lines.append(f"{';'.join(frames)} {stat.size_diff}")
+    return "\n".join(lines) + "\n"
+
+
+def allocations_report(stats: List[tracemalloc.StatisticDiff]) -> List[Dict[str, object]]:
+    """Resumen legible de los principales puntos de asignación"""
+    report = []
+    for stat in stats:
+        frame: Optional[tracemalloc.Frame] = stat.traceback[-1] if len(stat.traceback) else None
+        report.append({
+            "location": f"{frame.filename}:{frame.lineno}" if frame else None,
+            "size_diff_bytes": stat.size_diff,
+            "size_bytes": stat.size,
+            "count_diff": stat.count_diff,
+            "count": stat.count,
+        })
+    return report
@@ -0,0 +1,137 @@
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Optional
+
+from lib.metrics import DB_CONNECTIONS_CLOSED
+
+# Contexto compartido por las subpeticiones de un mismo lote (/batch)
+_current_context: ContextVar[Optional["RequestContext"]] = ContextVar("request_context", default=None)
+
+
+class SharedConnection:
+    """Préstamo de la conexión de lectura del contexto: close() la devuelve sin cerrarla"""
+
+    shared = True
+
+    def __init__(self, context: "RequestContext", connection):
+        self._context = context
+        self._connection = connection
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._connection, name)
+
+    def close(self) -> None:
+        context, self._context = self._context, None
+        if context is not None:
+            context.release(self)
+
+
+class RequestContext:
+    """Recursos reutilizables durante una petición (conexión de lectura a BD)
+
+    La conexión solo se presta para lecturas y a una subpetición cada vez; las
+    escrituras usan siempre una conexión propia del pool, con su transacción.
+    """
+
+    def __init__(self):
+        self.connection = None
+        self._lease: Optional[SharedConnection] = None
+        self._lease_thread: Optional[int] = None
+        self._reserved = False
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def get_connection(self, factory: Callable[[], Any]) -> Optional[SharedConnection]:
+        """Presta la conexión del contexto (abriéndola la primera vez); None si está ocupada"""
+        with self._lock:
+            if self._reserved or self._closed:
+                return None
+            self._reserved = True
+            connection = self.connection
+        try:
+            if connection is None or not connection.is_connected():
+                connection = factory()
+        except BaseException:
+            with self._lock:
+                self._reserved = False
+            raise
+        with self._lock:
+            self.connection = connection
+            if not connection:
+                self._reserved = False
+                return None
+            self._lease = SharedConnection(self, connection)
+            self._lease_thread = threading.get_ident()
+            return self._lease
+
+    def release(self, lease: SharedConnection) -> None:
+        with self._lock:
+            # Un préstamo ya recuperado (release_thread_lease) no libera el de otro
+            if self._lease is not lease:
+                return
+            connection = self.connection
+        # Solo lecturas: una transacción abierta es la instantánea de lectura de MySQL y se cierra
+        # confirmando, así la siguiente subpetición ve lo que otras ya han confirmado
+        try:
+            if connection.in_transaction:
+                connection.commit()
+        finally:
+            with self._lock:
+                self._lease = None
+                self._lease_thread = None
+                self._reserved = False
+                closed = self._closed
+            if closed:
+                self._close_connection()
+
+    def release_thread_lease(self) -> None:
+        """Recupera el préstamo que el hilo actual no devolvió (un controlador que falló antes de close())"""
+        with self._lock:
+            lease = self._lease if self._lease_thread == threading.get_ident() else None
+        if lease is not None:
+            lease.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            reserved = self._reserved
+        # Si sigue prestada (subpetición cancelada aún en su hilo) se cierra al devolverla
+        if not reserved:
+            self._close_connection()
+
+    def _close_connection(self) -> None:
+        with self._lock:
+            connection, self.connection = self.connection, None
+        if connection is not None:
+            connection.close()
+            if not getattr(connection, "pooled", False):
+                DB_CONNECTIONS_CLOSED.inc()
+
+
+def current_request_context() -> Optional[RequestContext]:
+    return _current_context.get()
+
+
+def release_thread_lease() -> None:
+    """Devuelve la conexión del contexto si el hilo actual la dejó prestada"""
+    context = _current_context.get()
+    if context is not None:
+        context.release_thread_lease()
+
+
+@contextmanager
+def request_context():
+    """Activa un contexto compartido; las tareas creadas dentro lo heredan"""
+    existing = _current_context.get()
+    if existing is not None:
+        yield existing
+        return
+
+    context = RequestContext()
+    token = _current_context.set(context)
+    try:
+        yield context
+    finally:
+        _current_context.reset(token)
+        context.close()
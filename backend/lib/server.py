@@ -0,0 +1,41 @@
+import os
+
+try:
+    from uvicorn.workers import UvicornWorker
+except ImportError:  # gunicorn solo hace falta en el modo de producción (gunicorn.conf.py)
+    UvicornWorker = None
+
+# Configuración del servidor de producción: gunicorn gestiona los procesos
+# (recarga ordenada con SIGHUP) y cada worker ejecuta uvicorn con uvloop/httptools
+WEB_HOST = os.environ.get("WEB_HOST", "0.0.0.0")
+WEB_PORT = int(os.environ.get("WEB_PORT", "8001"))
+WEB_WORKERS = int(os.environ.get("WEB_WORKERS", str(os.cpu_count() or 1)))
+
+# Segundos que se mantiene abierta una conexión keep-alive sin peticiones;
+# debe ser mayor que el del balanceador para que sea él quien la cierre
+KEEPALIVE_SECONDS = int(os.environ.get("KEEPALIVE_SECONDS", "75"))
+
+# Conexiones HTTP simultáneas por worker; por encima se responde 503
+WORKER_CONNECTIONS = int(os.environ.get("WORKER_CONNECTIONS", "1000"))
+
+# Tiempo que tiene un worker para terminar sus peticiones al parar o recargar
+GRACEFUL_TIMEOUT = int(os.environ.get("GRACEFUL_TIMEOUT", "30"))
+
+# Reciclar cada worker tras N peticiones (0 = nunca); el jitter evita reinicios simultáneos
+MAX_REQUESTS = int(os.environ.get("MAX_REQUESTS", "0"))
+MAX_REQUESTS_JITTER = int(os.environ.get("MAX_REQUESTS_JITTER", "0"))
+
+
+if UvicornWorker is not None:
+    class LoanUvicornWorker(UvicornWorker):
+        """Worker de uvicorn con límite de conexiones por proceso
+
+        "auto" elige uvloop y httptools (incluidos en uvicorn[standard]) y
+        vuelve a asyncio/h11 si no están instalados.
+        """
+
+        CONFIG_KWARGS = {
+            "loop": "auto",
+            "http": "auto",
+            "limit_concurrency": WORKER_CONNECTIONS,
+        }
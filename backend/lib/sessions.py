@@ -0,0 +1,285 @@
+import asyncio
+import base64
+import hashlib
+import heapq
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import Header, HTTPException, Query
+from mysql.connector import Error
+
+from lib.bulkheads import BACKGROUND, BULKHEADS
+from lib.mysql_db import get_db_connection
+
+# Duración de una sesión en segundos
+SESSION_TTL_SECONDS = int(os.environ.get("SESSION_TTL_SECONDS", str(12 * 3600)))
+
+# Clave de firma compartida por todos los workers. Sin SESSION_SECRET se genera una
+# y se guarda en SESSION_SECRET_FILE para que los workers y los reinicios la reutilicen
+SESSION_SECRET = os.environ.get("SESSION_SECRET", "")
+SESSION_SECRET_FILE = os.environ.get(
+    "SESSION_SECRET_FILE", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".session_secret")
+)
+
+# Cada cuántos segundos cada worker lee de la tabla revoked_tokens los logouts de los demás
+SESSION_REVOCATION_REFRESH = float(os.environ.get("SESSION_REVOCATION_REFRESH", "2"))
+
+# Cada lectura repasa también este margen anterior: transacciones que tardaron en confirmarse y relojes desfasados
+SESSION_REVOCATION_OVERLAP = float(os.environ.get("SESSION_REVOCATION_OVERLAP", "30"))
+
+# AUTH_LEGACY_USER_ID=1 vuelve a aceptar X-User-Id / ?user_id= sin token (solo para clientes antiguos)
+AUTH_LEGACY_USER_ID = os.environ.get("AUTH_LEGACY_USER_ID", "0") == "1"
+
+logger = logging.getLogger("auth.sessions")
+
+# Datos del perfil que viajan en el token para no consultar la base de datos en cada página
+PROFILE_CLAIMS = ("name", "username")
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _load_secret() -> bytes:
+    if SESSION_SECRET:
+        return SESSION_SECRET.encode("utf-8")
+    try:
+        with open(SESSION_SECRET_FILE, "rb") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
+    # Se escribe aparte y se enlaza: si otro worker se adelanta, todos leen la suya
+    temp_path = f"{SESSION_SECRET_FILE}.{os.getpid()}"
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(secrets.token_hex(32).encode("ascii"))
+    try:
+        os.link(temp_path, SESSION_SECRET_FILE)
+        logger.warning("SESSION_SECRET no definido; clave generada en %s", SESSION_SECRET_FILE)
+    except FileExistsError:
+        pass
+    finally:
+        os.unlink(temp_path)
+    with open(SESSION_SECRET_FILE, "rb") as f:
+        return f.read().strip()
+
+
+_secret = _load_secret()
+
+
+class Session:
+    """Sesión verificada: usuario, datos básicos del perfil y caducidad"""
+
+    __slots__ = ("user_id", "claims", "token_id", "expires_at")
+
+    def __init__(self, user_id: int, claims: Dict[str, Any], token_id: str, expires_at: int):
+        self.user_id = user_id
+        self.claims = claims
+        self.token_id = token_id
+        self.expires_at = expires_at
+
+    def profile(self) -> Dict[str, Any]:
+        return {"id": self.user_id, **{name: self.claims.get(name) for name in PROFILE_CLAIMS}}
+
+
+class RevocationList:
+    """Tokens revocados hasta que caducan (solo el identificador de 8 bytes y su caducidad)
+
+    La tabla revoked_tokens es la lista común a todos los workers. Cada uno guarda
+    una copia en memoria para comprobar los tokens sin consultar la base de datos
+    y la pone al día cada SESSION_REVOCATION_REFRESH segundos. Las entradas se
+    podan por orden de caducidad, así que la copia nunca guarda más que los tokens
+    revocados que aún serían válidos.
+    """
+
+    def __init__(self, interval: float = SESSION_REVOCATION_REFRESH):
+        self.interval = interval
+        self._revoked: Dict[str, int] = {}
+        self._expiry: List[Tuple[int, str]] = []
+        self._lock = threading.Lock()
+        # Momento de la última lectura completa de la tabla (None: nunca)
+        self._refreshed_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def revoke(self, token_id: str, expires_at: int) -> None:
+        """Guarda la revocación en la tabla y la aplica ya en este worker"""
+        connection = get_db_connection()
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(
+                    "INSERT INTO revoked_tokens (token_id, expires_at, revoked_at) VALUES (%s, %s, %s)",
+                    (token_id, expires_at, time.time()),
+                )
+            except Error as e:
+                # Ya revocado (doble logout o reintento): no es un error
+                if getattr(e, "errno", None) != 1062 and "UNIQUE" not in str(e):
+                    raise
+            connection.commit()
+            cursor.close()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+        self._add(token_id, expires_at)
+
+    def refresh(self) -> int:
+        """Añade las revocaciones de la tabla posteriores a la última lectura; devuelve cuántas leyó"""
+        started = time.time()
+        since = self._refreshed_at - SESSION_REVOCATION_OVERLAP if self._refreshed_at is not None else None
+        connection = get_db_connection()
+        try:
+            cursor = connection.cursor()
+            if since is None:
+                cursor.execute("SELECT token_id, expires_at FROM revoked_tokens WHERE expires_at > %s", (int(started),))
+            else:
+                cursor.execute("SELECT token_id, expires_at FROM revoked_tokens WHERE revoked_at >= %s", (since,))
+            rows = cursor.fetchall()
+            cursor.close()
+        finally:
+            connection.close()
+        for token_id, expires_at in rows:
+            self._add(token_id, expires_at)
+        self._refreshed_at = started
+        return len(rows)
+
+    def is_revoked(self, token_id: str) -> bool:
+        # Lectura sin candado: un dict admite consultas concurrentes
+        return token_id in self._revoked
+
+    def _add(self, token_id: str, expires_at: int) -> None:
+        with self._lock:
+            now = int(time.time())
+            self._prune(now)
+            if expires_at > now and token_id not in self._revoked:
+                self._revoked[token_id] = expires_at
+                heapq.heappush(self._expiry, (expires_at, token_id))
+
+    def _prune(self, now: int) -> None:
+        while self._expiry and self._expiry[0][0] <= now:
+            _, token_id = heapq.heappop(self._expiry)
+            self._revoked.pop(token_id, None)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await BULKHEADS[BACKGROUND].run(self.refresh)
+            except Exception as e:
+                # Se sigue con la copia anterior hasta que la base de datos responda
+                logger.warning("No se pudieron leer los tokens revocados: %s", e)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+
+revoked_tokens = RevocationList()
+
+
+def _sign(payload: str) -> str:
+    return _b64(hmac.new(_secret, payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def issue_session_token(user: Dict[str, Any], ttl: int = SESSION_TTL_SECONDS) -> Dict[str, Any]:
+    """Token firmado (HMAC-SHA256) con el id del usuario y sus datos básicos"""
+    now = int(time.time())
+    claims = {
+        "sub": user["id"],
+        "iat": now,
+        "exp": now + ttl,
+        "jti": _b64(secrets.token_bytes(8)),
+        **{name: user.get(name) for name in PROFILE_CLAIMS},
+    }
+    payload = _b64(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    return {"token": f"{payload}.{_sign(payload)}", "token_type": "bearer", "expires_in": ttl}
+
+
+def decode_session_token(token: str) -> Optional[Session]:
+    """Comprueba firma, caducidad y revocación sin consultar la base de datos"""
+    payload, _, signature = token.partition(".")
+    if not signature:
+        return None
+    try:
+        if not hmac.compare_digest(_sign(payload), signature):
+            return None
+        claims = json.loads(_unb64(payload))
+    except (ValueError, UnicodeError):
+        return None
+    if claims.get("exp", 0) <= time.time() or revoked_tokens.is_revoked(claims.get("jti", "")):
+        return None
+    return Session(int(claims["sub"]), claims, claims["jti"], claims["exp"])
+
+
+def bearer_token(authorization: Optional[str]) -> Optional[str]:
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return token.strip()
+
+
+def get_current_session(authorization: Optional[str] = Header(default=None)) -> Session:
+    """Dependencia: sesión del token Bearer; 401 si falta, es inválido, ha caducado o se revocó"""
+    token = bearer_token(authorization)
+    session = decode_session_token(token) if token else None
+    if session is None:
+        raise HTTPException(status_code=401, detail="Sesión no válida o caducada", headers={"WWW-Authenticate": "Bearer"})
+    return session
+
+
+def get_current_user_id(
+    authorization: Optional[str] = Header(default=None),
+    x_user_id: Optional[int] = Header(default=None, alias="X-User-Id"),
+    qp_user_id: Optional[int] = Query(default=None, alias="user_id"),
+) -> int:
+    """Dependencia: id del usuario de la sesión (o el identificador heredado mientras esté permitido)"""
+    token = bearer_token(authorization)
+    if token or not AUTH_LEGACY_USER_ID:
+        return get_current_session(authorization).user_id
+    uid = x_user_id or qp_user_id
+    if uid is None:
+        raise HTTPException(status_code=401, detail="Sesión no válida o caducada", headers={"WWW-Authenticate": "Bearer"})
+    return uid
+
+
+def revoke_session(session: Session) -> None:
+    revoked_tokens.revoke(session.token_id, session.expires_at)
+
+
+def prune_revoked_tokens() -> int:
+    """Borra de la tabla las revocaciones de tokens ya caducados"""
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("DELETE FROM revoked_tokens WHERE expires_at <= %s", (int(time.time()),))
+        deleted = cursor.rowcount
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+    return deleted
@@ -0,0 +1,72 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from lib.db_router import last_write_marker
+from lib.deadlines import DeadlineExceededError, remaining_time
+from lib.metrics import SINGLE_FLIGHT_REQUESTS
+
+
+def _freeze(value: Any) -> Hashable:
+    """Forma canónica y hashable de un parámetro (conjuntos ordenados, modelos como pares)"""
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(_freeze(item) for item in value))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if hasattr(value, "dict"):
+        return _freeze(value.dict(exclude_none=True))
+    return value
+
+
+def flight_key(route: str, user_id: Optional[int], **params: Any) -> Tuple[Hashable, ...]:
+    """Clave (ruta, usuario, parámetros normalizados)
+
+    Incluye la marca de la última escritura del usuario: una lectura que empieza
+    después de que el usuario escriba no se une a una anterior a la escritura.
+    """
+    return (route, user_id, last_write_marker(user_id), _freeze(params))
+
+
+class SingleFlight:
+    """Une las lecturas idénticas simultáneas del worker en una sola ejecución
+
+    La primera petición (líder) lanza el cálculo en una tarea propia; las que
+    llegan mientras sigue en marcha esperan a esa tarea y reciben el mismo
+    resultado o la misma excepción. Si el líder se cancela (cliente
+    desconectado) la tarea sigue para los demás.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, asyncio.Task] = {}
+
+    async def run(self, key: Tuple[Hashable, ...], compute: Callable[[], Awaitable[Any]]) -> Any:
+        route = key[0]
+        task = self._flights.get(key)
+        if task is None:
+            SINGLE_FLIGHT_REQUESTS.labels(route, "leader").inc()
+            task = asyncio.ensure_future(compute())
+            self._flights[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            SINGLE_FLIGHT_REQUESTS.labels(route, "coalesced").inc()
+
+        # Cada petición espera como mucho lo que le queda de su propio plazo
+        budget = remaining_time()
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), budget)
+        except asyncio.TimeoutError:
+            raise DeadlineExceededError("Tiempo de la petición agotado esperando una lectura compartida")
+
+    def _finish(self, key: Tuple[Hashable, ...], task: asyncio.Task) -> None:
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        # Marca la excepción como recogida aunque nadie siga esperando
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,253 @@
+import re
+import sqlite3
+from typing import Any, Optional, Sequence, Type
+
+# Sustituto local de MySQL (benchmarks, pruebas y despliegues de un solo nodo).
+# Adapta la API de mysql.connector que usan los controladores: marcadores %s,
+# cursores dictionary=True, is_connected() y errores del tipo de MySQL.
+
+_PLACEHOLDER_RE = re.compile(r"%s")
+_FOR_UPDATE_RE = re.compile(r"\s+FOR\s+UPDATE(\s+SKIP\s+LOCKED)?\b", re.IGNORECASE)
+
+SQLITE_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        username TEXT UNIQUE NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        phone TEXT,
+        address TEXT,
+        profile_image TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS loans (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        lender_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        borrower_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        loan_type TEXT NOT NULL CHECK (loan_type IN ('money', 'object')),
+        amount REAL NULL,
+        object_name TEXT NULL,
+        object_description TEXT NULL,
+        object_image TEXT NULL,
+        loan_date DATE NOT NULL,
+        due_date DATE NOT NULL,
+        return_date DATE NULL,
+        status TEXT DEFAULT 'active' CHECK (status IN ('active', 'returned', 'overdue')),
+        notes TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_lender_created ON loans (lender_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_borrower_created ON loans (borrower_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_lender_status_due ON loans (lender_id, status, due_date)",
+    "CREATE INDEX IF NOT EXISTS idx_borrower_status_due ON loans (borrower_id, status, due_date)",
+    "DROP INDEX IF EXISTS idx_lender",
+    "DROP INDEX IF EXISTS idx_borrower",
+    "CREATE INDEX IF NOT EXISTS idx_status ON loans (status)",
+    "CREATE INDEX IF NOT EXISTS idx_due_date ON loans (due_date)",
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_loans_updated_at AFTER UPDATE ON loans
+    FOR EACH ROW WHEN NEW.updated_at = OLD.updated_at
+    BEGIN
+        UPDATE loans SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+    END
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS notifications (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        title TEXT NOT NULL,
+        message TEXT NOT NULL,
+        type TEXT DEFAULT 'info' CHECK (type IN ('info', 'warning', 'error', 'success')),
+        is_read BOOLEAN DEFAULT FALSE,
+        loan_id INTEGER NULL REFERENCES loans(id) ON DELETE SET NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_user_created ON notifications (user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_user_read_created ON notifications (user_id, is_read, created_at)",
+    "DROP INDEX IF EXISTS idx_user",
+    "CREATE INDEX IF NOT EXISTS idx_read ON notifications (is_read)",
+    "CREATE INDEX IF NOT EXISTS idx_created ON notifications (created_at)",
+    '''
+    CREATE TABLE IF NOT EXISTS change_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        entity TEXT NOT NULL CHECK (entity IN ('loan', 'notification')),
+        entity_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        operation TEXT NOT NULL CHECK (operation IN ('insert', 'update', 'delete')),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_entity_user ON change_log (entity, user_id, id)",
+    '''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        queue TEXT NOT NULL,
+        task TEXT NOT NULL,
+        payload TEXT NULL,
+        status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'done', 'dead')),
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL,
+        run_at REAL NOT NULL,
+        locked_by TEXT NULL,
+        locked_until REAL NULL,
+        finished_at REAL NULL,
+        last_error TEXT NULL,
+        dedupe_key TEXT NULL UNIQUE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_queue_status_run ON jobs (queue, status, run_at)",
+    "CREATE INDEX IF NOT EXISTS idx_status_finished ON jobs (status, finished_at)",
+    '''
+    CREATE TABLE IF NOT EXISTS revoked_tokens (
+        token_id TEXT PRIMARY KEY,
+        expires_at INTEGER NOT NULL,
+        revoked_at REAL NOT NULL
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_revoked_at ON revoked_tokens (revoked_at)",
+    "CREATE INDEX IF NOT EXISTS idx_expires_at ON revoked_tokens (expires_at)",
+    '''
+    CREATE TABLE IF NOT EXISTS webhook_subscriptions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        url TEXT NOT NULL,
+        secret TEXT NOT NULL,
+        events TEXT NULL,
+        active BOOLEAN NOT NULL DEFAULT TRUE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_user_active ON webhook_subscriptions (user_id, active)",
+    '''
+    CREATE TABLE IF NOT EXISTS webhook_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        event TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS webhook_deliveries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        subscription_id INTEGER NOT NULL REFERENCES webhook_subscriptions(id) ON DELETE CASCADE,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'delivered', 'dead')),
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL,
+        locked_by TEXT NULL,
+        locked_until REAL NULL,
+        last_status INTEGER NULL,
+        last_error TEXT NULL,
+        delivered_at REAL NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_status_next ON webhook_deliveries (status, next_attempt_at)",
+    "CREATE INDEX IF NOT EXISTS idx_subscription_status ON webhook_deliveries (subscription_id, status)",
+)
+
+
+def translate_query(query: str) -> str:
+    """Convierte una consulta con sintaxis de mysql.connector a SQLite"""
+    query = _FOR_UPDATE_RE.sub("", query)
+    return _PLACEHOLDER_RE.sub("?", query)
+
+
+def _dict_row(cursor: sqlite3.Cursor, row: Sequence[Any]) -> dict:
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+class SQLiteCursor:
+    """Cursor con la interfaz que usan los controladores"""
+
+    def __init__(self, cursor: sqlite3.Cursor, error_class: Type[Exception]):
+        self._cursor = cursor
+        self._error_class = error_class
+        self._first_rowid: Optional[int] = None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, query: str, params: Optional[Sequence[Any]] = None):
+        try:
+            result = self._cursor.execute(translate_query(query), tuple(params or ()))
+        except sqlite3.Error as e:
+            raise self._error_class(msg=str(e)) from e
+        # Como en MySQL, tras un INSERT de varias filas lastrowid es el id de la primera
+        if self._cursor.rowcount > 1 and query.lstrip()[:6].upper() == "INSERT":
+            self._first_rowid = self._cursor.lastrowid - self._cursor.rowcount + 1
+        else:
+            self._first_rowid = None
+        return result
+
+    @property
+    def lastrowid(self) -> Optional[int]:
+        if self._first_rowid is not None:
+            return self._first_rowid
+        return self._cursor.lastrowid
+
+    def executemany(self, query: str, seq_params):
+        try:
+            return self._cursor.executemany(translate_query(query), [tuple(p) for p in seq_params])
+        except sqlite3.Error as e:
+            raise self._error_class(msg=str(e)) from e
+
+
+class SQLiteConnection:
+    """Conexión SQLite que imita a MySQLConnection en lo necesario"""
+
+    def __init__(self, path: str, error_class: Type[Exception], timeout: float = 30.0):
+        self._error_class = error_class
+        self._connection = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self._connection.execute("PRAGMA foreign_keys = ON")
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        self._open = True
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._connection, name)
+
+    def cursor(self, dictionary: bool = False, **kwargs) -> SQLiteCursor:
+        cursor = self._connection.cursor()
+        if dictionary:
+            cursor.row_factory = _dict_row
+        return SQLiteCursor(cursor, self._error_class)
+
+    def is_connected(self) -> bool:
+        return self._open
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._connection.in_transaction
+
+    def commit(self) -> None:
+        self._connection.commit()
+
+    def rollback(self) -> None:
+        self._connection.rollback()
+
+    def close(self) -> None:
+        self._open = False
+        self._connection.close()
+
+
+def init_sqlite_schema(connection: SQLiteConnection) -> None:
+    """Crea las tablas equivalentes al esquema MySQL"""
+    cursor = connection.cursor()
+    for statement in SQLITE_SCHEMA:
+        cursor.execute(statement)
+    connection.commit()
+    cursor.close()
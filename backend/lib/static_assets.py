@@ -0,0 +1,224 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+from typing import Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+from fastapi.staticfiles import StaticFiles
+
+from lib.metrics import record_cache
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se sirve gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Directorio raíz del frontend (relativo al directorio de ejecución)
+FRONTEND_DIR = "frontend"
+
+# Prefijo de las URLs con hash de contenido (caché inmutable)
+ASSET_URL_PREFIX = "/assets"
+
+# Páginas servidas por la app: nombre -> ruta dentro de FRONTEND_DIR
+PAGES = {
+    "login": "login/login.html",
+    "dashboard": "dashboard/dashboard.html",
+    "new-loan": "new-loan/new-loan.html",
+    "profile": "profile/profile.html",
+    "my-loans": "loans/my-loans.html",
+    "reports": "reports/reports.html",
+}
+
+# Políticas de caché
+PAGE_CACHE_CONTROL = "no-cache"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+STATIC_CACHE_CONTROL = "public, max-age=3600, must-revalidate"
+
+# Por debajo de este tamaño no compensa comprimir
+MIN_COMPRESS_SIZE = 512
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+_STATIC_REF_RE = re.compile(r"""(?P<attr>(?:src|href)=["'])/static/(?P<path>[^"'?#]+)""")
+
+
+class StaticAsset:
+    """Archivo del frontend cargado en memoria con sus variantes comprimidas"""
+
+    def __init__(self, path: str, body: bytes, media_type: str):
+        self.path = path
+        self.media_type = media_type
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        self.etag = f'"{self.digest}"'
+        self.variants: Dict[str, bytes] = {"identity": body}
+
+        if len(body) >= MIN_COMPRESS_SIZE and media_type.startswith(COMPRESSIBLE_TYPES):
+            gz = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(gz) < len(body):
+                self.variants["gzip"] = gz
+            if brotli is not None:
+                br = brotli.compress(body, quality=11)
+                if len(br) < len(body):
+                    self.variants["br"] = br
+
+    @property
+    def hashed_url(self) -> str:
+        return f"{ASSET_URL_PREFIX}/{self.digest}/{self.path}"
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """Convierte la cabecera Accept-Encoding en un diccionario codificación -> q"""
+    accepted: Dict[str, float] = {}
+    if not header:
+        return accepted
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+    return accepted
+
+
+def choose_encoding(header: Optional[str], available) -> str:
+    """Elige la mejor codificación disponible aceptada por el cliente"""
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*", 0.0)
+    # Preferencia del servidor: brotli comprime mejor que gzip
+    for encoding in ("br", "gzip"):
+        if encoding in available and accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return "identity"
+
+
+class StaticAssetStore:
+    """Carga el frontend en memoria al arrancar y lo sirve con caché HTTP"""
+
+    def __init__(self, root: str = FRONTEND_DIR):
+        self.root = root
+        self.assets: Dict[str, StaticAsset] = {}
+
+    def load(self) -> int:
+        """Lee todos los archivos del frontend y precalcula sus variantes"""
+        raw: Dict[str, bytes] = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                rel_path = os.path.relpath(full_path, self.root).replace(os.sep, "/")
+                with open(full_path, "rb") as f:
+                    raw[rel_path] = f.read()
+
+        assets: Dict[str, StaticAsset] = {}
+        # Primero los recursos que no son HTML, para conocer sus hashes
+        for rel_path, body in raw.items():
+            if not rel_path.endswith(".html"):
+                assets[rel_path] = StaticAsset(rel_path, body, _guess_type(rel_path))
+
+        # Después las páginas, reescribiendo /static/... a URLs con hash
+        for rel_path, body in raw.items():
+            if rel_path.endswith(".html"):
+                body = self._rewrite_static_refs(body, assets)
+                assets[rel_path] = StaticAsset(rel_path, body, _guess_type(rel_path))
+
+        self.assets = assets
+        logger.info(
+            "Frontend cargado en memoria: %d archivos (brotli %s)",
+            len(assets), "activo" if brotli else "no disponible"
+        )
+        return len(assets)
+
+    def _rewrite_static_refs(self, body: bytes, assets: Dict[str, StaticAsset]) -> bytes:
+        text = body.decode("utf-8")
+
+        def replace(match):
+            asset = assets.get(match.group("path"))
+            if asset is None:
+                return match.group(0)
+            return f"{match.group('attr')}{asset.hashed_url}"
+
+        return _STATIC_REF_RE.sub(replace, text).encode("utf-8")
+
+    def get(self, path: str) -> Optional[StaticAsset]:
+        if not self.assets:
+            self.load()
+        return self.assets.get(path)
+
+    def page_response(self, name: str, request: Request) -> Response:
+        """Respuesta para una página HTML (revalidación con ETag)"""
+        asset = self.get(PAGES[name])
+        if asset is None:
+            return Response(status_code=404)
+        return self.build_response(asset, request, PAGE_CACHE_CONTROL)
+
+    def hashed_response(self, digest: str, path: str, request: Request) -> Response:
+        """Respuesta para un recurso con hash en la URL (caché inmutable)"""
+        asset = self.get(path)
+        if asset is None or asset.digest != digest:
+            return Response(status_code=404)
+        return self.build_response(asset, request, IMMUTABLE_CACHE_CONTROL)
+
+    def build_response(self, asset: StaticAsset, request: Request, cache_control: str) -> Response:
+        headers = {
+            "ETag": asset.etag,
+            "Cache-Control": cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if _etag_matches(request.headers.get("if-none-match"), asset.etag):
+            record_cache("http_etag", hit=True)
+            return Response(status_code=304, headers=headers)
+        record_cache("http_etag", hit=False)
+
+        encoding = choose_encoding(request.headers.get("accept-encoding"), asset.variants)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        # Cabecera ya completa: con media_type Starlette volvería a añadir el charset a text/*
+        headers["Content-Type"] = asset.media_type
+        return Response(content=asset.variants[encoding], headers=headers)
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles con política de Cache-Control para /static"""
+
+    def __init__(self, *args, cache_control: str = STATIC_CACHE_CONTROL, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_control = cache_control
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers.setdefault("Cache-Control", self.cache_control)
+        return response
+
+
+def _guess_type(path: str) -> str:
+    media_type, _ = mimetypes.guess_type(path)
+    media_type = media_type or "application/octet-stream"
+    if media_type.startswith("text/") or media_type == "application/javascript":
+        media_type += "; charset=utf-8"
+    return media_type
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header.split(",")]
+    # Comparación débil: ignorar el prefijo W/ que añaden algunos proxies
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+# Instancia compartida por la app
+asset_store = StaticAssetStore()
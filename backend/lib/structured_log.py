@@ -0,0 +1,153 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
+from typing import Any, Dict, Optional
+
+from lib.tracing import current_trace
+
+# Nivel general y niveles por categoría (nombre de logger y sus hijos):
+# LOG_LEVELS="db=WARNING,routes.loans=DEBUG"
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.environ.get("LOG_LEVELS", "db.connect=WARNING")
+
+# Fracción de eventos que se escriben en categorías de mucho volumen: LOG_SAMPLING="routes=0.1"
+LOG_SAMPLING = os.environ.get("LOG_SAMPLING", "")
+
+# Sin LOG_FILE los registros van a la salida estándar
+LOG_FILE = os.environ.get("LOG_FILE")
+
+# Registros pendientes como máximo; si el hilo escritor no da abasto se descartan en lugar de bloquear
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+
+
+def _parse_pairs(raw: str) -> Dict[str, str]:
+    pairs = {}
+    for item in raw.split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip():
+            pairs[name.strip()] = value.strip()
+    return pairs
+
+
+def log_fields(**fields: Any) -> Dict[str, Any]:
+    """extra= con campos estructurados; se serializan en el hilo escritor, no en la petición"""
+    return {"fields": fields}
+
+
+def _json_default(value: Any) -> Any:
+    if hasattr(value, "dict"):
+        return value.dict(exclude_unset=True)
+    return str(value)
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro con sus campos estructurados"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            entry["trace_id"] = trace_id
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=_json_default, ensure_ascii=False, separators=(",", ":"))
+
+
+class SamplingFilter(logging.Filter):
+    """Deja pasar solo una fracción de los eventos de las categorías indicadas (nunca los WARNING o más)"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._resolved: Dict[str, Optional[float]] = {}
+
+    def _rate(self, name: str) -> Optional[float]:
+        if name not in self._resolved:
+            rate = None
+            candidate = name
+            while candidate:
+                if candidate in self.rates:
+                    rate = self.rates[candidate]
+                    break
+                candidate = candidate.rpartition(".")[0]
+            self._resolved[name] = rate
+        return self._resolved[name]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        return rate is None or random.random() < rate
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Encola el registro sin formatearlo: el mensaje y el JSON se componen en el hilo escritor"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # El contexto de la petición solo se puede leer desde su propio hilo
+        trace = current_trace()
+        if trace is not None and trace.trace_id:
+            record.trace_id = trace.trace_id
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+_listener: Optional[QueueListener] = None
+
+
+def configure_logging() -> None:
+    """Sustituye los handlers del logger raíz por la cola y arranca el hilo escritor"""
+    global _listener
+    if _listener is not None:
+        return
+
+    if LOG_FILE:
+        output: logging.Handler = WatchedFileHandler(LOG_FILE, encoding="utf-8")
+    else:
+        output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = DeferredQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter({name: float(rate) for name, rate in _parse_pairs(LOG_SAMPLING).items()}))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    for name, level in _parse_pairs(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Vacía la cola y detiene el hilo escritor"""
+    global _listener
+    if _listener is not None:
+        try:
+            _listener.stop()
+        except queue.Full:
+            pass
+        _listener = None
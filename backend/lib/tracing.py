@@ -0,0 +1,143 @@
+import functools
+import os
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+from starlette.datastructures import MutableHeaders
+
+from lib.jsonl_writer import JsonLinesWriter
+
+# Fracción de peticiones cuyo detalle completo se guarda en TRACE_FILE
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_FILE = os.environ.get("TRACE_FILE", "traces.jsonl")
+
+# Máximo de spans guardados por traza muestreada
+MAX_SPANS = 200
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+
+
+class Trace:
+    """Spans de una petición: totales por clave y, si está muestreada, el detalle"""
+
+    __slots__ = ("trace_id", "started", "totals", "counts", "spans", "sampled")
+
+    def __init__(self, sampled: bool = False):
+        self.trace_id = uuid.uuid4().hex if sampled else ""
+        self.started = time.perf_counter()
+        self.totals: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.spans: List[Dict[str, Any]] = []
+        self.sampled = sampled
+
+    def add(self, key: str, start: float, duration: float, label: Optional[str] = None) -> None:
+        self.totals[key] = self.totals.get(key, 0.0) + duration
+        self.counts[key] = self.counts.get(key, 0) + 1
+        if self.sampled and len(self.spans) < MAX_SPANS:
+            self.spans.append({
+                "name": key,
+                "label": label,
+                "start_ms": round((start - self.started) * 1000, 3),
+                "duration_ms": round(duration * 1000, 3),
+            })
+
+    def server_timing(self) -> str:
+        """Valor de la cabecera Server-Timing con los totales acumulados"""
+        entries = []
+        for key, total in self.totals.items():
+            count = self.counts[key]
+            desc = f';desc="{count}x"' if count > 1 else ""
+            entries.append(f"{key};dur={total * 1000:.2f}{desc}")
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.2f}")
+        return ", ".join(entries)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def record_span(key: str, start: float, duration: float, label: Optional[str] = None) -> None:
+    """Añade un span ya medido a la traza en curso (si la hay)"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(key, start, duration, label)
+
+
+@contextmanager
+def span(key: str, label: Optional[str] = None):
+    """Mide un bloque de código como span de la traza en curso"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(key, start, time.perf_counter() - start, label)
+
+
+def traced(func: Callable) -> Callable:
+    """Decorador que registra la función de controlador como span"""
+    key = f"ctrl.{func.__name__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        trace = _current_trace.get()
+        if trace is None:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            trace.add(key, start, time.perf_counter() - start)
+
+    return wrapper
+
+
+trace_writer = JsonLinesWriter(TRACE_FILE)
+
+
+class TracingMiddleware:
+    """Middleware ASGI que abre una traza por petición y devuelve Server-Timing"""
+
+    def __init__(self, app, sample_rate: float = TRACE_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(sampled=random.random() < self.sample_rate)
+        token = _current_trace.set(trace)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", trace.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(token)
+            if trace.sampled:
+                route = scope.get("route")
+                trace_writer.submit({
+                    "trace_id": trace.trace_id,
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": getattr(route, "path", None),
+                    "status": status_code,
+                    "duration_ms": round((time.perf_counter() - trace.started) * 1000, 3),
+                    "spans": trace.spans,
+                })
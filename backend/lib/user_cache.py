@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from lib.metrics import record_cache
+
+# Número máximo de usuarios en memoria por worker
+USER_CACHE_SIZE = 5000
+
+# Segundos que una entrada se considera válida (acota datos obsoletos entre workers)
+USER_CACHE_TTL = 300
+
+
+class UserDirectoryCache:
+    """Caché LRU acotada de usuarios: id -> perfil y username -> id
+
+    Solo guarda el perfil: el hash de la contraseña no entra nunca, para que un
+    cambio de contraseña en otra instancia no deje el hash anterior válido hasta el TTL.
+    """
+
+    def __init__(self, max_size: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._by_id: "OrderedDict[int, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._ids_by_username: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Devuelve el perfil cacheado de un usuario o None"""
+        with self._lock:
+            entry = self._by_id.get(user_id)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    self._remove(user_id)
+                self.misses += 1
+                record_cache("user_directory", hit=False)
+                return None
+            self._by_id.move_to_end(user_id)
+            self.hits += 1
+            record_cache("user_directory", hit=True)
+            return entry[1]
+
+    def get_by_username(self, username: str) -> Optional[Dict[str, Any]]:
+        """Devuelve el perfil cacheado a partir del nombre de usuario"""
+        with self._lock:
+            user_id = self._ids_by_username.get(username)
+        if user_id is None:
+            with self._lock:
+                self.misses += 1
+            record_cache("user_directory", hit=False)
+            return None
+        return self.get(user_id)
+
+    def get_many(self, user_ids: Iterable[int]) -> Tuple[Dict[int, Dict[str, Any]], set]:
+        """Devuelve (perfiles encontrados, ids que faltan)"""
+        found: Dict[int, Dict[str, Any]] = {}
+        missing = set()
+        for user_id in set(user_ids):
+            user = self.get(user_id)
+            if user is None:
+                missing.add(user_id)
+            else:
+                found[user_id] = user
+        return found, missing
+
+    def put(self, user: Dict[str, Any]) -> None:
+        """Guarda un perfil de usuario, expulsando el menos usado si está lleno"""
+        user_id = user["id"]
+        if "password_hash" in user:
+            raise ValueError("La caché de usuarios no admite el hash de la contraseña")
+        with self._lock:
+            if user_id in self._by_id:
+                self._remove(user_id)
+            self._by_id[user_id] = (time.monotonic(), user)
+            if user.get("username"):
+                self._ids_by_username[user["username"]] = user_id
+            while len(self._by_id) > self.max_size:
+                oldest_id, _ = next(iter(self._by_id.items()))
+                self._remove(oldest_id)
+
+    def invalidate(self, user_id: Optional[int] = None, username: Optional[str] = None) -> None:
+        """Elimina un usuario de la caché por id y/o username"""
+        with self._lock:
+            if username is not None and user_id is None:
+                user_id = self._ids_by_username.get(username)
+            if username is not None:
+                self._ids_by_username.pop(username, None)
+            if user_id is not None and user_id in self._by_id:
+                self._remove(user_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._by_id.clear()
+            self._ids_by_username.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._by_id),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def _remove(self, user_id: int) -> None:
+        """Elimina una entrada (el llamador debe tener el lock)"""
+        _, user = self._by_id.pop(user_id)
+        username = user.get("username")
+        if username and self._ids_by_username.get(username) == user_id:
+            del self._ids_by_username[username]
+
+
+# Instancia compartida por el worker
+user_directory = UserDirectoryCache()
@@ -0,0 +1,116 @@
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import random
+import socket
+import time
+from typing import Any, Dict, List, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+# Envíos simultáneos como máximo a un mismo destino (esquema, host y puerto) y en total
+WEBHOOK_ENDPOINT_CONCURRENCY = int(os.environ.get("WEBHOOK_ENDPOINT_CONCURRENCY", "2"))
+WEBHOOK_MAX_CONNECTIONS = int(os.environ.get("WEBHOOK_MAX_CONNECTIONS", "50"))
+
+# Segundos de espera por la respuesta de un destino
+WEBHOOK_TIMEOUT = float(os.environ.get("WEBHOOK_TIMEOUT", "10"))
+
+# Reintentos con espera exponencial y jitter; agotados, el envío pasa a 'dead'
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get("WEBHOOK_MAX_ATTEMPTS", "8"))
+WEBHOOK_RETRY_BASE = float(os.environ.get("WEBHOOK_RETRY_BASE", "10"))
+WEBHOOK_RETRY_MAX = float(os.environ.get("WEBHOOK_RETRY_MAX", "3600"))
+
+# Con WEBHOOK_ALLOW_PRIVATE=1 se admiten destinos en la red interna (desarrollo y pruebas)
+WEBHOOK_ALLOW_PRIVATE = os.environ.get("WEBHOOK_ALLOW_PRIVATE", "0") == "1"
+
+SIGNATURE_HEADER = "X-Webhook-Signature"
+TIMESTAMP_HEADER = "X-Webhook-Timestamp"
+DELIVERY_HEADER = "X-Webhook-Id"
+
+
+class DeliveryResult(NamedTuple):
+    delivery_id: int
+    ok: bool
+    status: Optional[int]
+    error: Optional[str]
+
+
+def sign_payload(secret: str, timestamp: str, body: bytes) -> str:
+    """Firma HMAC-SHA256 de "timestamp.cuerpo"; el destino la recalcula con su secreto"""
+    digest = hmac.new(secret.encode("utf-8"), timestamp.encode("ascii") + b"." + body, hashlib.sha256).hexdigest()
+    return f"sha256={digest}"
+
+
+def retry_delay(attempts: int) -> float:
+    """Espera antes del siguiente intento (full jitter)"""
+    return random.uniform(0, min(WEBHOOK_RETRY_MAX, WEBHOOK_RETRY_BASE * 2 ** max(0, attempts - 1)))
+
+
+def is_public_url(url: str) -> bool:
+    """El host resuelve solo a direcciones públicas (evita que un webhook apunte a la red interna)"""
+    host = urlsplit(url).hostname
+    if not host:
+        return False
+    if WEBHOOK_ALLOW_PRIVATE:
+        return True
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except OSError:
+        return False
+    return all(ipaddress.ip_address(address.split("%")[0]).is_global for address in addresses)
+
+
+def _endpoint(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.hostname}:{parts.port or ''}"
+
+
+class WebhookSender:
+    """Envía lotes de eventos con un pool de conexiones HTTP compartido
+
+    Cada destino admite como mucho WEBHOOK_ENDPOINT_CONCURRENCY envíos a la vez,
+    así que un destino lento no acapara el pool ni retrasa a los demás.
+    """
+
+    def __init__(
+        self,
+        endpoint_concurrency: int = WEBHOOK_ENDPOINT_CONCURRENCY,
+        max_connections: int = WEBHOOK_MAX_CONNECTIONS,
+        timeout: float = WEBHOOK_TIMEOUT,
+    ):
+        self.endpoint_concurrency = endpoint_concurrency
+        self.max_connections = max_connections
+        self.timeout = timeout
+
+    async def send_all(self, deliveries: List[Dict[str, Any]]) -> List[DeliveryResult]:
+        semaphores: Dict[str, asyncio.Semaphore] = {}
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+        # Sin seguir redirecciones: el destino es la URL registrada
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits, follow_redirects=False) as client:
+            return await asyncio.gather(*(self._send(client, semaphores, delivery) for delivery in deliveries))
+
+    async def _send(self, client: httpx.AsyncClient, semaphores: Dict[str, asyncio.Semaphore], delivery: Dict[str, Any]) -> DeliveryResult:
+        body = json.dumps(
+            {"delivery_id": delivery["id"], "attempt": delivery["attempts"], "events": json.loads(delivery["payload"])},
+            separators=(",", ":"),
+        ).encode("utf-8")
+        timestamp = str(int(time.time()))
+        headers = {
+            "Content-Type": "application/json",
+            DELIVERY_HEADER: str(delivery["id"]),
+            TIMESTAMP_HEADER: timestamp,
+            SIGNATURE_HEADER: sign_payload(delivery["secret"], timestamp, body),
+        }
+        semaphore = semaphores.setdefault(_endpoint(delivery["url"]), asyncio.Semaphore(self.endpoint_concurrency))
+        async with semaphore:
+            try:
+                response = await client.post(delivery["url"], content=body, headers=headers)
+            except httpx.HTTPError as e:
+                return DeliveryResult(delivery["id"], False, None, f"{type(e).__name__}: {e}")
+        if 200 <= response.status_code < 300:
+            return DeliveryResult(delivery["id"], True, response.status_code, None)
+        return DeliveryResult(delivery["id"], False, response.status_code, f"HTTP {response.status_code}")
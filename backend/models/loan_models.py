@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, validator
-from typing import Optional, Literal
+from typing import Optional, Literal, Union, Any
 from datetime import date, datetime
 from enum import Enum
 
@@ -12,6 +12,11 @@ class LoanStatus(str, Enum):
     RETURNED = "returned"
     OVERDUE = "overdue"
 
+class WebhookEvent(str, Enum):
+    LOAN_CREATED = "loan.created"
+    LOAN_RETURNED = "loan.returned"
+    LOAN_OVERDUE = "loan.overdue"
+
 class NotificationType(str, Enum):
     INFO = "info"
     WARNING = "warning"
@@ -108,6 +113,29 @@ class LoanResponse(BaseModel):
     lender_name: Optional[str] = None
     borrower_name: Optional[str] = None
 
+class LoanPartialResponse(BaseModel):
+    """Préstamo con solo los campos pedidos mediante ?fields="""
+    id: int
+    lender_id: Optional[int] = None
+    borrower_id: Optional[int] = None
+    loan_type: Optional[LoanType] = None
+    amount: Optional[float] = None
+    object_name: Optional[str] = None
+    object_description: Optional[str] = None
+    object_image: Optional[str] = None
+    loan_date: Optional[date] = None
+    due_date: Optional[date] = None
+    return_date: Optional[date] = None
+    status: Optional[LoanStatus] = None
+    notes: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    lender_name: Optional[str] = None
+    borrower_name: Optional[str] = None
+
+# Préstamo completo o reducido a los campos pedidos
+LoanListItem = Union[LoanResponse, LoanPartialResponse]
+
 # Modelos para notificaciones
 class NotificationCreate(BaseModel):
     user_id: int
@@ -152,6 +180,60 @@ class LoanStats(BaseModel):
 class DashboardData(BaseModel):
     user: UserResponse
     stats: LoanStats
-    recent_loans: list[LoanResponse]
-    overdue_loans: list[LoanResponse]
+    recent_loans: list[LoanListItem]
+    overdue_loans: list[LoanListItem]
     notifications: list[NotificationResponse]
+
+# Modelos para sincronización incremental
+class ChangeEntry(BaseModel):
+    op: Literal["insert", "update", "delete"]
+    id: int
+    data: Optional[Any] = None
+
+class ChangeFeed(BaseModel):
+    changes: list[ChangeEntry]
+    next_token: str
+    has_more: bool = False
+    reset: bool = False
+
+# Modelos para peticiones en lote
+class BatchSubRequest(BaseModel):
+    id: Optional[str] = None
+    method: Literal["GET", "POST", "PUT", "DELETE"] = "GET"
+    path: str = Field(..., pattern=r'^/')
+    headers: dict[str, str] = Field(default_factory=dict)
+    body: Optional[Any] = None
+
+class BatchRequest(BaseModel):
+    requests: list[BatchSubRequest] = Field(..., min_length=1, max_length=20)
+
+class BatchSubResponse(BaseModel):
+    id: Optional[str] = None
+    status: int
+    body: Optional[Any] = None
+
+class BatchResponse(BaseModel):
+    responses: list[BatchSubResponse]
+
+# Modelos para webhooks
+class WebhookCreate(BaseModel):
+    url: str = Field(..., pattern=r'^https?://', max_length=500)
+    # Sin eventos se reciben todos
+    events: Optional[list[WebhookEvent]] = None
+
+class WebhookSubscription(BaseModel):
+    id: int
+    url: str
+    events: list[str]
+    active: bool
+    created_at: str
+
+class WebhookDeadLetter(BaseModel):
+    id: int
+    subscription_id: int
+    url: str
+    events: int
+    attempts: int
+    last_status: Optional[int] = None
+    last_error: Optional[str] = None
+    created_at: str
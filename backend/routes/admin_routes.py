@@ -0,0 +1,66 @@
+import asyncio
+import hmac
+import os
+from fastapi import APIRouter, HTTPException, Header, Query, Depends
+from fastapi.responses import PlainTextResponse
+from lib.profiler import (
+    sample_cpu, track_allocations, folded_cpu, folded_allocations, allocations_report,
+    ProfilerBusyError, MAX_PROFILE_SECONDS
+)
+from lib.structured_log import log_fields
+import logging
+
+logger = logging.getLogger("routes.admin")
+
+# Sin ADMIN_TOKEN configurado las rutas de administración quedan desactivadas
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+def require_admin(x_admin_token: str | None = Header(default=None, alias="X-Admin-Token")) -> None:
+    """Permite el acceso solo con el token de administración configurado"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="No autorizado")
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    include_in_schema=False,
+    dependencies=[Depends(require_admin)],
+)
+
+@router.post("/profile/cpu")
+async def profile_cpu(
+    seconds: float = Query(10, gt=0, le=MAX_PROFILE_SECONDS, description="Duración del muestreo"),
+    interval_ms: float = Query(5, ge=1, le=1000, description="Intervalo entre muestras")
+):
+    """Perfil de CPU por muestreo del worker; devuelve pilas plegadas para flamegraph"""
+    logger.info("POST /admin/profile/cpu", extra=log_fields(seconds=seconds, interval_ms=interval_ms))
+    try:
+        # El muestreo corre en otro hilo para que el event loop siga atendiendo tráfico real
+        stacks = await asyncio.to_thread(sample_cpu, seconds, interval_ms / 1000)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(
+        folded_cpu(stacks),
+        headers={"Content-Disposition": 'attachment; filename="cpu-profile.folded"'}
+    )
+
+@router.post("/profile/memory")
+async def profile_memory(
+    seconds: float = Query(10, gt=0, le=MAX_PROFILE_SECONDS, description="Intervalo entre snapshots"),
+    top: int = Query(25, ge=1, le=500, description="Número de puntos de asignación"),
+    format: str = Query("json", pattern="^(json|folded)$", description="json o folded (flamegraph)")
+):
+    """Diferencia entre dos snapshots de tracemalloc con los principales puntos de asignación"""
+    logger.info("POST /admin/profile/memory", extra=log_fields(seconds=seconds, top=top))
+    try:
+        stats = await asyncio.to_thread(track_allocations, seconds, top)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if format == "folded":
+        return PlainTextResponse(
+            folded_allocations(stats),
+            headers={"Content-Disposition": 'attachment; filename="allocations.folded"'}
+        )
+    return {"seconds": seconds, "top": allocations_report(stats)}
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from controllers.auth_controller import (
     register_user, 
     login_user, 
@@ -9,18 +9,21 @@ from controllers.auth_controller import (
     UserLogin,
     UserUpdate
 )
+from lib.bulkheads import WorkloadRoute, run_blocking
+from lib.sessions import Session, get_current_session, get_current_user_id, revoke_session
+from lib.health import health_monitor
 
-router = APIRouter(prefix="/auth", tags=["authentication"])
+router = APIRouter(prefix="/auth", tags=["authentication"], route_class=WorkloadRoute)
 
 @router.get("/db-status")
 async def get_database_status():
-    """Verifica si la base de datos existe"""
+    """Verifica si la base de datos existe (resultado en caché, sin abrir conexiones)"""
     return check_database_status()
 
 @router.post("/register")
 async def register(user_data: UserCreate):
     """Registra un nuevo usuario"""
-    result = register_user(user_data)
+    result = await run_blocking(register_user, user_data)
     
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result["message"])
@@ -30,7 +33,7 @@ async def register(user_data: UserCreate):
 @router.post("/login")
 async def login(login_data: UserLogin):
     """Autentica un usuario"""
-    result = login_user(login_data)
+    result = await run_blocking(login_user, login_data)
     
     if not result["success"]:
         raise HTTPException(status_code=401, detail=result["message"])
@@ -40,14 +43,28 @@ async def login(login_data: UserLogin):
 @router.get("/health")
 async def health_check():
     """Endpoint de salud para verificar que la API funciona"""
-    return {"status": "ok", "message": "API de autenticación funcionando"}
+    snapshot = health_monitor.snapshot()
+    return {
+        "status": "ok",
+        "message": "API de autenticación funcionando",
+        "database": snapshot.database_ok and health_monitor.is_fresh(),
+    }
+
+@router.get("/session")
+async def get_session(session: Session = Depends(get_current_session)):
+    """Datos básicos del usuario de la sesión, sacados del token sin consultar la base de datos"""
+    return {"user": session.profile(), "expires_at": session.expires_at}
+
+@router.post("/logout")
+async def logout(session: Session = Depends(get_current_session)):
+    """Revoca el token de la sesión actual en todos los workers"""
+    await run_blocking(revoke_session, session)
+    return {"success": True, "message": "Sesión cerrada"}
 
 @router.get("/profile")
-async def get_profile():
+async def get_profile(user_id: int = Depends(get_current_user_id)):
     """Obtiene el perfil del usuario actual"""
-    # Simulación de obtener usuario actual (en producción usarías JWT)
-    user_id = 1  # Por ahora hardcodeado
-    result = get_user_profile(user_id)
+    result = await run_blocking(get_user_profile, user_id)
     
     if not result["success"]:
         raise HTTPException(status_code=404, detail=result["message"])
@@ -55,11 +72,9 @@ async def get_profile():
     return result
 
 @router.put("/profile")
-async def update_profile(update_data: UserUpdate):
+async def update_profile(update_data: UserUpdate, user_id: int = Depends(get_current_user_id)):
     """Actualiza el perfil del usuario actual"""
-    # Simulación de obtener usuario actual (en producción usarías JWT)
-    user_id = 1  # Por ahora hardcodeado
-    result = update_user_profile(user_id, update_data)
+    result = await run_blocking(update_user_profile, user_id, update_data)
     
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result["message"])
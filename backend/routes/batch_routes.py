@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Request
+from controllers.batch_controller import run_batch
+from models.loan_models import BatchRequest, BatchResponse
+from lib.bulkheads import WorkloadRoute
+from lib.structured_log import log_fields
+import logging
+
+logger = logging.getLogger("routes.batch")
+
+router = APIRouter(prefix="/batch", tags=["batch"], route_class=WorkloadRoute)
+
+@router.post("", response_model=BatchResponse)
+async def execute_batch(batch: BatchRequest, request: Request):
+    """Ejecuta varias peticiones a la API en una sola llamada HTTP"""
+    responses = await run_batch(request.app, request, batch.requests)
+    logger.info("POST /batch", extra=log_fields(requests=len(batch.requests)))
+    return BatchResponse(responses=responses)
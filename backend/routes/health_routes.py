@@ -0,0 +1,28 @@
+import os
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from lib.bulkheads import BULKHEADS
+from lib.health import health_monitor
+
+router = APIRouter(prefix="/health", tags=["health"])
+
+@router.get("/live")
+async def liveness():
+    """El worker está vivo y su event loop responde (no consulta la base de datos)"""
+    return {"status": "ok", "pid": os.getpid()}
+
+@router.get("/ready")
+async def readiness():
+    """El worker puede atender peticiones según la última comprobación en segundo plano"""
+    state = health_monitor.readiness()
+    ready = state.pop("ready")
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "unavailable",
+            "pid": os.getpid(),
+            **state,
+            "bulkheads": {name: bulkhead.stats() for name, bulkhead in BULKHEADS.items()},
+        },
+    )
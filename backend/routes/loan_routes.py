@@ -1,5 +1,5 @@
-from fastapi import APIRouter, HTTPException, Depends, Query, Header
-from typing import Optional, List
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import Optional, List, Set
 from controllers.loan_controller import (
     create_loan,
     get_loans_by_lender,
@@ -12,43 +12,55 @@ from controllers.loan_controller import (
     delete_loan,
     get_upcoming_loans,
     get_loan_report_summary,
+    parse_loan_fields,
+    get_loan_changes,
 )
 from controllers.auth_controller import get_user_profile
 from controllers.notification_controller import get_user_notifications
 import logging
 
-logger = logging.getLogger(__name__)
+logger = logging.getLogger("routes.loans")
 from models.loan_models import (
-    LoanCreate, LoanUpdate, LoanResponse, LoanFilter, LoanStats,
-    UserResponse, DashboardData
+    LoanCreate, LoanUpdate, LoanResponse, LoanListItem, LoanFilter, LoanStats,
+    UserResponse, DashboardData, ChangeFeed
 )
+from lib.content_negotiation import NegotiatedRoute, NegotiatedResponse
+from lib.bulkheads import run_blocking
+from lib.single_flight import single_flight, flight_key
+from lib.sessions import get_current_user_id
+from lib.structured_log import log_fields
 from datetime import date
+import functools
 
-router = APIRouter(prefix="/loans", tags=["loans"])
+router = APIRouter(
+    prefix="/loans",
+    tags=["loans"],
+    route_class=NegotiatedRoute,
+    default_response_class=NegotiatedResponse,
+)
 
-# Simulación de autenticación (en producción usarías JWT o sesiones)
-def get_current_user_id(
-    x_user_id: int | None = Header(default=None, alias="X-User-Id"),
-    qp_user_id: int | None = Query(default=None, alias="user_id")
-) -> int:
-    """Simula obtener el ID del usuario actual - en producción usarías JWT"""
-    # Preferir header; si no, query param; si no, fallback 1
-    uid = x_user_id or qp_user_id or 1
-    return uid
+def get_loan_fields(
+    fields: Optional[str] = Query(None, description="Campos a devolver separados por comas (por defecto todos)")
+) -> Optional[Set[str]]:
+    """Valida el parámetro ?fields= de los listados de préstamos"""
+    try:
+        return parse_loan_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/", response_model=dict)
 async def create_new_loan(loan_data: LoanCreate, user_id: int = Depends(get_current_user_id)):
     """Crea un nuevo préstamo"""
     lender_id = user_id
-    logger.info(f"[POST /loans] user_id={lender_id} payload={loan_data.dict()}")
-    result = create_loan(lender_id, loan_data)
+    logger.info("POST /loans", extra=log_fields(user_id=lender_id, payload=loan_data))
+    result = await run_blocking(create_loan, lender_id, loan_data)
     
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result["message"])
     
     return result
 
-@router.get("/my-loans", response_model=List[LoanResponse])
+@router.get("/my-loans", response_model=List[LoanListItem], response_model_exclude_unset=True)
 async def get_my_loans(
     status: Optional[str] = Query(None, description="Filtrar por estado: active, returned, overdue"),
     loan_type: Optional[str] = Query(None, description="Filtrar por tipo: money, object"),
@@ -56,10 +68,11 @@ async def get_my_loans(
     date_from: Optional[date] = Query(None, description="Fecha desde"),
     date_to: Optional[date] = Query(None, description="Fecha hasta"),
     search: Optional[str] = Query(None, description="Buscar en nombre de objeto o notas")
-    , user_id: int = Depends(get_current_user_id)):
+    , user_id: int = Depends(get_current_user_id)
+    , fields: Optional[Set[str]] = Depends(get_loan_fields)):
     """Obtiene los préstamos del usuario actual como prestamista"""
     lender_id = user_id
-    logger.info(f"[GET /loans/my-loans] user_id={lender_id} filters={{'status': status, 'loan_type': loan_type}}")
+    logger.info("GET /loans/my-loans", extra=log_fields(user_id=lender_id, status=status, loan_type=loan_type))
     
     filters = LoanFilter(
         status=status,
@@ -70,9 +83,9 @@ async def get_my_loans(
         search=search
     )
     
-    return get_loans_by_lender(lender_id, filters)
+    return await run_blocking(get_loans_by_lender, lender_id, filters, fields)
 
-@router.get("/borrowed", response_model=List[LoanResponse])
+@router.get("/borrowed", response_model=List[LoanListItem], response_model_exclude_unset=True)
 async def get_borrowed_loans(
     status: Optional[str] = Query(None, description="Filtrar por estado: active, returned, overdue"),
     loan_type: Optional[str] = Query(None, description="Filtrar por tipo: money, object"),
@@ -80,10 +93,11 @@ async def get_borrowed_loans(
     date_from: Optional[date] = Query(None, description="Fecha desde"),
     date_to: Optional[date] = Query(None, description="Fecha hasta"),
     search: Optional[str] = Query(None, description="Buscar en nombre de objeto o notas")
-    , user_id: int = Depends(get_current_user_id)):
+    , user_id: int = Depends(get_current_user_id)
+    , fields: Optional[Set[str]] = Depends(get_loan_fields)):
     """Obtiene los préstamos del usuario actual como prestatario"""
     borrower_id = user_id
-    logger.info(f"[GET /loans/borrowed] user_id={borrower_id} filters={{'status': status, 'loan_type': loan_type}}")
+    logger.info("GET /loans/borrowed", extra=log_fields(user_id=borrower_id, status=status, loan_type=loan_type))
     
     filters = LoanFilter(
         status=status,
@@ -94,14 +108,14 @@ async def get_borrowed_loans(
         search=search
     )
     
-    return get_loans_by_borrower(borrower_id, filters)
+    return await run_blocking(get_loans_by_borrower, borrower_id, filters, fields)
 
 @router.put("/{loan_id}", response_model=dict)
 async def update_loan_info(loan_id: int, update_data: LoanUpdate, user_id: int = Depends(get_current_user_id)):
     """Actualiza un préstamo existente"""
     lender_id = user_id
-    logger.info(f"[PUT /loans/{{loan_id}}] user_id={lender_id} loan_id={loan_id} update={update_data.dict(exclude_unset=True)}")
-    result = update_loan(loan_id, lender_id, update_data)
+    logger.info("PUT /loans/{loan_id}", extra=log_fields(user_id=lender_id, loan_id=loan_id, update=update_data))
+    result = await run_blocking(update_loan, loan_id, lender_id, update_data)
     
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result["message"])
@@ -112,8 +126,8 @@ async def update_loan_info(loan_id: int, update_data: LoanUpdate, user_id: int =
 async def mark_loan_as_returned(loan_id: int, user_id: int = Depends(get_current_user_id)):
     """Marca un préstamo como devuelto"""
     lender_id = user_id
-    logger.info(f"[POST /loans/{{loan_id}}/return] user_id={lender_id} loan_id={loan_id}")
-    result = mark_loan_returned(loan_id, lender_id)
+    logger.info("POST /loans/{loan_id}/return", extra=log_fields(user_id=lender_id, loan_id=loan_id))
+    result = await run_blocking(mark_loan_returned, loan_id, lender_id)
     
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result["message"])
@@ -123,7 +137,7 @@ async def mark_loan_as_returned(loan_id: int, user_id: int = Depends(get_current
 @router.delete("/{loan_id}", response_model=dict)
 async def delete_loan_route(loan_id: int, user_id: int = Depends(get_current_user_id)):
     """Elimina un préstamo del prestamista actual"""
-    result = delete_loan(loan_id, user_id)
+    result = await run_blocking(delete_loan, loan_id, user_id)
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result["message"])
     return result
@@ -131,44 +145,61 @@ async def delete_loan_route(loan_id: int, user_id: int = Depends(get_current_use
 @router.get("/stats", response_model=LoanStats)
 async def get_my_loan_stats(user_id: int = Depends(get_current_user_id)):
     """Obtiene estadísticas de préstamos del usuario actual"""
-    stats = get_loan_stats(user_id)
-    logger.info(f"[GET /loans/stats] user_id={user_id} stats={stats}")
+    # Varias pestañas o reintentos del mismo usuario comparten una sola consulta
+    stats = await single_flight.run(
+        flight_key("GET /loans/stats", user_id), functools.partial(run_blocking, get_loan_stats, user_id)
+    )
+    logger.info("GET /loans/stats", extra=log_fields(user_id=user_id, stats=stats))
     return stats
 
-@router.get("/overdue", response_model=List[LoanResponse])
-async def get_overdue_loans_list(user_id: int = Depends(get_current_user_id)):
+@router.get("/overdue", response_model=List[LoanListItem], response_model_exclude_unset=True)
+async def get_overdue_loans_list(
+    user_id: int = Depends(get_current_user_id),
+    fields: Optional[Set[str]] = Depends(get_loan_fields)
+):
     """Obtiene préstamos vencidos del usuario actual"""
-    loans = get_overdue_loans(user_id)
-    logger.info(f"[GET /loans/overdue] user_id={user_id} count={len(loans)}")
+    loans = await run_blocking(get_overdue_loans, user_id, fields)
+    logger.info("GET /loans/overdue", extra=log_fields(user_id=user_id, count=len(loans)))
     return loans
 
+@router.get("/changes", response_model=ChangeFeed)
+async def get_changes(
+    since: Optional[int] = Query(None, description="Token devuelto por la última sincronización"),
+    user_id: int = Depends(get_current_user_id)
+):
+    """Cambios en los préstamos del usuario desde el token indicado"""
+    feed = await run_blocking(get_loan_changes, user_id, since)
+    logger.info("GET /loans/changes", extra=log_fields(user_id=user_id, since=since, changes=len(feed.changes)))
+    return feed
+
 @router.get("/users", response_model=List[UserResponse])
 async def get_users_for_loans(search: Optional[str] = Query(None, description="Buscar usuarios")):
     """Obtiene usuarios para selección en préstamos"""
-    return get_all_users(search)
+    return await run_blocking(get_all_users, search)
 
-@router.get("/dashboard", response_model=DashboardData)
-async def get_dashboard_data(user_id: int = Depends(get_current_user_id)):
-    """Obtiene datos del dashboard del usuario actual"""
-    
+async def load_dashboard(user_id: int, fields: Optional[Set[str]]) -> DashboardData:
+    """Reúne los datos del dashboard de un usuario"""
     # Obtener información del usuario
-    user_result = get_user_profile(user_id)
+    user_result = await run_blocking(get_user_profile, user_id)
     if not user_result["success"]:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
     # Obtener estadísticas
-    stats = get_loan_stats(user_id)
+    stats = await run_blocking(get_loan_stats, user_id)
 
     # Obtener préstamos recientes (últimos 5)
-    recent_loans = get_loans_by_lender(user_id)[:5]
+    recent_loans = (await run_blocking(get_loans_by_lender, user_id, fields=fields))[:5]
 
     # Obtener préstamos vencidos
-    overdue_loans = get_overdue_loans(user_id)
+    overdue_loans = await run_blocking(get_overdue_loans, user_id, fields)
 
     # Cargar notificaciones del usuario
-    notifications = get_user_notifications(user_id, limit=5, unread_only=False)
+    notifications = await run_blocking(get_user_notifications, user_id, limit=5, unread_only=False)
     logger.info(
-        f"[GET /loans/dashboard] user_id={user_id} recent={len(recent_loans)} overdue={len(overdue_loans)} notif={len(notifications)}"
+        "GET /loans/dashboard",
+        extra=log_fields(
+            user_id=user_id, recent=len(recent_loans), overdue=len(overdue_loans), notifications=len(notifications)
+        ),
     )
 
     return DashboardData(
@@ -179,13 +210,26 @@ async def get_dashboard_data(user_id: int = Depends(get_current_user_id)):
         notifications=notifications,
     )
 
+@router.get("/dashboard", response_model=DashboardData, response_model_exclude_unset=True)
+async def get_dashboard_data(
+    user_id: int = Depends(get_current_user_id),
+    fields: Optional[Set[str]] = Depends(get_loan_fields)
+):
+    """Obtiene datos del dashboard del usuario actual"""
+    return await single_flight.run(
+        flight_key("GET /loans/dashboard", user_id, fields=fields), functools.partial(load_dashboard, user_id, fields)
+    )
+
 
 @router.get("/upcoming")
 async def get_upcoming(user_id: int = Depends(get_current_user_id), days: int = 3):
     """Préstamos próximos a vencer para alertas"""
-    upcoming = get_upcoming_loans(user_id, days)
+    upcoming = await run_blocking(get_upcoming_loans, user_id, days)
     logger.info(
-        f"[GET /loans/upcoming] user_id={user_id} days={days} lender={len(upcoming['as_lender'])} borrower={len(upcoming['as_borrower'])}"
+        "GET /loans/upcoming",
+        extra=log_fields(
+            user_id=user_id, days=days, lender=len(upcoming['as_lender']), borrower=len(upcoming['as_borrower'])
+        ),
     )
     return upcoming
 
@@ -193,8 +237,12 @@ async def get_upcoming(user_id: int = Depends(get_current_user_id), days: int =
 @router.get("/report")
 async def get_report(user_id: int = Depends(get_current_user_id)):
     """Resumen agregado para módulo de reportes"""
-    summary = get_loan_report_summary(user_id)
+    summary = await single_flight.run(
+        flight_key("GET /loans/report", user_id), functools.partial(run_blocking, get_loan_report_summary, user_id)
+    )
     lender_total = summary.get("as_lender", {}).get("total_count", 0)
     borrower_total = summary.get("as_borrower", {}).get("total_count", 0)
-    logger.info(f"[GET /loans/report] user_id={user_id} lender_count={lender_total} borrower_count={borrower_total}")
+    logger.info(
+        "GET /loans/report", extra=log_fields(user_id=user_id, lender_count=lender_total, borrower_count=borrower_total)
+    )
     return summary
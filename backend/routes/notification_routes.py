@@ -1,20 +1,22 @@
-from fastapi import APIRouter, HTTPException, Query, Header, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends
 from typing import Optional, List
 from controllers.notification_controller import (
     get_user_notifications, mark_notification_as_read, mark_all_notifications_as_read,
-    get_unread_notifications_count, create_notification
+    get_unread_notifications_count, create_notification, get_notification_changes
 )
-from models.loan_models import NotificationCreate, NotificationResponse
+from models.loan_models import NotificationCreate, NotificationResponse, ChangeFeed
+from lib.content_negotiation import NegotiatedRoute, NegotiatedResponse
+from lib.bulkheads import run_blocking
+from lib.single_flight import single_flight, flight_key
+from lib.sessions import get_current_user_id
+import functools
 
-router = APIRouter(prefix="/notifications", tags=["notifications"])
-
-# Simulación de autenticación (en producción usarías JWT o sesiones)
-def get_current_user_id(
-    x_user_id: int | None = Header(default=None, alias="X-User-Id"),
-    qp_user_id: int | None = Query(default=None, alias="user_id")
-) -> int:
-    """Simula obtener el ID del usuario actual - en producción usarías JWT"""
-    return x_user_id or qp_user_id or 1
+router = APIRouter(
+    prefix="/notifications",
+    tags=["notifications"],
+    route_class=NegotiatedRoute,
+    default_response_class=NegotiatedResponse,
+)
 
 @router.get("/", response_model=List[NotificationResponse])
 async def get_notifications(
@@ -23,18 +25,30 @@ async def get_notifications(
     user_id: int = Depends(get_current_user_id)
 ):
     """Obtiene las notificaciones del usuario actual"""
-    return get_user_notifications(user_id, limit, unread_only)
+    return await run_blocking(get_user_notifications, user_id, limit, unread_only)
 
 @router.get("/unread-count")
 async def get_unread_count(user_id: int = Depends(get_current_user_id)):
     """Obtiene el número de notificaciones no leídas del usuario actual"""
-    count = get_unread_notifications_count(user_id)
+    # El contador se pide a menudo desde varias pestañas: las peticiones simultáneas comparten consulta
+    count = await single_flight.run(
+        flight_key("GET /notifications/unread-count", user_id),
+        functools.partial(run_blocking, get_unread_notifications_count, user_id),
+    )
     return {"unread_count": count}
 
+@router.get("/changes", response_model=ChangeFeed)
+async def get_changes(
+    since: Optional[int] = Query(None, description="Token devuelto por la última sincronización"),
+    user_id: int = Depends(get_current_user_id)
+):
+    """Cambios en las notificaciones del usuario desde el token indicado"""
+    return await run_blocking(get_notification_changes, user_id, since)
+
 @router.post("/{notification_id}/read")
 async def mark_as_read(notification_id: int, user_id: int = Depends(get_current_user_id)):
     """Marca una notificación específica como leída"""
-    result = mark_notification_as_read(notification_id, user_id)
+    result = await run_blocking(mark_notification_as_read, notification_id, user_id)
     
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result["message"])
@@ -44,7 +58,7 @@ async def mark_as_read(notification_id: int, user_id: int = Depends(get_current_
 @router.post("/mark-all-read")
 async def mark_all_as_read(user_id: int = Depends(get_current_user_id)):
     """Marca todas las notificaciones del usuario actual como leídas"""
-    result = mark_all_notifications_as_read(user_id)
+    result = await run_blocking(mark_all_notifications_as_read, user_id)
     
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result["message"])
@@ -54,7 +68,7 @@ async def mark_all_as_read(user_id: int = Depends(get_current_user_id)):
 @router.post("/", response_model=dict)
 async def create_new_notification(notification_data: NotificationCreate):
     """Crea una nueva notificación"""
-    result = create_notification(notification_data)
+    result = await run_blocking(create_notification, notification_data)
     
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result["message"])
@@ -0,0 +1,53 @@
+from fastapi import APIRouter, HTTPException, Query, Depends
+from typing import List
+from controllers.webhook_controller import (
+    create_subscription, get_subscriptions, delete_subscription, get_dead_letters, retry_dead_letter
+)
+from models.loan_models import WebhookCreate, WebhookSubscription, WebhookDeadLetter
+from lib.bulkheads import WorkloadRoute, run_blocking
+from lib.sessions import get_current_user_id
+
+router = APIRouter(prefix="/webhooks", tags=["webhooks"], route_class=WorkloadRoute)
+
+@router.post("/", response_model=dict)
+async def create_webhook(data: WebhookCreate, user_id: int = Depends(get_current_user_id)):
+    """Registra una URL que recibirá los eventos de préstamos del usuario (el secreto solo se devuelve aquí)"""
+    result = await run_blocking(create_subscription, user_id, data)
+    
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["message"])
+    
+    return result
+
+@router.get("/", response_model=List[WebhookSubscription])
+async def list_webhooks(user_id: int = Depends(get_current_user_id)):
+    """Obtiene las suscripciones del usuario actual"""
+    return await run_blocking(get_subscriptions, user_id)
+
+@router.delete("/{subscription_id}")
+async def remove_webhook(subscription_id: int, user_id: int = Depends(get_current_user_id)):
+    """Elimina una suscripción y sus envíos pendientes"""
+    result = await run_blocking(delete_subscription, subscription_id, user_id)
+    
+    if not result["success"]:
+        raise HTTPException(status_code=404, detail=result["message"])
+    
+    return result
+
+@router.get("/dead-letters", response_model=List[WebhookDeadLetter])
+async def list_dead_letters(
+    limit: int = Query(50, ge=1, le=500, description="Envíos fallidos a obtener"),
+    user_id: int = Depends(get_current_user_id)
+):
+    """Envíos que agotaron los reintentos, con el último error"""
+    return await run_blocking(get_dead_letters, user_id, limit)
+
+@router.post("/dead-letters/{delivery_id}/retry")
+async def retry_webhook_delivery(delivery_id: int, user_id: int = Depends(get_current_user_id)):
+    """Vuelve a poner en cola un envío fallido"""
+    result = await run_blocking(retry_dead_letter, delivery_id, user_id)
+    
+    if not result["success"]:
+        raise HTTPException(status_code=404, detail=result["message"])
+    
+    return result
@@ -0,0 +1,62 @@
+import os
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# El motor se elige al importar lib.mysql_db: SQLite en un directorio temporal por sesión
+_TMP = tempfile.mkdtemp(prefix="loan-tests-")
+os.environ["DB_BACKEND"] = "sqlite"
+os.environ["SQLITE_PATH"] = os.path.join(_TMP, "primary.db")
+os.environ["SESSION_SECRET_FILE"] = os.path.join(_TMP, "session_secret")
+# Las trazas muestreadas tampoco se escriben en el repositorio
+os.environ["TRACE_FILE"] = os.path.join(_TMP, "traces.jsonl")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+sys.path.insert(0, str(ROOT / "backend"))
+# La app monta frontend/ con una ruta relativa a la raíz del repositorio
+os.chdir(ROOT)
+
+
+@pytest.fixture(scope="session")
+def tmp_dir() -> str:
+    return _TMP
+
+
+@pytest.fixture(scope="session")
+def database():
+    from lib.mysql_db import init_database
+
+    assert init_database()
+    return os.environ["SQLITE_PATH"]
+
+
+@pytest.fixture(scope="session")
+def client(database):
+    """Cliente de la app; se arranca una sola vez porque el apagado cierra los executors"""
+    from fastapi.testclient import TestClient
+    from app import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def make_user(client):
+    """Registra un usuario con nombre único y devuelve (id, cabeceras con su token)"""
+
+    def create():
+        username = f"u{uuid.uuid4().hex[:12]}"
+        password = "password123"
+        response = client.post("/auth/register", json={
+            "name": username, "username": username, "email": f"{username}@example.com", "password": password,
+        })
+        assert response.status_code == 200, response.text
+        login = client.post("/auth/login", json={"username": username, "password": password}).json()
+        return login["user"]["id"], {"Authorization": f"Bearer {login['token']}"}
+
+    return create
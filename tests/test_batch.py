@@ -0,0 +1,83 @@
+import itertools
+import time
+from datetime import date, timedelta
+
+import pytest
+
+import controllers.loan_controller as loan_controller
+from lib.mysql_db import get_db_connection
+
+
+@pytest.fixture
+def slow_loan_writes(monkeypatch):
+    """Deja abierta la transacción de create_loan (tras el INSERT) en una de cada dos subpeticiones
+
+    Así las rápidas terminan mientras las lentas aún no han confirmado, que es
+    cuando una conexión compartida entre subpeticiones pierde escrituras.
+    """
+    original = loan_controller.record_changes
+    arrivals = itertools.count()
+
+    def record_changes(cursor, *args, **kwargs):
+        if next(arrivals) % 2:
+            time.sleep(0.03)
+        return original(cursor, *args, **kwargs)
+
+    monkeypatch.setattr(loan_controller, "record_changes", record_changes)
+
+
+def count_loans(lender_id: int) -> int:
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute("SELECT COUNT(*) FROM loans WHERE lender_id = %s", (lender_id,))
+    (count,) = cursor.fetchone()
+    cursor.close()
+    connection.close()
+    return count
+
+
+def test_concurrent_batched_writes_are_all_stored(client, make_user, slow_loan_writes):
+    lender_id, headers = make_user()
+    borrower_id, _ = make_user()
+    requests = [
+        {
+            "id": str(number),
+            "method": "POST",
+            "path": "/loans/",
+            "body": {
+                "borrower_id": borrower_id,
+                "loan_type": "money",
+                "amount": number + 1,
+                "loan_date": str(date.today()),
+                "due_date": str(date.today() + timedelta(days=7)),
+            },
+        }
+        for number in range(20)
+    ]
+
+    for round_number in range(1, 6):
+        response = client.post("/batch", json={"requests": requests}, headers=headers)
+
+        assert response.status_code == 200
+        statuses = [sub["status"] for sub in response.json()["responses"]]
+        assert statuses == [200] * len(requests)
+        assert count_loans(lender_id) == len(requests) * round_number
+
+
+def test_batched_reads_see_committed_writes(client, make_user):
+    lender_id, headers = make_user()
+    borrower_id, _ = make_user()
+    created = client.post("/loans/", headers=headers, json={
+        "borrower_id": borrower_id,
+        "loan_type": "object",
+        "object_name": "Libro",
+        "loan_date": str(date.today()),
+        "due_date": str(date.today() + timedelta(days=7)),
+    })
+    assert created.status_code == 200, created.text
+
+    requests = [{"id": str(number), "path": "/loans/my-loans"} for number in range(10)]
+    responses = client.post("/batch", json={"requests": requests}, headers=headers).json()["responses"]
+
+    assert [sub["status"] for sub in responses] == [200] * len(requests)
+    assert all(len(sub["body"]) == 1 for sub in responses)
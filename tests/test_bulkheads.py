@@ -0,0 +1,87 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from lib.bulkheads import Bulkhead
+from lib.request_context import request_context
+
+
+class FakeConnection:
+    in_transaction = False
+    pooled = True
+
+    def __init__(self):
+        self.closed = False
+
+    def is_connected(self) -> bool:
+        return not self.closed
+
+    def close(self) -> None:
+        self.closed = True
+
+
+@pytest.fixture
+def bulkhead():
+    bulkhead = Bulkhead("test", workers=8, queue_size=8, db_share=1.0)
+    yield bulkhead
+    bulkhead.executor.shutdown(wait=True)
+
+
+def test_shared_connection_is_leased_to_one_thread_at_a_time(bulkhead):
+    holders = []
+    lock = threading.Lock()
+    peak = 0
+
+    def read(context):
+        nonlocal peak
+        lease = context.get_connection(FakeConnection)
+        if lease is None:
+            # Ocupada: el llamador usaría una conexión propia del pool
+            return False
+        with lock:
+            holders.append(lease)
+            peak = max(peak, len(holders))
+        time.sleep(0.01)
+        with lock:
+            holders.remove(lease)
+        lease.close()
+        return True
+
+    async def scenario():
+        with request_context() as context:
+            results = await asyncio.gather(*(bulkhead.run(read, context) for _ in range(16)))
+            return context, results
+
+    context, results = asyncio.run(scenario())
+
+    assert peak == 1
+    assert any(results)
+    assert context.connection is None
+
+
+def test_lease_left_by_a_failing_call_is_recovered(bulkhead):
+    opened = []
+
+    def factory():
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    def failing_read(context):
+        context.get_connection(factory)
+        raise RuntimeError("fallo antes de close()")
+
+    async def scenario():
+        with request_context() as context:
+            with pytest.raises(RuntimeError):
+                await bulkhead.run(failing_read, context)
+            # El hilo terminó: la conexión vuelve a estar disponible para otras subpeticiones
+            lease = await bulkhead.run(context.get_connection, factory)
+            assert lease is not None
+            lease.close()
+
+    asyncio.run(scenario())
+
+    assert len(opened) == 1
+    assert opened[0].closed
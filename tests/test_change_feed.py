@@ -0,0 +1,89 @@
+import random
+
+import pytest
+
+import controllers.change_controller as change_controller
+from controllers.change_controller import (
+    ENTITY_LOAN, OP_INSERT, OP_UPDATE, prune_change_log, read_change_log, record_changes,
+)
+from lib.mysql_db import get_db_connection
+
+
+@pytest.fixture
+def user_id(database) -> int:
+    return random.randint(10_000_000, 99_999_999)
+
+
+def write_changes(operation: str, pairs) -> None:
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    record_changes(cursor, ENTITY_LOAN, operation, pairs)
+    connection.commit()
+    cursor.close()
+    connection.close()
+
+
+def age_changes(seconds: int, user_id=None) -> None:
+    """Retrasa el created_at de los cambios (de un usuario o de todos): simula que pasó el tiempo"""
+    query = "UPDATE change_log SET created_at = datetime(created_at, %s)"
+    params = [f"-{seconds} seconds"]
+    if user_id is not None:
+        query += " WHERE user_id = %s"
+        params.append(user_id)
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute(query, params)
+    connection.commit()
+    cursor.close()
+    connection.close()
+
+
+def read(user_id: int, since):
+    connection = get_db_connection()
+    cursor = connection.cursor(dictionary=True)
+    log = read_change_log(cursor, ENTITY_LOAN, user_id, since)
+    cursor.close()
+    connection.close()
+    return log
+
+
+def test_token_stays_behind_recent_changes_until_they_settle(user_id):
+    token = read(user_id, None)["next_token"]
+    write_changes(OP_INSERT, [(1, user_id)])
+
+    # El cambio se entrega enseguida, pero el token no lo adelanta: un id menor aún sin
+    # confirmar en otra transacción llegaría en la siguiente llamada
+    first = read(user_id, token)
+    assert first["entries"] == [(1, OP_INSERT)]
+    assert first["next_token"] == token
+
+    again = read(user_id, first["next_token"])
+    assert again["entries"] == [(1, OP_INSERT)]
+
+    age_changes(int(change_controller.CHANGE_FEED_SETTLE_SECONDS) + 5, user_id)
+    settled = read(user_id, again["next_token"])
+    assert settled["next_token"] > token
+    assert read(user_id, settled["next_token"])["entries"] == []
+
+
+def test_changes_collapse_per_entity(user_id):
+    token = read(user_id, None)["next_token"]
+    write_changes(OP_INSERT, [(7, user_id)])
+    write_changes(OP_UPDATE, [(7, user_id)])
+    write_changes(OP_UPDATE, [(8, user_id)])
+
+    assert read(user_id, token)["entries"] == [(7, OP_INSERT), (8, OP_UPDATE)]
+
+
+def test_token_older_than_retention_resets(user_id, monkeypatch):
+    write_changes(OP_INSERT, [(1, user_id)])
+    stale_token = read(user_id, None)["next_token"]
+    write_changes(OP_UPDATE, [(1, user_id)])
+
+    monkeypatch.setattr(change_controller, "CHANGE_LOG_RETENTION_DAYS", 1)
+    # La retención borra todo lo anterior al corte, no solo lo de este usuario
+    age_changes(2 * 86400)
+    assert prune_change_log() >= 2
+    write_changes(OP_UPDATE, [(1, user_id)])
+
+    assert read(user_id, stale_token)["reset"] is True
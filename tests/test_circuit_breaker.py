@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+import lib.circuit_breaker as circuit_breaker
+from lib.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, DatabaseUnavailableError, retry_reads
+from lib.db_pool import ConnectionPool
+
+RESET_TIMEOUT = 0.1
+
+
+class FakeConnection:
+    in_transaction = False
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        pass
+
+
+class FakeServer:
+    """Fábrica de conexiones que falla mientras el servidor está caído"""
+
+    def __init__(self):
+        self.up = False
+        self.attempts = 0
+        self.gate = None
+
+    def connect(self):
+        self.attempts += 1
+        if self.gate is not None:
+            self.gate.wait(5)
+        return FakeConnection() if self.up else None
+
+
+@pytest.fixture
+def server():
+    return FakeServer()
+
+
+@pytest.fixture
+def pool(server):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=RESET_TIMEOUT)
+    return ConnectionPool(server.connect, 4, 1.0, breaker)
+
+
+def open_circuit(pool):
+    for _ in range(3):
+        assert pool.acquire() is None
+    assert pool.breaker.state == OPEN
+
+
+def test_circuit_opens_after_consecutive_failures(pool, server):
+    assert pool.acquire() is None
+    assert pool.acquire() is None
+    assert pool.breaker.state == CLOSED
+
+    assert pool.acquire() is None
+    assert pool.breaker.state == OPEN
+    # Abierto: se rechaza al instante sin intentar conectar
+    with pytest.raises(CircuitOpenError) as rejected:
+        pool.acquire()
+    assert server.attempts == 3
+    assert 0 < rejected.value.retry_after <= RESET_TIMEOUT
+    assert pool.stats()["in_use"] == 0
+
+
+def test_half_open_lets_a_single_probe_through_and_closes(pool, server):
+    open_circuit(pool)
+    time.sleep(RESET_TIMEOUT + 0.02)
+    server.up = True
+    server.gate = threading.Event()
+    probe = []
+    thread = threading.Thread(target=lambda: probe.append(pool.acquire()))
+    thread.start()
+    while server.attempts < 4:
+        time.sleep(0.005)
+
+    # Mientras la prueba está en curso el resto se rechaza
+    assert pool.breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        pool.acquire()
+    assert server.attempts == 4
+
+    server.gate.set()
+    thread.join()
+    assert probe[0] is not None
+    assert pool.breaker.state == CLOSED
+    probe[0].close()
+    connection = pool.acquire()
+    assert connection is not None
+    connection.close()
+
+
+def test_failed_probe_reopens_the_circuit(pool, server):
+    open_circuit(pool)
+    time.sleep(RESET_TIMEOUT + 0.02)
+
+    assert pool.acquire() is None
+    assert pool.breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        pool.acquire()
+    assert server.attempts == 4
+
+
+def test_retry_reads_does_not_retry_an_open_circuit(monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "DB_RETRY_BASE_DELAY", 0.0)
+    calls = []
+
+    @retry_reads
+    def rejected():
+        calls.append("rejected")
+        raise CircuitOpenError("Base de datos 'test' no disponible")
+
+    @retry_reads
+    def lost_connection():
+        calls.append("lost")
+        raise DatabaseUnavailableError("Conexión perdida")
+
+    with pytest.raises(CircuitOpenError):
+        rejected()
+    assert calls == ["rejected"]
+
+    # En cambio una conexión perdida sí se reintenta
+    with pytest.raises(DatabaseUnavailableError):
+        lost_connection()
+    assert calls.count("lost") == circuit_breaker.DB_READ_RETRIES + 1
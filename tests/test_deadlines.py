@@ -0,0 +1,100 @@
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+import lib.mysql_db as mysql_db
+from lib.bulkheads import WorkloadRoute, run_blocking
+from lib.deadlines import ROUTE_BUDGETS, DeadlineExceededError
+from lib.mysql_db import db_pool, get_read_connection
+
+# Consulta sin fin: solo termina si el vigilante la interrumpe
+ENDLESS_QUERY = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT COUNT(*) FROM c"
+
+
+def endless_read():
+    connection = get_read_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(ENDLESS_QUERY)
+        return cursor.fetchall()
+    finally:
+        connection.close()
+
+
+def test_query_past_the_deadline_is_interrupted_and_answers_504(database, monkeypatch):
+    from app import deadline_exceeded_handler
+
+    # El presupuesto se fija al crear la ruta
+    monkeypatch.setitem(ROUTE_BUDGETS, "/slow", 0.3)
+    router = APIRouter(route_class=WorkloadRoute)
+
+    @router.get("/slow")
+    async def slow():
+        return await run_blocking(endless_read)
+
+    app = FastAPI()
+    app.include_router(router)
+    app.add_exception_handler(DeadlineExceededError, deadline_exceeded_handler)
+    in_use = db_pool.stats()["in_use"]
+
+    response = TestClient(app).get("/slow")
+
+    assert response.status_code == 504
+    assert "cancelada" in response.json()["detail"]
+    # La conexión vuelve al pool sin transacción abierta y sigue sirviendo
+    assert db_pool.stats()["in_use"] == in_use
+    connection = db_pool.acquire()
+    assert not connection.in_transaction
+    cursor = connection.cursor()
+    cursor.execute("SELECT 1")
+    assert cursor.fetchall() == [(1,)]
+    cursor.close()
+    connection.close()
+
+
+class FakeCursor:
+    def __init__(self, statements):
+        self.statements = statements
+
+    def execute(self, query, params=()):
+        self.statements.append((query, params))
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, address, connection_id, statements):
+        self.address = address
+        self.connection_id = connection_id
+        self.statements = statements
+        self.in_transaction = False
+
+    def cursor(self):
+        return FakeCursor(self.statements)
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        pass
+
+
+def test_replica_query_is_killed_on_the_replica(monkeypatch):
+    opened = []
+    statements = []
+
+    def open_db_connection(address=None):
+        opened.append(address)
+        return FakeConnection(address, 40 + len(opened), statements)
+
+    monkeypatch.setattr(mysql_db, "DB_BACKEND", "mysql")
+    monkeypatch.setattr(mysql_db, "open_db_connection", open_db_connection)
+    pool = mysql_db.replica_pool("replica-1:3306")
+    connection = pool.acquire()
+
+    mysql_db.cancel_query(connection)
+
+    # Vigilada la conexión 41 de la réplica: la segunda conexión (la que corta) va al mismo servidor
+    assert opened == ["replica-1:3306", "replica-1:3306"]
+    assert statements == [("KILL QUERY %s", (41,))]
+    connection.close()
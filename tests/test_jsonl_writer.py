@@ -0,0 +1,50 @@
+import json
+import os
+import threading
+
+from lib.jsonl_writer import JsonLinesWriter
+
+
+def read_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_close_writes_everything_pending(tmp_dir):
+    path = os.path.join(tmp_dir, "close.jsonl")
+    writer = JsonLinesWriter(path)
+
+    for number in range(2500):
+        writer.submit({"n": number})
+    writer.close()
+
+    assert [record["n"] for record in read_lines(path)] == list(range(2500))
+    # Tras cerrar se puede seguir escribiendo
+    writer.submit({"n": 2500})
+    writer.close()
+    assert read_lines(path)[-1] == {"n": 2500}
+
+
+def test_full_queue_drops_instead_of_blocking(tmp_dir, monkeypatch):
+    path = os.path.join(tmp_dir, "bounded.jsonl")
+    writer = JsonLinesWriter(path, max_pending=10)
+    # El hilo escritor se queda parado en la primera escritura
+    release = threading.Event()
+    opened = threading.Event()
+    original_open = writer._open
+
+    def slow_open():
+        opened.set()
+        release.wait(5)
+        return original_open()
+
+    monkeypatch.setattr(writer, "_open", slow_open)
+    writer.submit({"n": 0})
+    assert opened.wait(5)
+    for number in range(1, 51):
+        writer.submit({"n": number})
+
+    assert writer.dropped == 40
+    release.set()
+    writer.close()
+    assert [record["n"] for record in read_lines(path)] == list(range(11))
@@ -0,0 +1,196 @@
+import time
+from datetime import date, timedelta
+
+import pytest
+from mysql.connector import Error
+
+import controllers.loan_controller as loan_controller
+import controllers.notification_controller as notification_controller
+import jobs.tasks  # noqa: F401  (registra las tareas)
+from controllers.notification_controller import NOTIFICATION_TASK, create_loan_notifications, write_notification_batch
+from jobs.worker import Worker
+from lib.mysql_db import db_pool, get_db_connection
+from models.loan_models import NotificationCreate, NotificationType
+
+
+def query(sql: str, params=()):
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+    cursor.close()
+    connection.close()
+    return rows
+
+
+def create_loan(client, headers, borrower_id: int):
+    return client.post("/loans/", json={
+        "borrower_id": borrower_id,
+        "loan_type": "object",
+        "object_name": "Taladro",
+        "loan_date": str(date.today()),
+        "due_date": str(date.today() + timedelta(days=7)),
+    }, headers=headers)
+
+
+def loan_notifications(loan_id: int):
+    return query("SELECT user_id, title FROM notifications WHERE loan_id = %s ORDER BY user_id", (loan_id,))
+
+
+def run_jobs() -> int:
+    """Ejecuta como lo haría el worker los trabajos pendientes ya vencidos"""
+    worker = Worker(["default"], concurrency=1)
+    claimed = 0
+    while True:
+        polled = worker.poll()
+        # Un solo hilo: esta tarea vacía termina después de lo reservado
+        worker.executor.submit(lambda: None).result()
+        if not polled:
+            break
+        claimed += polled
+    worker.executor.shutdown()
+    return claimed
+
+
+@pytest.fixture(autouse=True)
+def drain_jobs(database):
+    # Los trabajos de otras pruebas no cuentan en estas
+    run_jobs()
+
+
+def test_loan_notifications_are_written_by_the_job(client, make_user):
+    lender_id, headers = make_user()
+    borrower_id, _ = make_user()
+
+    loan_id = create_loan(client, headers, borrower_id).json()["loan_id"]
+    assert loan_notifications(loan_id) == []
+    pending = query("SELECT COUNT(*) FROM jobs WHERE task = %s AND status = 'pending'", (NOTIFICATION_TASK,))
+    assert pending[0][0] >= 1
+
+    run_jobs()
+    assert sorted(loan_notifications(loan_id)) == sorted([
+        (borrower_id, "Nuevo préstamo recibido"), (lender_id, "Préstamo creado"),
+    ])
+    # El registro de cambios se escribe en la misma transacción
+    changes = query(
+        "SELECT user_id FROM change_log WHERE entity = 'notification' AND entity_id IN "
+        "(SELECT id FROM notifications WHERE loan_id = %s)", (loan_id,),
+    )
+    assert sorted(user_id for (user_id,) in changes) == sorted([lender_id, borrower_id])
+
+
+def test_pending_notification_jobs_are_written_in_one_insert(client, make_user, monkeypatch):
+    lender_id, headers = make_user()
+    borrower_id, _ = make_user()
+    loan_ids = [create_loan(client, headers, borrower_id).json()["loan_id"] for _ in range(5)]
+
+    inserts = []
+    original = notification_controller.insert_notifications
+
+    def counting(cursor, notifications):
+        inserts.append(len(notifications))
+        original(cursor, notifications)
+
+    monkeypatch.setattr(notification_controller, "insert_notifications", counting)
+    assert run_jobs() == 5
+
+    # Los cinco trabajos en un lote: un INSERT con las dos filas de cada préstamo
+    assert inserts == [10]
+    for loan_id in loan_ids:
+        assert len(loan_notifications(loan_id)) == 2
+    assert query(
+        "SELECT status, COUNT(*) FROM jobs WHERE task = %s AND status <> 'done' GROUP BY status", (NOTIFICATION_TASK,),
+    ) == []
+
+
+def test_notifications_roll_back_with_the_loan(make_user):
+    lender_id, _ = make_user()
+    borrower_id, _ = make_user()
+    jobs_before = query("SELECT COUNT(*) FROM jobs")[0][0]
+
+    # Lo mismo que create_loan, pero la transacción se deshace tras encolar
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute(
+        "INSERT INTO loans (lender_id, borrower_id, loan_type, amount, loan_date, due_date) VALUES (%s, %s, %s, %s, %s, %s)",
+        (lender_id, borrower_id, "money", 5, date.today(), date.today() + timedelta(days=7)),
+    )
+    create_loan_notifications(cursor.lastrowid, lender_id, borrower_id, "money", amount=5, cursor=cursor)
+    assert query("SELECT COUNT(*) FROM jobs")[0][0] == jobs_before
+    connection.rollback()
+    cursor.close()
+    connection.close()
+
+    assert query("SELECT COUNT(*) FROM loans WHERE lender_id = %s", (lender_id,))[0][0] == 0
+    assert query("SELECT COUNT(*) FROM jobs")[0][0] == jobs_before
+
+
+def test_failed_loan_write_rolls_back_and_frees_its_connection(client, make_user, monkeypatch):
+    lender_id, headers = make_user()
+    borrower_id, _ = make_user()
+    loan_id = create_loan(client, headers, borrower_id).json()["loan_id"]
+    jobs_before = query("SELECT COUNT(*) FROM jobs")[0][0]
+    in_use = db_pool.stats()["in_use"]
+
+    def failing(*args, **kwargs):
+        raise RuntimeError("fallo dentro de la transacción")
+
+    monkeypatch.setattr(loan_controller, "create_loan_notifications", failing)
+    monkeypatch.setattr(loan_controller, "enqueue_notifications", failing)
+    assert create_loan(client, headers, borrower_id).status_code == 400
+    assert client.post(f"/loans/{loan_id}/return", headers=headers).status_code == 400
+
+    # Nada a medias y la conexión devuelta: la siguiente escritura no espera al bloqueo
+    assert db_pool.stats()["in_use"] == in_use
+    assert query("SELECT COUNT(*) FROM loans WHERE lender_id = %s", (lender_id,)) == [(1,)]
+    assert query("SELECT status FROM loans WHERE id = %s", (loan_id,)) == [("active",)]
+    assert query("SELECT COUNT(*) FROM jobs")[0][0] == jobs_before
+    monkeypatch.undo()
+    started = time.monotonic()
+    assert create_loan(client, headers, borrower_id).status_code == 200
+    assert time.monotonic() - started < 1.0
+
+
+def test_failed_batch_is_retried_not_dropped(client, make_user, monkeypatch):
+    lender_id, headers = make_user()
+    borrower_id, _ = make_user()
+    loan_id = create_loan(client, headers, borrower_id).json()["loan_id"]
+
+    original = notification_controller.insert_notifications
+
+    def outage(cursor, notifications):
+        raise Error(msg="Lost connection to MySQL server during query", errno=2013)
+
+    monkeypatch.setattr(notification_controller, "insert_notifications", outage)
+    assert run_jobs() == 1
+    assert loan_notifications(loan_id) == []
+    ((status, attempts, last_error),) = query(
+        "SELECT status, attempts, last_error FROM jobs WHERE task = %s ORDER BY id DESC LIMIT 1", (NOTIFICATION_TASK,),
+    )
+    assert (status, attempts) == ("pending", 1)
+    assert "Lost connection" in last_error
+
+    # Vuelta de la base de datos: el reintento (adelantado) escribe el lote una sola vez
+    monkeypatch.setattr(notification_controller, "insert_notifications", original)
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute("UPDATE jobs SET run_at = 0 WHERE task = %s AND status = 'pending'", (NOTIFICATION_TASK,))
+    connection.commit()
+    cursor.close()
+    connection.close()
+
+    assert run_jobs() == 1
+    assert len(loan_notifications(loan_id)) == 2
+    assert run_jobs() == 0
+    assert len(loan_notifications(loan_id)) == 2
+
+
+def test_only_rows_that_no_longer_fit_are_dropped(make_user):
+    user_id, _ = make_user()
+    valid = NotificationCreate(user_id=user_id, title="Válida", message="Se escribe", type=NotificationType.INFO)
+    orphan = NotificationCreate(user_id=10 ** 9, title="Huérfana", message="Usuario borrado", type=NotificationType.INFO)
+
+    write_notification_batch([valid, orphan])
+
+    assert query("SELECT title FROM notifications WHERE user_id = %s", (user_id,)) == [("Válida",)]
+    assert query("SELECT COUNT(*) FROM notifications WHERE user_id = %s", (10 ** 9,))[0][0] == 0
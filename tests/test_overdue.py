@@ -0,0 +1,68 @@
+from datetime import date, timedelta
+
+from controllers.loan_controller import get_overdue_loans, mark_overdue_loans
+from lib.mysql_db import get_db_connection
+
+
+def create_past_due_loan(client, headers, borrower_id: int) -> int:
+    response = client.post("/loans/", json={
+        "borrower_id": borrower_id,
+        "loan_type": "money",
+        "amount": 10,
+        "loan_date": str(date.today()),
+        "due_date": str(date.today() + timedelta(days=7)),
+    }, headers=headers)
+    assert response.status_code == 200, response.text
+    loan_id = response.json()["loan_id"]
+
+    # La API no acepta vencimientos pasados: se adelanta la fecha directamente
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute("UPDATE loans SET due_date = %s WHERE id = %s", (date.today() - timedelta(days=2), loan_id))
+    connection.commit()
+    cursor.close()
+    connection.close()
+    return loan_id
+
+
+def loan_status(loan_id: int) -> str:
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute("SELECT status FROM loans WHERE id = %s", (loan_id,))
+    (status,) = cursor.fetchone()
+    cursor.close()
+    connection.close()
+    return status
+
+
+def overdue_notifications(borrower_id: int, loan_id: int) -> int:
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute(
+        "SELECT COUNT(*) FROM notifications WHERE user_id = %s AND loan_id = %s AND title = %s",
+        (borrower_id, loan_id, "Préstamo vencido"),
+    )
+    (count,) = cursor.fetchone()
+    cursor.close()
+    connection.close()
+    return count
+
+
+def test_listing_overdue_loans_leaves_the_transition_to_the_job(client, make_user):
+    lender_id, headers = make_user()
+    borrower_id, borrower_headers = make_user()
+    loan_id = create_past_due_loan(client, headers, borrower_id)
+
+    # Consultar (como prestamista y como prestatario) no cambia el estado
+    assert [loan["id"] for loan in client.get("/loans/overdue", headers=headers).json()] == [loan_id]
+    assert [loan["id"] for loan in client.get("/loans/overdue", headers=borrower_headers).json()] == [loan_id]
+    assert loan_status(loan_id) == "active"
+
+    assert mark_overdue_loans()["success"]
+    assert loan_status(loan_id) == "overdue"
+    assert overdue_notifications(borrower_id, loan_id) == 1
+
+    # Ya marcado, sigue en la lista
+    assert [loan.id for loan in get_overdue_loans(lender_id)] == [loan_id]
+    assert mark_overdue_loans()["updated"] == 0
+    assert overdue_notifications(borrower_id, loan_id) == 1
@@ -0,0 +1,93 @@
+import hashlib
+import uuid
+
+import pytest
+
+import controllers.auth_controller as auth_controller
+from lib.mysql_db import get_db_connection, update_password_hash
+from lib.passwords import hash_password, verify_password
+
+PASSWORD = "legacy-secret"
+LEGACY_HASH = hashlib.sha256(PASSWORD.encode()).hexdigest()
+
+
+def stored_hash(user_id: int) -> str:
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute("SELECT password_hash FROM users WHERE id = %s", (user_id,))
+    (password_hash,) = cursor.fetchone()
+    cursor.close()
+    connection.close()
+    return password_hash
+
+
+def set_hash(user_id: int, password_hash: str) -> None:
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute("UPDATE users SET password_hash = %s WHERE id = %s", (password_hash, user_id))
+    connection.commit()
+    cursor.close()
+    connection.close()
+
+
+@pytest.fixture
+def legacy_user(client):
+    """Usuario con la contraseña guardada como SHA-256 de las versiones anteriores"""
+    username = f"u{uuid.uuid4().hex[:12]}"
+    response = client.post("/auth/register", json={
+        "name": username, "username": username, "email": f"{username}@example.com", "password": PASSWORD,
+    })
+    assert response.status_code == 200, response.text
+    user_id = client.post("/auth/login", json={"username": username, "password": PASSWORD}).json()["user"]["id"]
+    set_hash(user_id, LEGACY_HASH)
+    return user_id, username
+
+
+@pytest.fixture
+def rehashes(monkeypatch):
+    """Llamadas a update_password_hash desde el login, con su resultado"""
+    calls = []
+
+    def recording(user_id, old_hash, new_hash):
+        updated = update_password_hash(user_id, old_hash, new_hash)
+        calls.append((old_hash, updated))
+        return updated
+
+    monkeypatch.setattr(auth_controller, "update_password_hash", recording)
+    return calls
+
+
+def test_legacy_hash_logs_in_and_is_rewritten_once(client, legacy_user, rehashes):
+    user_id, username = legacy_user
+
+    response = client.post("/auth/login", json={"username": username, "password": PASSWORD})
+    assert response.status_code == 200
+    rewritten = stored_hash(user_id)
+    assert rewritten.startswith("scrypt$")
+    assert verify_password(PASSWORD, rewritten)
+    assert rehashes == [(LEGACY_HASH, True)]
+
+    # Ya con scrypt y los parámetros actuales: no se vuelve a calcular ni a escribir
+    assert client.post("/auth/login", json={"username": username, "password": PASSWORD}).status_code == 200
+    assert stored_hash(user_id) == rewritten
+    assert rehashes == [(LEGACY_HASH, True)]
+
+
+def test_concurrent_rehash_writes_only_the_first(legacy_user):
+    user_id, _ = legacy_user
+    first, second = hash_password(PASSWORD), hash_password(PASSWORD)
+
+    # Dos logins que leyeron el mismo hash heredado: solo el primero lo sustituye
+    assert update_password_hash(user_id, LEGACY_HASH, first)
+    assert not update_password_hash(user_id, LEGACY_HASH, second)
+    assert stored_hash(user_id) == first
+
+
+def test_wrong_password_does_not_rehash(client, legacy_user, rehashes):
+    user_id, username = legacy_user
+
+    response = client.post("/auth/login", json={"username": username, "password": "otra-cosa"})
+
+    assert response.status_code == 401
+    assert stored_hash(user_id) == LEGACY_HASH
+    assert rehashes == []
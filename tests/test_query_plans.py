@@ -0,0 +1,32 @@
+import os
+
+import pytest
+from mysql.connector import Error
+
+from benchmarks.datagen import generate_dataset, load_bench_users
+from benchmarks.query_plans import HOT_QUERIES, analyze_tables, check_plans
+from lib.sqlite_compat import SQLiteConnection, init_sqlite_schema
+
+
+@pytest.fixture(scope="module")
+def seeded(tmp_dir):
+    connection = SQLiteConnection(os.path.join(tmp_dir, "plans.db"), error_class=Error)
+    init_sqlite_schema(connection)
+    generate_dataset(connection, scale="small", seed=42)
+    analyze_tables(connection, "sqlite")
+    yield connection
+    connection.close()
+
+
+def test_hot_queries_keep_their_plans(seeded):
+    # El usuario sintético más activo: el que más filas obliga a recorrer
+    user_id = load_bench_users(seeded)[0]["id"]
+
+    results = check_plans(seeded, user_id, "sqlite")
+
+    assert len(results) == len(HOT_QUERIES)
+    regressions = {
+        result["name"]: result["problems"] + result["plan"]
+        for result in results if not result["ok"]
+    }
+    assert regressions == {}
@@ -0,0 +1,106 @@
+import os
+from datetime import date, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from mysql.connector import Error
+
+import lib.db_router as db_router
+import lib.mysql_db as mysql_db
+from lib.db_router import READ_YOUR_WRITES_COOKIE, ReadYourWritesMiddleware, Replica, ReplicaRouter
+from lib.sqlite_compat import SQLiteConnection, init_sqlite_schema
+
+
+class AppInstance:
+    """Una instancia de la app en proceso: mismo código y base de datos, memoria de worker propia
+
+    Cada instancia lleva su tabla de escritores recientes, como dos workers o dos
+    máquinas, y el middleware que se activa con DB_REPLICAS.
+    """
+
+    def __init__(self, app):
+        self.app = ReadYourWritesMiddleware(app)
+        self.recent_writers = {}
+
+    async def __call__(self, scope, receive, send):
+        previous = db_router._recent_writers
+        db_router._recent_writers = self.recent_writers
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            db_router._recent_writers = previous
+
+
+@pytest.fixture
+def replica(tmp_dir, monkeypatch):
+    """Réplica independiente (sin replicación): solo tiene lo que se escriba en ella"""
+    path = os.path.join(tmp_dir, "replica.db")
+    connection = SQLiteConnection(path, error_class=Error)
+    init_sqlite_schema(connection)
+    connection.close()
+    router = ReplicaRouter([Replica(path, mysql_db.replica_pool(path), mysql_db.measure_replica_lag)])
+    monkeypatch.setattr(mysql_db, "replica_router", router)
+    yield router
+    router.close_idle()
+
+
+@pytest.fixture
+def instances(client, replica):
+    # `client` arranca la app una vez; las instancias comparten su base de datos primaria
+    from app import app
+
+    return TestClient(AppInstance(app)), TestClient(AppInstance(app))
+
+
+def my_loan_ids(instance: TestClient, headers, cookie=None):
+    if cookie is not None:
+        headers = {**headers, "Cookie": f"{READ_YOUR_WRITES_COOKIE}={cookie}"}
+    response = instance.get("/loans/my-loans", headers=headers)
+    assert response.status_code == 200, response.text
+    return [loan["id"] for loan in response.json()]
+
+
+def test_read_your_writes_across_instances(instances, make_user):
+    first, second = instances
+    lender_id, headers = make_user()
+    borrower_id, _ = make_user()
+
+    created = first.post("/loans/", headers=headers, json={
+        "borrower_id": borrower_id,
+        "loan_type": "object",
+        "object_name": "Taladro",
+        "loan_date": str(date.today()),
+        "due_date": str(date.today() + timedelta(days=7)),
+    })
+    assert created.status_code == 200, created.text
+    loan_id = created.json()["loan_id"]
+    cookie = created.cookies.get(READ_YOUR_WRITES_COOKIE)
+    assert cookie is not None
+    # La cookie se envía a mano para ver qué aporta cada mecanismo
+    first.cookies.clear()
+
+    # La instancia que escribió recuerda al usuario y lee del primario
+    assert my_loan_ids(first, headers) == [loan_id]
+    # La otra instancia no sabe nada de esa escritura: sin la cookie lee de la réplica
+    assert my_loan_ids(second, headers) == []
+    # Con la cookie que trae el cliente, también lee del primario
+    assert my_loan_ids(second, headers, cookie) == [loan_id]
+
+
+def test_expired_window_reads_from_replica(instances, make_user):
+    _, second = instances
+    lender_id, headers = make_user()
+    borrower_id, _ = make_user()
+    created = second.post("/loans/", headers=headers, json={
+        "borrower_id": borrower_id,
+        "loan_type": "money",
+        "amount": 20,
+        "loan_date": str(date.today()),
+        "due_date": str(date.today() + timedelta(days=7)),
+    })
+    assert created.status_code == 200, created.text
+    second.cookies.clear()
+    second.app.recent_writers.clear()
+
+    expired = f"{float(created.cookies.get(READ_YOUR_WRITES_COOKIE)) - db_router.READ_YOUR_WRITES_SECONDS - 1:.3f}"
+    assert my_loan_ids(second, headers, expired) == []
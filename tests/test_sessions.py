@@ -0,0 +1,75 @@
+import json
+
+from lib.mysql_db import get_db_connection
+from lib.sessions import RevocationList, _b64, _unb64, decode_session_token, issue_session_token
+
+
+def token_of(headers) -> str:
+    return headers["Authorization"].split(" ", 1)[1]
+
+
+def test_tampered_signature_is_rejected(client, make_user):
+    user_id, headers = make_user()
+    other_id, _ = make_user()
+    payload, _, signature = token_of(headers).partition(".")
+
+    # Mismo payload con otro usuario y la firma original
+    claims = json.loads(_unb64(payload))
+    claims["sub"] = other_id
+    forged = f"{_b64(json.dumps(claims, separators=(',', ':')).encode('utf-8'))}.{signature}"
+    response = client.get("/auth/session", headers={"Authorization": f"Bearer {forged}"})
+    assert response.status_code == 401
+
+    altered = signature[:-1] + ("A" if signature[-1] != "A" else "B")
+    response = client.get("/auth/session", headers={"Authorization": f"Bearer {payload}.{altered}"})
+    assert response.status_code == 401
+    assert client.get("/auth/session", headers=headers).json()["user"]["id"] == user_id
+
+
+def test_expired_token_is_rejected(client, make_user):
+    user_id, _ = make_user()
+    expired = issue_session_token({"id": user_id, "name": "x", "username": "x"}, ttl=-1)["token"]
+
+    assert decode_session_token(expired) is None
+    response = client.get("/auth/session", headers={"Authorization": f"Bearer {expired}"})
+    assert response.status_code == 401
+
+
+def test_logout_revokes_the_token_in_every_worker(client, make_user):
+    _, headers = make_user()
+    session = decode_session_token(token_of(headers))
+    # Otro worker: su propia copia, ya cargada antes del logout
+    other_worker = RevocationList()
+    other_worker.refresh()
+    assert not other_worker.is_revoked(session.token_id)
+
+    assert client.post("/auth/logout", headers=headers).status_code == 200
+
+    # En el worker del logout deja de valer al momento
+    assert client.get("/auth/session", headers=headers).status_code == 401
+    # Los demás lo leen de la tabla en su siguiente lectura
+    assert other_worker.refresh() >= 1
+    assert other_worker.is_revoked(session.token_id)
+    # Un worker que arranca después también lo carga
+    started_later = RevocationList()
+    started_later.refresh()
+    assert started_later.is_revoked(session.token_id)
+
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute("SELECT expires_at FROM revoked_tokens WHERE token_id = %s", (session.token_id,))
+    assert cursor.fetchall() == [(session.expires_at,)]
+    cursor.close()
+    connection.close()
+
+    # Un segundo logout con el mismo token ya no es una sesión válida
+    assert client.post("/auth/logout", headers=headers).status_code == 401
+
+
+def test_legacy_user_id_without_token_is_rejected(client, make_user):
+    user_id, headers = make_user()
+
+    assert client.get("/auth/profile", headers={"X-User-Id": str(user_id)}).status_code == 401
+    assert client.get("/auth/profile", params={"user_id": user_id}).status_code == 401
+    assert client.get("/loans/my-loans", headers={"X-User-Id": str(user_id)}).status_code == 401
+    assert client.get("/auth/profile", headers=headers).status_code == 200
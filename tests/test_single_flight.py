@@ -0,0 +1,90 @@
+import threading
+import time
+from datetime import date, timedelta
+
+import pytest
+
+import routes.loan_routes as loan_routes
+from controllers.loan_controller import get_loan_stats
+
+
+@pytest.fixture
+def slow_stats(monkeypatch):
+    """get_loan_stats que, ya calculado, espera a que se abra `gate`; `calls` cuenta las ejecuciones reales"""
+
+    class SlowStats:
+        def __init__(self):
+            self.calls = 0
+            self.lock = threading.Lock()
+            self.gate = threading.Event()
+
+        def __call__(self, user_id):
+            stats = get_loan_stats(user_id)
+            with self.lock:
+                self.calls += 1
+            self.gate.wait(5)
+            return stats
+
+        def wait_for_calls(self, calls):
+            deadline = time.monotonic() + 5
+            while self.calls < calls and time.monotonic() < deadline:
+                time.sleep(0.01)
+            return self.calls
+
+    stats = SlowStats()
+    monkeypatch.setattr(loan_routes, "get_loan_stats", stats)
+    yield stats
+    stats.gate.set()
+
+
+def read_stats_in_background(client, headers, responses):
+    thread = threading.Thread(target=lambda: responses.append(client.get("/loans/stats", headers=headers)))
+    thread.start()
+    return thread
+
+
+def test_identical_concurrent_stats_reads_run_the_controller_once(client, make_user, slow_stats):
+    _, headers = make_user()
+    responses = []
+    threads = [read_stats_in_background(client, headers, responses)]
+    assert slow_stats.wait_for_calls(1) == 1
+    threads += [read_stats_in_background(client, headers, responses) for _ in range(4)]
+    # Las cuatro llegan mientras la primera sigue en marcha
+    time.sleep(0.2)
+
+    slow_stats.gate.set()
+    for thread in threads:
+        thread.join()
+
+    assert slow_stats.calls == 1
+    assert [response.status_code for response in responses] == [200] * 5
+    assert len({response.text for response in responses}) == 1
+
+
+def test_read_after_a_write_does_not_join_the_earlier_flight(client, make_user, slow_stats):
+    _, headers = make_user()
+    borrower_id, _ = make_user()
+    responses = []
+    before = read_stats_in_background(client, headers, responses)
+    assert slow_stats.wait_for_calls(1) == 1
+
+    # El usuario escribe mientras la primera lectura sigue en marcha
+    created = client.post("/loans/", json={
+        "borrower_id": borrower_id,
+        "loan_type": "money",
+        "amount": 10,
+        "loan_date": str(date.today()),
+        "due_date": str(date.today() + timedelta(days=7)),
+    }, headers=headers)
+    assert created.status_code == 200, created.text
+
+    after = read_stats_in_background(client, headers, responses)
+    # Con la primera aún retenida, la nueva ejecuta su propia consulta
+    assert slow_stats.wait_for_calls(2) == 2
+
+    slow_stats.gate.set()
+    before.join()
+    after.join()
+    assert [response.status_code for response in responses] == [200, 200]
+    # Solo la lectura posterior ve el préstamo nuevo
+    assert sorted(response.json()["total_active_loans"] for response in responses) == [0, 1]
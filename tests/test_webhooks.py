@@ -0,0 +1,230 @@
+import json
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import controllers.webhook_controller as webhook_controller
+import lib.webhooks as webhooks
+from controllers.webhook_controller import dispatch_webhooks
+from lib.mysql_db import get_db_connection
+from lib.webhooks import DELIVERY_HEADER, SIGNATURE_HEADER, TIMESTAMP_HEADER, WebhookSender, sign_payload
+
+
+class Receiver:
+    """Destino de webhooks en un puerto local; responde según `script` y guarda lo recibido"""
+
+    def __init__(self):
+        self.requests = []
+        self.script = []
+        self.default = 200
+        self.delay = 0.0
+        self.lock = threading.Lock()
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                with receiver.lock:
+                    receiver.requests.append((dict(self.headers), body))
+                    action = receiver.script.pop(0) if receiver.script else receiver.default
+                if action == "timeout":
+                    time.sleep(1.0)
+                    action = 200
+                elif receiver.delay:
+                    time.sleep(receiver.delay)
+                try:
+                    self.send_response(action)
+                    self.end_headers()
+                except OSError:
+                    # El emisor ya cortó por tiempo
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/hook"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def bodies(self):
+        with self.lock:
+            return [json.loads(body) for _, body in self.requests]
+
+
+@pytest.fixture
+def receiver(monkeypatch):
+    # El destino está en 127.0.0.1: solo se admite con WEBHOOK_ALLOW_PRIVATE
+    monkeypatch.setattr(webhooks, "WEBHOOK_ALLOW_PRIVATE", True)
+    receiver = Receiver()
+    receiver.thread.start()
+    yield receiver
+    receiver.server.shutdown()
+    receiver.server.server_close()
+
+
+@pytest.fixture
+def subscribe(client, receiver):
+    """Suscribe un usuario nuevo al receptor; al terminar se borra con sus envíos pendientes"""
+    created = []
+
+    def create(make_user):
+        user_id, headers = make_user()
+        response = client.post("/webhooks/", json={"url": receiver.url}, headers=headers)
+        assert response.status_code == 200, response.text
+        created.append((response.json()["id"], headers))
+        return user_id, headers, response.json()["secret"]
+
+    yield create
+    for subscription_id, headers in created:
+        client.delete(f"/webhooks/{subscription_id}", headers=headers)
+
+
+def create_loan(client, headers, borrower_id: int) -> int:
+    response = client.post("/loans/", json={
+        "borrower_id": borrower_id,
+        "loan_type": "money",
+        "amount": 25,
+        "loan_date": str(date.today()),
+        "due_date": str(date.today() + timedelta(days=7)),
+    }, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["loan_id"]
+
+
+def delivery_rows(user_id: int):
+    connection = get_db_connection()
+    cursor = connection.cursor(dictionary=True)
+    cursor.execute("""
+        SELECT d.id, d.status, d.attempts, d.last_status, d.last_error, d.next_attempt_at
+        FROM webhook_deliveries d JOIN webhook_subscriptions s ON s.id = d.subscription_id
+        WHERE s.user_id = %s ORDER BY d.id
+    """, (user_id,))
+    rows = cursor.fetchall()
+    cursor.close()
+    connection.close()
+    return rows
+
+
+def test_delivery_is_signed_with_the_subscription_secret(client, make_user, receiver, subscribe):
+    user_id, headers, secret = subscribe(make_user)
+    borrower_id, _ = make_user()
+    loan_id = create_loan(client, headers, borrower_id)
+
+    counts = dispatch_webhooks(2.0, WebhookSender(timeout=1.0))
+
+    assert counts["delivered"] >= 1
+    ((request_headers, body),) = receiver.requests
+    assert request_headers[SIGNATURE_HEADER] == sign_payload(secret, request_headers[TIMESTAMP_HEADER], body)
+    assert request_headers[SIGNATURE_HEADER] != sign_payload("otro-secreto", request_headers[TIMESTAMP_HEADER], body)
+    payload = json.loads(body)
+    assert str(payload["delivery_id"]) == request_headers[DELIVERY_HEADER]
+    assert [(event["type"], event["data"]["id"]) for event in payload["events"]] == [("loan.created", loan_id)]
+    assert [row["status"] for row in delivery_rows(user_id)] == ["delivered"]
+
+
+def test_failed_sends_are_retried_with_backoff(client, make_user, receiver, subscribe, monkeypatch):
+    # Espera determinista para poder comprobarla: 0.3 s, 0.6 s, ...
+    attempts_seen = []
+
+    def retry_delay(attempts):
+        attempts_seen.append(attempts)
+        return 0.3 * 2 ** (attempts - 1)
+
+    monkeypatch.setattr(webhook_controller, "retry_delay", retry_delay)
+    sender = WebhookSender(timeout=0.3)
+    receiver.script = [500, "timeout"]
+
+    user_id, headers, _ = subscribe(make_user)
+    borrower_id, _ = make_user()
+    create_loan(client, headers, borrower_id)
+
+    # 1) 5xx: se reprograma con espera, sin reenviar antes de tiempo
+    started = time.time()
+    dispatch_webhooks(1.0, sender)
+    (row,) = delivery_rows(user_id)
+    assert (row["status"], row["attempts"], row["last_status"]) == ("pending", 1, 500)
+    assert row["next_attempt_at"] >= started + 0.3
+    dispatch_webhooks(0.1, sender)
+    assert len(receiver.requests) == 1
+
+    # 2) Sin respuesta a tiempo: otro reintento con el doble de espera
+    time.sleep(max(0.0, row["next_attempt_at"] - time.time()) + 0.05)
+    before_timeout = time.time()
+    dispatch_webhooks(1.0, sender)
+    (row,) = delivery_rows(user_id)
+    assert (row["status"], row["attempts"], row["last_status"]) == ("pending", 2, None)
+    assert "Timeout" in row["last_error"]
+    assert row["next_attempt_at"] >= before_timeout + 0.6
+
+    # 3) El tercer intento llega
+    time.sleep(max(0.0, row["next_attempt_at"] - time.time()) + 0.05)
+    dispatch_webhooks(1.0, sender)
+    (row,) = delivery_rows(user_id)
+    assert (row["status"], row["attempts"], row["last_status"]) == ("delivered", 3, 200)
+
+    assert attempts_seen == [1, 2]
+    bodies = receiver.bodies()
+    assert [body["attempt"] for body in bodies] == [1, 2, 3]
+    assert len({body["delivery_id"] for body in bodies}) == 1
+
+
+def test_delivery_is_dead_lettered_after_max_attempts(client, make_user, receiver, subscribe, monkeypatch):
+    monkeypatch.setattr(webhook_controller, "WEBHOOK_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(webhook_controller, "retry_delay", lambda attempts: 0.0)
+    receiver.default = 503
+
+    user_id, headers, _ = subscribe(make_user)
+    borrower_id, _ = make_user()
+    create_loan(client, headers, borrower_id)
+
+    dispatch_webhooks(2.0, WebhookSender(timeout=1.0))
+    dispatch_webhooks(0.2, WebhookSender(timeout=1.0))
+
+    assert len(receiver.requests) == 3
+    (row,) = delivery_rows(user_id)
+    assert (row["status"], row["attempts"], row["last_status"]) == ("dead", 3, 503)
+    dead_letters = client.get("/webhooks/dead-letters", headers=headers).json()
+    assert [(letter["id"], letter["attempts"], letter["last_status"]) for letter in dead_letters] == [(row["id"], 3, 503)]
+
+
+def test_two_dispatchers_never_deliver_the_same_event_twice(client, make_user, receiver, subscribe, monkeypatch):
+    # Un evento por envío y reservas pequeñas: los dos dispatchers se reparten muchos lotes
+    monkeypatch.setattr(webhook_controller, "WEBHOOK_BATCH_SIZE", 1)
+    claim_deliveries = webhook_controller.claim_deliveries
+    monkeypatch.setattr(webhook_controller, "claim_deliveries", lambda: claim_deliveries(3))
+    receiver.delay = 0.01
+
+    user_id, headers, _ = subscribe(make_user)
+    borrower_id, _ = make_user()
+    loan_ids = [create_loan(client, headers, borrower_id) for _ in range(30)]
+
+    barrier = threading.Barrier(2)
+    errors = []
+
+    def run_dispatcher():
+        try:
+            barrier.wait()
+            dispatch_webhooks(5.0, WebhookSender(timeout=2.0))
+        except Exception as e:  # pragma: no cover - se comprueba abajo
+            errors.append(e)
+
+    dispatchers = [threading.Thread(target=run_dispatcher) for _ in range(2)]
+    for dispatcher in dispatchers:
+        dispatcher.start()
+    for dispatcher in dispatchers:
+        dispatcher.join()
+
+    assert errors == []
+    bodies = receiver.bodies()
+    delivery_ids = Counter(body["delivery_id"] for body in bodies)
+    event_loans = Counter(event["data"]["id"] for body in bodies for event in body["events"])
+    assert max(delivery_ids.values()) == 1
+    assert event_loans == Counter(loan_ids)
+    rows = delivery_rows(user_id)
+    assert len(rows) == len(loan_ids)
+    assert {row["status"] for row in rows} == {"delivered"}